@@ -0,0 +1,169 @@
+import argparse
+import getpass
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import fixtures, results
+from benchmarks.drivers import DRIVERS, available
+from benchmarks.scenarios import SCENARIOS, WARM_UP
+
+# baseline results are compared against, unless given another
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure the throughput and latency of the filesystem endpoints.",
+    )
+    parser.add_argument("--driver", choices=[*DRIVERS, "all"], default="all")
+    parser.add_argument("--scale", choices=fixtures.SCALES, default="small")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=[scenario.name for scenario in SCENARIOS],
+        help="scenario to run, all of them if not given",
+    )
+    parser.add_argument(
+        "--backend",
+        default="local",
+        help="filesystem backend, where fsuid requires CAP_SETUID and CAP_SETGID",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="runs of each scenario, whose median measures are reported",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="requests sent at a time"
+    )
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="relative change of a measure beyond which it is a regression",
+    )
+    return parser.parse_args(args)
+
+
+def run(driver, scenario, scale, root, concurrency):
+    """Send the requests of a scenario, ``concurrency`` at a time, on
+    the tree as generated."""
+    fixtures.reset(root, scale)
+    url = f"/filesystem{root}"
+    count = scenario.count(scale)
+    body = scenario.body(scale) if scenario.body else None
+    credentials = b64encode(f"{getpass.getuser()}:benchmarks".encode()).decode()
+    headers = {**scenario.headers, "Authorization": f"Basic {credentials}"}
+    sessions = threading.local()
+    latencies, transferred, errors = [], [], []
+
+    def send(i):
+        if not hasattr(sessions, "request"):
+            sessions.request = driver.session()
+        start = time.perf_counter()
+        status, size = sessions.request(
+            scenario.method,
+            f"{url}/{scenario.path(i)}",
+            headers,
+            body,
+            read_delay=scenario.read_delay,
+        )
+        latencies.append(time.perf_counter() - start)
+        transferred.append(size + len(body or b""))
+        if status != scenario.status:
+            errors.append(status)
+
+    results.reset_peak_rss(driver.pids())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(count)))
+    elapsed = time.perf_counter() - start
+    rss = results.peak_rss(driver.pids())
+    return results.measure(latencies, elapsed, sum(transferred), len(errors), rss)
+
+
+def report(measured, changes):
+    columns = ("req_s", "p50_ms", "p99_ms", "mib_s", "peak_rss_mib", "errors")
+    print(f"{'driver':<10}{'scenario':<16}" + "".join(f"{c:>14}" for c in columns))
+    for driver, scenarios in measured.items():
+        for scenario, measures in scenarios.items():
+            line = f"{driver:<10}{scenario:<16}"
+            for name in columns:
+                cell = str(measures[name])
+                if (driver, scenario, name) in changes:
+                    change, regression = changes[driver, scenario, name]
+                    cell = f"{cell} {change:+.0%}{'!' if regression else ''}"
+                line += f"{cell:>14}"
+            print(line)
+
+
+def main(args=None):
+    args = parse_args(args)
+    scale = fixtures.SCALES[args.scale]
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    if args.driver == "all":
+        drivers = [name for name, driver in DRIVERS.items() if available(driver)]
+        for name in DRIVERS:
+            if name not in drivers:
+                print(f"skipped the {name} driver, missing its dependencies")
+    else:
+        drivers = [args.driver]
+
+    root = tempfile.mkdtemp(prefix="filexplorer-benchmarks-", dir="/tmp")
+    measured = {}
+    try:
+        start = time.perf_counter()
+        fixtures.generate(root, scale)
+        print(f"generated fixtures in {time.perf_counter() - start:.1f}s", flush=True)
+        for name in drivers:
+            driver = DRIVERS[name](root, backend=args.backend, workers=args.workers)
+            driver.start()
+            try:
+                run(driver, WARM_UP, scale, root, args.concurrency)
+                measured[name] = {
+                    scenario.name: results.median(
+                        [
+                            run(driver, scenario, scale, root, args.concurrency)
+                            for _ in range(args.runs)
+                        ]
+                    )
+                    for scenario in scenarios
+                }
+            finally:
+                driver.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    baseline = results.load(args.baseline).get(args.scale, {})
+    changes = results.compare(measured, baseline, tolerance=args.tolerance)
+    report(measured, changes)
+
+    if args.save:
+        stored = results.load(args.baseline)
+        stored[args.scale] = {**stored.get(args.scale, {}), **measured}
+        results.save(args.baseline, stored)
+        return 0
+    failed = any(
+        measures["errors"]
+        for scenarios in measured.values()
+        for measures in scenarios.values()
+    )
+    regressed = any(regression for _, regression in changes.values())
+    return 1 if failed or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
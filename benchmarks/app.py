@@ -0,0 +1,39 @@
+import os
+
+from src.api import backends
+from src.api.auth import AuthAPI
+from src.app import create_app as create_base_app
+from src.asgi import ASGIApp
+
+__all__ = ("create_app", "create_asgi_app")
+
+
+def create_app(root, backend="local", configs=None):
+    """Create the app serving the fixture tree in given root, accepting any
+    credentials. Listings are not cached, so that they are measured. The
+    local backend, which runs operations with the credentials of the server
+    process, is selectable here only, as it needs no privileges."""
+    AuthAPI.authenticate = classmethod(lambda cls, username, password: True)
+    backends.BACKENDS.setdefault("local", backends.LocalBackend)
+    return create_base_app(
+        config_name="testing",
+        dotenv=False,
+        configs={
+            "SUPPORTED_PATHS": [root],
+            "SECRET_KEY": "benchmarks",
+            "FILESYSTEM_BACKEND": backend,
+            "LISTING_CACHE_SIZE": 0,
+            "SLOW_REQUEST_THRESHOLD": 0,
+            **(configs or {}),
+        },
+    )
+
+
+def create_asgi_app(root=None, backend=None, configs=None):
+    """Create the same app served over ASGI. Its root and backend default to
+    the ``BENCHMARKS_ROOT`` and ``BENCHMARKS_BACKEND`` environment variables,
+    for servers creating it with no arguments."""
+    root = root or os.environ["BENCHMARKS_ROOT"]
+    backend = backend or os.environ.get("BENCHMARKS_BACKEND", "local")
+    app = create_app(root, backend=backend, configs=configs)
+    return ASGIApp(app, threads=app.config["ASGI_THREADS"])
@@ -0,0 +1,212 @@
+import http.client
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.app import create_app
+
+__all__ = ("FlaskDriver", "GunicornDriver", "ASGIDriver", "DRIVERS", "available")
+
+# size of the chunks responses are read in, and in by slow clients, whose
+# receive buffer is that small too, not to take in whole responses
+READ_SIZE = 1024 * 1024
+SLOW_READ_SIZE = 64 * 1024
+
+# directory of the project, where servers are started from
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FlaskDriver:
+    """Send requests to the app in this process, through the test client."""
+
+    name = "flask"
+
+    # modules the driver depends on, beyond those of the app
+    requires = ()
+
+    def __init__(self, root, backend="local", workers=1):
+        self.app = create_app(root, backend=backend)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def pids(self):
+        return [os.getpid()]
+
+    def session(self):
+        client = self.app.test_client()
+
+        def request(method, path, headers, body=None, read_delay=0):
+            response = client.open(
+                path, method=method, headers=headers, data=body, buffered=False
+            )
+            size = 0
+            try:
+                for chunk in response.iter_encoded():
+                    size += len(chunk)
+                    time.sleep(read_delay)
+            finally:
+                response.close()
+            return response.status_code, size
+
+        return request
+
+
+class GunicornDriver:
+    """Send requests over HTTP to the app served by a local gunicorn."""
+
+    name = "gunicorn"
+
+    requires = ("gunicorn",)
+
+    def __init__(self, root, backend="local", workers=4):
+        self.root = root
+        self.backend = backend
+        self.workers = workers
+        self.port = free_port()
+        self.process = None
+
+    def command(self):
+        app = f"benchmarks.app:create_app({self.root!r}, {self.backend!r})"
+        return [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            f"--bind=127.0.0.1:{self.port}",
+            f"--workers={self.workers}",
+            "--timeout=600",
+            "--log-level=warning",
+            app,
+        ]
+
+    def ready(self):
+        """Whether the master process forked its workers."""
+        return len(self.pids()) > self.workers
+
+    def start(self, env=None):
+        self.process = subprocess.Popen(self.command(), cwd=PROJECT_DIR, env=env)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited on start")
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+            except OSError:
+                time.sleep(0.1)
+                continue
+            if self.ready():
+                return
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"{self.name} did not start in time")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def pids(self):
+        """The master process and its workers."""
+        return [self.process.pid, *children(self.process.pid)]
+
+    def session(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=600)
+
+        def request(method, path, headers, body=None, read_delay=0):
+            if read_delay and connection.sock is None:
+                connection.sock = slow_connection(self.port)
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            size = 0
+            read_size = SLOW_READ_SIZE if read_delay else READ_SIZE
+            for chunk in iter(lambda: response.read(read_size), b""):
+                size += len(chunk)
+                time.sleep(read_delay)
+            return response.status, size
+
+        return request
+
+
+class ASGIDriver(GunicornDriver):
+    """Send requests over HTTP to the app served over ASGI by a local uvicorn,
+    each of its worker processes running the app in a pool of threads."""
+
+    name = "asgi"
+
+    requires = ("uvicorn",)
+
+    def command(self):
+        return [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "--factory",
+            "--host=127.0.0.1",
+            f"--port={self.port}",
+            f"--workers={self.workers}",
+            "--log-level=warning",
+            "benchmarks.app:create_asgi_app",
+        ]
+
+    def ready(self):
+        # a single worker is the process itself
+        return self.workers == 1 or len(self.pids()) > self.workers
+
+    def start(self, env=None):
+        # the app is created with no arguments
+        super().start(
+            env={
+                **os.environ,
+                **(env or {}),
+                "BENCHMARKS_ROOT": self.root,
+                "BENCHMARKS_BACKEND": self.backend,
+            }
+        )
+
+
+DRIVERS = {driver.name: driver for driver in (FlaskDriver, GunicornDriver, ASGIDriver)}
+
+
+def available(driver):
+    """Whether the modules a driver depends on are installed."""
+    return all(importlib.util.find_spec(module) for module in driver.requires)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def slow_connection(port):
+    """Socket connected to given local port with a small receive buffer, set
+    before connecting for the window not to grow past it."""
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_READ_SIZE)
+    sock.settimeout(600)
+    sock.connect(("127.0.0.1", port))
+    return sock
+
+
+def children(pid):
+    """Ids of the processes whose parent is the given one."""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the name of the command may hold spaces, unlike what follows
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(entry))
+    return pids
@@ -0,0 +1,103 @@
+import os
+import shutil
+from dataclasses import dataclass
+
+__all__ = ("Scale", "SCALES", "generate", "reset")
+
+
+@dataclass
+class Scale:
+    """Sizes of the fixture tree and number of requests of each scenario."""
+
+    small_dir: int
+    huge_dir: int
+    small_file: int
+    slow_file: int
+    huge_file: int
+    archive_dirs: int
+    archive_files: int
+    archive_file_size: int
+    upload_files: int
+    upload_file_size: int
+    requests: int
+    heavy_requests: int
+
+
+SCALES = {
+    "small": Scale(
+        small_dir=100,
+        huge_dir=10_000,
+        small_file=4 * 1024,
+        slow_file=8 * 1024 * 1024,
+        huge_file=256 * 1024 * 1024,
+        archive_dirs=10,
+        archive_files=100,
+        archive_file_size=16 * 1024,
+        upload_files=100,
+        upload_file_size=4 * 1024,
+        requests=200,
+        heavy_requests=3,
+    ),
+    "full": Scale(
+        small_dir=100,
+        huge_dir=200_000,
+        small_file=4 * 1024,
+        slow_file=8 * 1024 * 1024,
+        huge_file=4 * 1024 * 1024 * 1024,
+        archive_dirs=20,
+        archive_files=1000,
+        archive_file_size=64 * 1024,
+        upload_files=1000,
+        upload_file_size=16 * 1024,
+        requests=1000,
+        heavy_requests=5,
+    ),
+}
+
+# content of generated files, the same on every run
+PATTERN = bytes(range(256)) * 256
+
+
+def generate(root, scale):
+    """Generate the fixture tree under given directory:
+
+    - ``small/`` and ``huge/``, directories to list
+    - ``small.bin``, ``slow.bin`` and ``huge.bin``, files to download, the
+      last one sparse
+    - ``tree/``, a directory to archive
+    - ``uploads/<i>/``, empty directories to upload files to, one per request
+    - ``deletes/<i>``, files to delete, one per request
+    """
+    for name, count in (("small", scale.small_dir), ("huge", scale.huge_dir)):
+        os.mkdir(os.path.join(root, name))
+        for i in range(count):
+            write(os.path.join(root, name, f"file{i:07d}.txt"), 0)
+
+    write(os.path.join(root, "small.bin"), scale.small_file)
+    write(os.path.join(root, "slow.bin"), scale.slow_file)
+    with open(os.path.join(root, "huge.bin"), "wb") as f:
+        f.truncate(scale.huge_file)
+
+    for i in range(scale.archive_dirs):
+        directory = os.path.join(root, "tree", f"dir{i:03d}")
+        os.makedirs(directory)
+        for j in range(scale.archive_files):
+            write(os.path.join(directory, f"file{j:05d}.bin"), scale.archive_file_size)
+
+    reset(root, scale)
+
+
+def reset(root, scale):
+    """Restore the directories of the tree that requests change."""
+    for name in ("uploads", "deletes"):
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        os.mkdir(os.path.join(root, name))
+    for i in range(scale.requests):
+        os.mkdir(os.path.join(root, "uploads", str(i)))
+        write(os.path.join(root, "deletes", str(i)), scale.small_file)
+
+
+def write(path, size):
+    with open(path, "wb") as f:
+        for offset in range(0, size, len(PATTERN)):
+            f.write(PATTERN[: size - offset])
@@ -0,0 +1,102 @@
+import contextlib
+import json
+import statistics
+
+__all__ = (
+    "measure",
+    "median",
+    "percentile",
+    "peak_rss",
+    "reset_peak_rss",
+    "compare",
+    "load",
+    "save",
+)
+
+# measures where lower is better, unlike the others
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "peak_rss_mib")
+
+# measures compared against the baseline; tail latencies vary too much
+# between runs on the same machine to be compared
+COMPARED = ("req_s", "p50_ms", "peak_rss_mib")
+
+
+def measure(latencies, elapsed, transferred, errors, rss):
+    """Summary of a run of requests, given the latency of each in seconds
+    and the bytes of their bodies sent and received."""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_s": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mib_s": round(transferred / elapsed / 2**20, 2),
+        "peak_rss_mib": round(rss / 2**20, 1),
+    }
+
+
+def median(runs):
+    """Summary of several runs of the same requests, as the median of each
+    measure, counting the errors of all of them."""
+    summary = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    summary["errors"] = sum(run["errors"] for run in runs)
+    return summary
+
+
+def percentile(values, p):
+    """Nearest-rank percentile."""
+    values = sorted(values)
+    if not values:
+        return 0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def reset_peak_rss(pids):
+    """Reset the peak resident set size of given processes, where supported."""
+    for pid in pids:
+        with contextlib.suppress(OSError), open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+
+
+def peak_rss(pids):
+    """Sum of the peak resident set sizes of given processes, in bytes."""
+    total = 0
+    for pid in pids:
+        with contextlib.suppress(OSError), open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1]) * 1024
+    return total
+
+
+def compare(results, baseline, tolerance=0.5):
+    """Relative change of each compared measure against the baseline, along
+    with whether it is a regression beyond the tolerance."""
+    changes = {}
+    for driver, scenarios in results.items():
+        for scenario, measures in scenarios.items():
+            reference = baseline.get(driver, {}).get(scenario)
+            if not reference:
+                continue
+            for name in COMPARED:
+                if not reference.get(name):
+                    continue
+                change = measures[name] / reference[name] - 1
+                worse = change if name in LOWER_IS_BETTER else -change
+                changes[driver, scenario, name] = (change, worse > tolerance)
+    return changes
+
+
+def load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+        f.write("\n")
@@ -0,0 +1,126 @@
+from dataclasses import dataclass, field
+from typing import Callable
+
+from benchmarks.fixtures import PATTERN
+
+__all__ = ("Scenario", "SCENARIOS", "WARM_UP")
+
+# boundary of the multipart bodies of uploads
+BOUNDARY = "benchmarks-boundary"
+
+
+@dataclass
+class Scenario:
+    """Requests of the same kind, the i-th one to ``path(i)``, relative to
+    the root of the fixture tree, with a body made once for the scale.
+    Responses are read with ``read_delay`` seconds between chunks, if any,
+    as slow clients do."""
+
+    name: str
+    method: str
+    path: Callable
+    count: Callable
+    status: int
+    headers: dict = field(default_factory=dict)
+    body: Callable = None
+    read_delay: float = 0
+
+
+def multipart(scale):
+    """Body uploading as many files as the scale says."""
+    content = PATTERN[: scale.upload_file_size]
+    parts = []
+    for i in range(scale.upload_files):
+        parts.append(
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="file{i}.bin"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n".encode()
+            + content
+            + b"\r\n"
+        )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+JSON = {"Accept": "application/json"}
+BINARY = {"Accept": "application/octet-stream"}
+
+SCENARIOS = [
+    Scenario(
+        name="ls-small",
+        method="GET",
+        path=lambda i: "small/",
+        count=lambda scale: scale.requests,
+        status=200,
+        headers=JSON,
+    ),
+    Scenario(
+        name="ls-huge",
+        method="GET",
+        path=lambda i: "huge/",
+        count=lambda scale: scale.heavy_requests,
+        status=200,
+        headers=JSON,
+    ),
+    Scenario(
+        name="download-small",
+        method="GET",
+        path=lambda i: "small.bin",
+        count=lambda scale: scale.requests,
+        status=200,
+        headers=BINARY,
+    ),
+    Scenario(
+        # servers holding a worker per request are bound by slow clients,
+        # which shows with a concurrency well above the number of workers
+        name="download-slow",
+        method="GET",
+        path=lambda i: "slow.bin",
+        count=lambda scale: max(1, scale.requests // 4),
+        status=200,
+        headers=BINARY,
+        read_delay=0.01,
+    ),
+    Scenario(
+        name="download-huge",
+        method="GET",
+        path=lambda i: "huge.bin",
+        count=lambda scale: scale.heavy_requests,
+        status=200,
+        headers=BINARY,
+    ),
+    Scenario(
+        name="archive",
+        method="GET",
+        path=lambda i: "tree",
+        count=lambda scale: scale.heavy_requests,
+        status=200,
+        # the same compression whatever the client
+        headers={**BINARY, "Accept-Encoding": "gzip"},
+    ),
+    Scenario(
+        name="upload-many",
+        method="POST",
+        path=lambda i: f"uploads/{i}/",
+        count=lambda scale: max(1, scale.requests // 10),
+        status=201,
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+        body=multipart,
+    ),
+    Scenario(
+        name="delete",
+        method="DELETE",
+        path=lambda i: f"deletes/{i}",
+        count=lambda scale: scale.requests,
+        status=204,
+    ),
+]
+
+# requests sent before measuring, as the first ones of each worker are slower
+WARM_UP = Scenario(
+    name="warm-up",
+    method="GET",
+    path=lambda i: "small/",
+    count=lambda scale: 50,
+    status=200,
+    headers=JSON,
+)
@@ -1,9 +1,110 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
 import pam
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from src.utils import metrics
+
+__all__ = ("AuthAPI", "AuthCache")
+
+
+class AuthCache:
+    """Bounded LRU cache of credential verifications. Credentials are only
+    kept as a salted, slow hash. Successful verifications are cached for
+    ``ttl`` seconds and failed ones for ``negative_ttl`` seconds."""
+
+    def __init__(self, ttl=300, negative_ttl=5, maxsize=1024, iterations=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.iterations = iterations
+        self.hits = 0
+        self.misses = 0
+        self._salt = os.urandom(16)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, username, password):
+        credentials = f"{username}\0{password}".encode()
+        return hashlib.pbkdf2_hmac("sha256", credentials, self._salt, self.iterations)
+
+    def get(self, key):
+        """Get a cached verification result, if not yet expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
 
-__all__ = ("AuthAPI",)
+    def set(self, key, result):
+        ttl = self.ttl if result else self.negative_ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
 
 
 class AuthAPI:
+    # verifications shared by the requests of the current process
+    cache = AuthCache()
+
+    @classmethod
+    def authenticate(cls, username, password):
+        key = cls.cache.key(username, password)
+        result = cls.cache.get(key)
+        if result is None:
+            start = time.perf_counter()
+            result = pam.authenticate(username, password)
+            duration = time.perf_counter() - start
+            metrics.auth_duration.observe(duration, "success" if result else "failure")
+            cls.cache.set(key, result)
+        return result
+
     @staticmethod
-    def authenticate(username, password):
-        return pam.authenticate(username, password)
+    def create_token(username, secret_key, ttl=900):
+        """Create a token signed with the secret key, carrying the username
+        and its expiry."""
+        payload = {"sub": username, "exp": int(time.time()) + ttl}
+        return token_serializer(secret_key).dumps(payload)
+
+    @staticmethod
+    def verify_token(token, secret_key):
+        """Get the username of a token with a valid signature and not yet
+        expired. No state is involved, so any process sharing the secret key
+        verifies the token."""
+        try:
+            payload = token_serializer(secret_key).loads(token)
+        except BadSignature:
+            return None
+        if payload.get("exp", 0) <= time.time():
+            return None
+        return payload.get("sub")
+
+
+def token_serializer(secret_key, salt="access-token"):
+    if not secret_key:
+        raise RuntimeError("missing secret key for signing tokens")
+    return URLSafeSerializer(
+        secret_key,
+        salt=salt,
+        signer_kwargs={"digest_method": hashlib.sha256},
+    )
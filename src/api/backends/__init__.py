@@ -0,0 +1,28 @@
+from src.api.backends.base import Backend, CrossDeviceLinkError
+from src.api.backends.fsuid import FsuidBackend
+from src.api.backends.helper import HelperBackend
+from src.api.backends.local import LocalBackend
+from src.api.backends.shell import ShellBackend
+
+__all__ = (
+    "Backend",
+    "CrossDeviceLinkError",
+    "FsuidBackend",
+    "HelperBackend",
+    "LocalBackend",
+    "ShellBackend",
+    "create_backend",
+)
+
+# backends selectable by configuration
+BACKENDS = {
+    "shell": ShellBackend,
+    "helper": HelperBackend,
+    "fsuid": FsuidBackend,
+}
+
+
+def create_backend(name, username=None):
+    if name not in BACKENDS:
+        raise ValueError(f"unsupported backend '{name}'")
+    return BACKENDS[name](username=username)
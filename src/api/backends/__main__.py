@@ -0,0 +1,18 @@
+"""Entry point of helper processes, see :mod:`src.api.backends.helper`."""
+import argparse
+import os
+import sys
+
+from src.api.backends.helper import serve
+
+parser = argparse.ArgumentParser(description="Serve filesystem operations.")
+parser.add_argument("--idle-timeout", type=float, default=None)
+args = parser.parse_args()
+
+try:
+    serve(sys.stdin.buffer, sys.stdout.buffer, idle_timeout=args.idle_timeout)
+except EOFError:
+    pass  # client went away
+except BrokenPipeError:
+    # client went away; avoid another error flushing stdout on exit
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
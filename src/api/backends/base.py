@@ -0,0 +1,164 @@
+import contextlib
+import errno
+import os
+import stat
+from dataclasses import dataclass
+
+from src.utils import metrics
+
+__all__ = (
+    "Backend",
+    "CrossDeviceLinkError",
+    "Entry",
+    "Stat",
+    "file_type",
+    "primed",
+    "raise_errno",
+    "translate_errors",
+)
+
+
+class CrossDeviceLinkError(OSError):
+    """Raised when linking or renaming a file across filesystems."""
+
+
+# exceptions raised for errno values
+ERRORS = {
+    errno.ENOENT: FileNotFoundError,
+    errno.EACCES: PermissionError,
+    errno.EPERM: PermissionError,
+    errno.EISDIR: IsADirectoryError,
+    errno.ENOTDIR: NotADirectoryError,
+    errno.EEXIST: FileExistsError,
+    errno.EXDEV: CrossDeviceLinkError,
+}
+
+# names of the file types reported in directory entries
+FILE_TYPES = {
+    stat.S_IFREG: "file",
+    stat.S_IFDIR: "directory",
+    stat.S_IFLNK: "symlink",
+    stat.S_IFBLK: "block-device",
+    stat.S_IFCHR: "char-device",
+    stat.S_IFIFO: "fifo",
+    stat.S_IFSOCK: "socket",
+}
+
+
+@dataclass
+class Stat:
+    """Status of a file, following symlinks."""
+
+    mode: int
+    size: int
+    ino: int
+    mtime: float
+
+
+@dataclass
+class Entry:
+    """Entry of a directory, not following symlinks. The ``mode`` holds
+    the permission bits only."""
+
+    name: str
+    type: str
+    size: int
+    mode: int
+    owner: str
+    mtime: float
+    target: str = None
+
+
+class Backend:
+    """Filesystem operations run on behalf of a given user."""
+
+    def __init__(self, username=None):
+        self.username = username
+
+    def ls(self, path) -> list:
+        """List the names of the files in given path."""
+        raise NotImplementedError
+
+    def scan(self, path) -> iter:
+        """Get an iterator over the entries of the directory in given path,
+        in no particular order. The entry of the path itself is the only
+        one given for paths other than directories."""
+        raise NotImplementedError
+
+    def stat(self, path) -> Stat:
+        """Get the status of given path, following symlinks."""
+        raise NotImplementedError
+
+    def read(self, path, offset=0, length=None) -> iter:
+        """Get an iterator over the content of a file in chunks of bytes,
+        starting at ``offset`` and limited to ``length`` bytes, if given."""
+        raise NotImplementedError
+
+    def archive(self, *paths) -> iter:
+        """Get an iterator over a tar archive of given paths in chunks of bytes,
+        each archived under its name along with its content if a directory."""
+        raise NotImplementedError
+
+    def write(self, path, file, offset=None, exists=None):
+        """Write the content of a file object to given path, replacing its
+        content or, if ``offset`` is given, over it from that offset on.
+        The file is required to exist if ``exists`` is set, or else not
+        to, as checked when opening it."""
+        raise NotImplementedError
+
+    def append(self, path, file):
+        """Append the content of a file object to the existing file in given
+        path, at its end as of each write rather than as of opening it."""
+        raise NotImplementedError
+
+    def copy(self, src, dst):
+        """Copy a regular file to a new file in given path, sharing its
+        blocks or copying them within the kernel where supported."""
+        raise NotImplementedError
+
+    def rename(self, src, dst, replace=True):
+        """Rename a file, replacing the destination file, if any, unless
+        ``replace`` is unset, in which case it must not exist."""
+        raise NotImplementedError
+
+    def delete(self, path):
+        """Delete the file in given path."""
+        raise NotImplementedError
+
+    def mkdir(self, path):
+        """Create a directory in given path."""
+        raise NotImplementedError
+
+
+def primed(chunks):
+    """Read the first chunk upfront so that errors are raised before
+    any content is sent."""
+    first = next(chunks, b"")
+
+    def generate():
+        yield first
+        yield from chunks
+
+    return generate()
+
+
+def file_type(mode):
+    return FILE_TYPES.get(stat.S_IFMT(mode), "unknown")
+
+
+def raise_errno(code):
+    err = os.strerror(code).lower()
+    error = ERRORS.get(code, Exception)
+    metrics.filesystem_errors.inc(error.__name__)
+    raise error(err)
+
+
+@contextlib.contextmanager
+def translate_errors():
+    """Raise errors carrying an errno as the builtin exception matching it."""
+    try:
+        yield
+    except OSError as ex:
+        if ex.errno is None:
+            raise
+        raise_errno(ex.errno)
@@ -0,0 +1,159 @@
+import contextlib
+import ctypes
+import functools
+import os
+import platform
+import pwd
+import threading
+import time
+
+from src.api.backends.base import translate_errors
+from src.api.backends.local import LocalBackend
+
+__all__ = ("FsuidBackend", "credentials")
+
+# numbers of the setgroups syscall; glibc's setgroups applies
+# to all the threads of the process, the syscall only to the caller
+SYS_SETGROUPS = {"x86_64": 116, "aarch64": 159}
+
+# seconds user identities are cached for
+IDENTITY_TTL = 60
+
+
+class FsuidBackend(LocalBackend):
+    """Run each operation in the calling thread after switching its filesystem
+    credentials to the ones of the user. Requires CAP_SETUID and CAP_SETGID."""
+
+    def ls(self, path):
+        with self._credentials():
+            return super().ls(path)
+
+    def scan(self, path):
+        with self._credentials():
+            return super().scan(path)
+
+    def stat(self, path):
+        with self._credentials():
+            return super().stat(path)
+
+    def read(self, path, offset=0, length=None):
+        # reading an opened file needs no credentials
+        with self._credentials():
+            return super().read(path, offset=offset, length=length)
+
+    def write(self, path, file, offset=None, exists=None):
+        with self._credentials():
+            super().write(path, file, offset=offset, exists=exists)
+
+    def append(self, path, file):
+        with self._credentials():
+            super().append(path, file)
+
+    def copy(self, src, dst):
+        with self._credentials():
+            super().copy(src, dst)
+
+    def rename(self, src, dst, replace=True):
+        with self._credentials():
+            super().rename(src, dst, replace=replace)
+
+    def delete(self, path):
+        with self._credentials():
+            super().delete(path)
+
+    def mkdir(self, path):
+        with self._credentials():
+            super().mkdir(path)
+
+    def _scan(self, entries):
+        # entries are stat'ed as they are consumed
+        return self._switched(super()._scan(entries))
+
+    def _tar(self, paths):
+        # walking directories happens as the archive is consumed
+        return self._switched(super()._tar(paths))
+
+    def _switched(self, items):
+        """Get each item of an iterator with the credentials of the user."""
+        while True:
+            with self._credentials():
+                item = next(items, None)
+            if item is None:
+                return
+            yield item
+
+    @contextlib.contextmanager
+    def _credentials(self):
+        with translate_errors():
+            if self.username:
+                with credentials(self.username):
+                    yield
+            else:
+                yield
+
+
+@contextlib.contextmanager
+def credentials(username):
+    """Switch the filesystem credentials of the calling thread to the ones
+    of the user, restoring the previous ones on exit."""
+    uid, gid, groups = identity(username)
+    # an invalid id leaves the credentials as they are, returning them
+    previous = (libc().setfsuid(-1), libc().setfsgid(-1), os.getgroups())
+    try:
+        set_groups(groups)
+        set_fsgid(gid)
+        set_fsuid(uid)
+        yield
+    finally:
+        set_fsuid(previous[0])
+        set_fsgid(previous[1])
+        set_groups(previous[2])
+
+
+def identity(username):
+    """Get the uid, gid and groups of the user, cached for a while to spare
+    the name service lookups."""
+    now = time.monotonic()
+    with _identities_lock:
+        cached = _identities.get(username)
+        if cached and cached[0] > now:
+            return cached[1]
+    try:
+        user = pwd.getpwnam(username)
+    except KeyError:
+        raise PermissionError("unknown user") from None
+    value = (user.pw_uid, user.pw_gid, os.getgrouplist(username, user.pw_gid))
+    with _identities_lock:
+        _identities[username] = (now + IDENTITY_TTL, value)
+    return value
+
+
+def set_fsuid(uid):
+    # setfsuid returns the previous fsuid, successful or not
+    libc().setfsuid(uid)
+    if libc().setfsuid(uid) != uid:
+        raise PermissionError("cannot switch user credentials")
+
+
+def set_fsgid(gid):
+    libc().setfsgid(gid)
+    if libc().setfsgid(gid) != gid:
+        raise PermissionError("cannot switch group credentials")
+
+
+def set_groups(groups):
+    number = SYS_SETGROUPS.get(platform.machine())
+    if number is None:
+        raise OSError(f"unsupported platform '{platform.machine()}'")
+    array = (ctypes.c_uint * len(groups))(*groups)
+    if libc().syscall(number, len(groups), array) != 0:
+        raise PermissionError("cannot switch group credentials")
+
+
+@functools.lru_cache(maxsize=None)
+def libc():
+    return ctypes.CDLL(None, use_errno=True)
+
+
+_identities = {}
+_identities_lock = threading.Lock()
@@ -0,0 +1,313 @@
+import collections
+import contextlib
+import dataclasses
+import errno
+import functools
+import json
+import select
+import shlex
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from src import utils
+from src.api.backends.base import Backend, Entry, Stat, primed, raise_errno
+from src.api.backends.local import LocalBackend
+from src.utils import timing
+
+__all__ = ("HelperBackend", "HelperPool", "Helper", "serve", "pool")
+
+# operations served by helpers
+OPERATIONS = (
+    "ls",
+    "scan",
+    "stat",
+    "read",
+    "archive",
+    "write",
+    "append",
+    "copy",
+    "rename",
+    "delete",
+    "mkdir",
+)
+
+# operations whose result is a stream of data frames
+STREAMS = ("scan", "read", "archive")
+
+# helpers outlive their idle timeout so that they never exit
+# while the pool still considers them reusable
+GRACE = 5
+
+FRAME_HEADER = struct.Struct(">I")
+
+
+class HelperBackend(Backend):
+    """Run each operation in a long-lived helper process of the user, started
+    once through ``sudo`` and reused across requests."""
+
+    def __init__(self, username=None, helpers=None):
+        super().__init__(username=username)
+        self.helpers = helpers or pool
+
+    def ls(self, path):
+        return self._request("ls", path=path)
+
+    def scan(self, path):
+        frames = primed(self._stream("scan", path=path))
+        return (Entry(**json.loads(frame)) for frame in frames if frame)
+
+    def stat(self, path):
+        return Stat(**self._request("stat", path=path))
+
+    def read(self, path, offset=0, length=None):
+        return primed(self._stream("read", path=path, offset=offset, length=length))
+
+    def archive(self, *paths):
+        return primed(self._stream("archive", paths=paths))
+
+    def write(self, path, file, offset=None, exists=None):
+        self._request("write", path=path, file=file, offset=offset, exists=exists)
+
+    def append(self, path, file):
+        self._request("append", path=path, file=file)
+
+    def copy(self, src, dst):
+        self._request("copy", src=src, dst=dst)
+
+    def rename(self, src, dst, replace=True):
+        self._request("rename", src=src, dst=dst, replace=replace)
+
+    def delete(self, path):
+        self._request("delete", path=path)
+
+    def mkdir(self, path):
+        self._request("mkdir", path=path)
+
+    def _request(self, op, **kwargs):
+        with timing.phase(op), self.helpers.acquire(self.username) as helper:
+            response = helper.request(op, **kwargs)
+        if response["errno"]:
+            raise_errno(response["errno"])
+        return response.get("result")
+
+    def _stream(self, op, **kwargs):
+        with timing.phase(op), self.helpers.acquire(self.username) as helper:
+            response = helper.request(op, **kwargs)
+            if response["errno"]:
+                raise_errno(response["errno"])
+            yield from helper.chunks()
+
+
+class Helper:
+    """Client of a helper process, exchanging framed messages over its pipes.
+    A helper is healthy when no exchange is left halfway."""
+
+    def __init__(self, username=None, idle_timeout=None):
+        cmd = f"{shlex.quote(sys.executable)} -m src.api.backends"
+        if idle_timeout:
+            cmd = f"{cmd} --idle-timeout {idle_timeout}"
+        self.process = subprocess.Popen(
+            shlex.split(utils.sudo(cmd, user=username)),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.healthy = True
+        self.last_used = time.monotonic()
+
+    def request(self, op, file=None, **kwargs):
+        """Send a request, along with the content of a file, if any,
+        and read its response."""
+        self.healthy = False
+        stdin, stdout = self.process.stdin, self.process.stdout
+        write_message(stdin, {"op": op, "args": kwargs})
+        if file is not None:
+            for chunk in iter(lambda: file.read(utils.CHUNK_SIZE), b""):
+                write_frame(stdin, chunk)
+            write_frame(stdin, b"")
+        stdin.flush()
+        response = read_message(stdout)
+        self.healthy = op not in STREAMS or bool(response["errno"])
+        return response
+
+    def chunks(self):
+        """Read the data frames of a streamed response."""
+        stdout = self.process.stdout
+        yield from iter(lambda: read_frame(stdout), b"")
+        response = read_message(stdout)
+        self.healthy = True
+        if response["errno"]:
+            raise_errno(response["errno"])
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        """Closing the pipes makes the helper exit, be it waiting for
+        a request or in the middle of one."""
+        self.process.stdin.close()
+        self.process.stdout.close()
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            with contextlib.suppress(OSError):
+                self.process.kill()
+
+
+class HelperPool:
+    """Idle helpers per user. Helpers are checked out for the duration of
+    an operation and discarded after ``idle_timeout`` seconds without use."""
+
+    def __init__(self, idle_timeout=300, max_idle=4):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self, username=None):
+        helper = self._checkout(username)
+        try:
+            yield helper
+        finally:
+            self._checkin(username, helper)
+
+    def _checkout(self, username):
+        with self._lock:
+            self._prune()
+            idle = self._idle.get(username)
+            if idle:
+                return idle.pop()
+        return Helper(username, idle_timeout=self.idle_timeout + GRACE)
+
+    def _checkin(self, username, helper):
+        helper.last_used = time.monotonic()
+        if helper.healthy:
+            with self._lock:
+                idle = self._idle[username]
+                if len(idle) < self.max_idle:
+                    idle.append(helper)
+                    return
+        helper.close()
+
+    def _prune(self):
+        now = time.monotonic()
+        for username, helpers in list(self._idle.items()):
+            for helper in helpers:
+                if now - helper.last_used >= self.idle_timeout or not helper.alive():
+                    helper.close()
+            helpers[:] = [helper for helper in helpers if helper.alive()]
+            if not helpers:
+                del self._idle[username]
+
+    def close(self):
+        with self._lock:
+            for helpers in self._idle.values():
+                for helper in helpers:
+                    helper.close()
+            self._idle.clear()
+
+
+def write_frame(stream, data):
+    stream.write(FRAME_HEADER.pack(len(data)))
+    stream.write(data)
+
+
+def read_frame(stream):
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        raise EOFError("helper closed the stream")
+    (size,) = FRAME_HEADER.unpack(header)
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError("helper closed the stream")
+    return data
+
+
+def write_message(stream, message):
+    write_frame(stream, json.dumps(message).encode())
+
+
+def read_message(stream):
+    return json.loads(read_frame(stream))
+
+
+class FrameReader(utils.ChunksFile):
+    """File-like object reading the data frames of a request, up to the
+    empty one ending them."""
+
+    def __init__(self, stream):
+        super().__init__(iter(functools.partial(read_frame, stream), b""))
+
+    def drain(self):
+        for _ in self.chunks:
+            pass
+
+
+def serve(stdin, stdout, idle_timeout=None):
+    """Serve requests until the input is closed or for ``idle_timeout``
+    seconds no request comes in. Operations run natively with the
+    credentials of the helper process."""
+    backend = LocalBackend()
+    while True:
+        # requests are answered before the next one is sent, so no data
+        # is left in the input buffer while waiting
+        ready, _, _ = select.select([stdin], [], [], idle_timeout)
+        if not ready:
+            return
+        try:
+            request = read_message(stdin)
+        except EOFError:
+            return
+
+        op, kwargs = request["op"], request["args"]
+        file = None
+        if op in ("write", "append"):
+            file = kwargs["file"] = FrameReader(stdin)
+        try:
+            if op not in OPERATIONS:
+                raise OSError(errno.EINVAL, "unsupported operation")
+            # archives take any number of paths
+            args = kwargs.pop("paths", ())
+            result = getattr(backend, op)(*args, **kwargs)
+        except OSError as ex:
+            if file:
+                file.drain()
+            write_message(stdout, {"errno": ex.errno or errno.EIO})
+        else:
+            if op in STREAMS:
+                if op == "scan":
+                    result = (
+                        json.dumps(dataclasses.asdict(e)).encode() for e in result
+                    )
+                write_message(stdout, {"errno": None})
+                write_message(stdout, write_chunks(stdout, result))
+            else:
+                if dataclasses.is_dataclass(result):
+                    result = dataclasses.asdict(result)
+                write_message(stdout, {"errno": None, "result": result})
+        stdout.flush()
+
+
+def write_chunks(stream, chunks):
+    """Write chunks as data frames, followed by an empty one, and return
+    the status of reading them."""
+    status = {"errno": None}
+    chunks = iter(chunks)
+    while True:
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            break
+        except OSError as ex:
+            status = {"errno": ex.errno or errno.EIO}
+            break
+        write_frame(stream, chunk)
+    write_frame(stream, b"")
+    return status
+
+
+# helpers of the current process
+pool = HelperPool()
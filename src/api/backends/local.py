@@ -0,0 +1,222 @@
+import errno
+import fcntl
+import functools
+import io
+import os
+import shutil
+import pwd
+import stat
+import tarfile
+
+from werkzeug.wsgi import FileWrapper
+
+from src import utils
+from src.api.backends.base import Backend, Entry, Stat, file_type, primed
+
+__all__ = ("LocalBackend",)
+
+# ioctl sharing the blocks of a file with another, on filesystems supporting it
+FICLONE = 0x40049409
+
+# errors of copy_file_range for files it cannot copy, which are copied in chunks
+COPY_FALLBACK_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP)
+
+
+class LocalBackend(Backend):
+    """Run each operation natively with the credentials of the current process.
+    Errors are raised as ``OSError`` carrying the respective errno."""
+
+    def ls(self, path):
+        if not os.path.isdir(path):
+            os.stat(path)
+            return [path]
+        return sorted(os.listdir(path))
+
+    def scan(self, path):
+        if not os.path.isdir(path):
+            return [entry(os.path.basename(path), os.stat(path))]
+        # directories are opened upfront so that errors are raised eagerly
+        return self._scan(os.scandir(path))
+
+    def stat(self, path):
+        stats = os.stat(path)
+        return Stat(
+            mode=stats.st_mode,
+            size=stats.st_size,
+            ino=stats.st_ino,
+            mtime=stats.st_mtime,
+        )
+
+    def read(self, path, offset=0, length=None):
+        file = open(path, "rb")  # noqa: SIM115 closed once read
+        if not offset and length is None:
+            # servers may send wrapped files with sendfile
+            return FileWrapper(file, buffer_size=utils.CHUNK_SIZE)
+        return self._chunks(file, offset=offset, length=length)
+
+    def archive(self, *paths):
+        return primed(self._tar(paths))
+
+    def write(self, path, file, offset=None, exists=None):
+        flags = os.O_WRONLY
+        if not exists:
+            flags |= os.O_CREAT | (os.O_EXCL if exists is False else 0)
+        if offset is None:
+            # content past the offset written to is kept
+            flags |= os.O_TRUNC
+        with open(os.open(path, flags, 0o666), "wb") as dst:
+            dst.seek(offset or 0)
+            for chunk in iter(lambda: file.read(utils.CHUNK_SIZE), b""):
+                dst.write(chunk)
+
+    def append(self, path, file):
+        with open(os.open(path, os.O_WRONLY | os.O_APPEND), "wb") as dst:
+            for chunk in iter(lambda: file.read(utils.CHUNK_SIZE), b""):
+                dst.write(chunk)
+
+    def copy(self, src, dst):
+        with open(src, "rb", buffering=0) as source:
+            fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            with open(fd, "wb", buffering=0) as target:
+                copy_content(source, target)
+
+    def rename(self, src, dst, replace=True):
+        if replace:
+            os.replace(src, dst)
+        else:
+            # linking fails if the destination exists, unlike renaming
+            os.link(src, dst, follow_symlinks=False)
+            os.remove(src)
+
+    def delete(self, path):
+        os.remove(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    @staticmethod
+    def _scan(entries):
+        with entries:
+            for dir_entry in entries:
+                try:
+                    stats = dir_entry.stat(follow_symlinks=False)
+                    target = None
+                    if stat.S_ISLNK(stats.st_mode):
+                        target = os.readlink(dir_entry.path)
+                except FileNotFoundError:  # removed meanwhile
+                    continue
+                yield entry(dir_entry.name, stats, target=target)
+
+    @staticmethod
+    def _chunks(file, offset=0, length=None):
+        """Read a file from ``offset`` up to ``length`` bytes, if given."""
+        with file:
+            file.seek(offset)
+            while length is None or length > 0:
+                size = utils.CHUNK_SIZE if length is None else length
+                chunk = file.read(min(utils.CHUNK_SIZE, size))
+                if not chunk:
+                    return
+                if length is not None:
+                    length -= len(chunk)
+                yield chunk
+
+    @classmethod
+    def _tar(cls, paths):
+        """Lazily build a tar archive of given paths, one chunk at a time."""
+        # the archive is only used to build the headers of its members
+        tar = tarfile.TarFile(fileobj=io.BytesIO(), mode="w")
+        size = 0
+        for path, member in cls._members(paths):
+            root = os.path.dirname(path)
+            info = tar.gettarinfo(member, arcname=os.path.relpath(member, root))
+            if info is None:  # sockets are not archived
+                continue
+            header = info.tobuf(tar.format, tar.encoding, tar.errors)
+            size += len(header)
+            yield header
+            if info.isreg():
+                yield from cls._content(member, size=info.size)
+                padding = cls._padding(info.size, tarfile.BLOCKSIZE)
+                size += info.size + len(padding)
+                yield padding
+
+        # end of archive: two empty blocks, padded to a full record
+        end = tarfile.NUL * 2 * tarfile.BLOCKSIZE
+        yield end + cls._padding(size + len(end), tarfile.RECORDSIZE)
+
+    @staticmethod
+    def _content(path, size):
+        """Read exactly ``size`` bytes of a file, as announced in its header."""
+        with open(path, "rb") as file:
+            while size > 0:
+                chunk = file.read(min(utils.CHUNK_SIZE, size))
+                if not chunk:  # file shrunk meanwhile
+                    chunk = tarfile.NUL * size
+                size -= len(chunk)
+                yield chunk
+
+    @classmethod
+    def _members(cls, paths):
+        """Yield each path along with each of the files archived from it."""
+        for path in paths:
+            for member in cls._walk(path):
+                yield path, member
+
+    @classmethod
+    def _walk(cls, path):
+        """Yield given path and, if a directory, all of its descendants.
+        Directories are listed before being yielded so that errors surface
+        before their entries are archived."""
+        isdir = os.path.isdir(path) and not os.path.islink(path)
+        names = sorted(os.listdir(path)) if isdir else []
+        yield path
+        for name in names:
+            yield from cls._walk(os.path.join(path, name))
+
+    @staticmethod
+    def _padding(size, block):
+        return tarfile.NUL * (-size % block)
+
+
+def copy_content(src, dst):
+    """Copy the content of a file to an empty one by sharing its blocks if
+    supported by the filesystem, or else within the kernel, or else by
+    reading it in chunks."""
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except OSError:
+        pass
+    try:
+        # file positions are advanced, so a fallback resumes where it stopped
+        while os.copy_file_range(src.fileno(), dst.fileno(), 2**30):
+            pass
+        return
+    except AttributeError:  # not available before python 3.8
+        pass
+    except OSError as ex:
+        if ex.errno not in COPY_FALLBACK_ERRORS:
+            raise
+    shutil.copyfileobj(src, dst, utils.CHUNK_SIZE)
+
+
+def entry(name, stats, target=None):
+    return Entry(
+        name=name,
+        type=file_type(stats.st_mode),
+        size=stats.st_size,
+        mode=stat.S_IMODE(stats.st_mode),
+        owner=owner(stats.st_uid),
+        mtime=stats.st_mtime,
+        target=target,
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def owner(uid):
+    """Name of the user with given id, or the id itself if it has none."""
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
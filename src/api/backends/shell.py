@@ -0,0 +1,188 @@
+import os
+import subprocess
+from shlex import quote
+
+from src import utils
+from src.api.backends.base import Backend, CrossDeviceLinkError, Entry, Stat, primed
+from src.utils import metrics
+
+__all__ = ("ShellBackend",)
+
+# exceptions raised for the errors printed by commands
+ERRORS = {
+    "no such file or directory": FileNotFoundError,
+    "permission denied": PermissionError,
+    "is a directory": IsADirectoryError,
+    "not a directory": NotADirectoryError,
+    "file exists": FileExistsError,
+    "invalid cross-device link": CrossDeviceLinkError,
+}
+
+# fields of the entries printed by find, each terminated by a null byte
+# so that any name can be told apart
+FIND_FORMAT = "\\0".join(("%y", "%s", "%m", "%u", "%T@", "%l", "%f", ""))
+
+# names of the file types printed by find
+FIND_TYPES = {
+    "f": "file",
+    "d": "directory",
+    "l": "symlink",
+    "b": "block-device",
+    "c": "char-device",
+    "p": "fifo",
+    "s": "socket",
+}
+
+
+class ShellBackend(Backend):
+    """Run each operation as a command through ``sudo``. Paths are quoted
+    into commands, which are split back into arguments as a shell would,
+    so that each path remains a single argument whatever it holds."""
+
+    def ls(self, path):
+        return self._run(cmd=f"ls {quote(path)}", user=self.username)
+
+    def scan(self, path):
+        # symlinks are followed for the path itself only
+        cmd = f"find -H {quote(path)} -maxdepth 1 -printf {quote(FIND_FORMAT)}"
+        return self._scan(self._stream(cmd=cmd, user=self.username))
+
+    def stat(self, path):
+        cmd = f"stat -L -c %f:%s:%i:%Y {quote(path)}"
+        mode, size, ino, mtime = self._run(cmd=cmd, user=self.username)[0].split(":")
+        return Stat(mode=int(mode, 16), size=int(size), ino=int(ino), mtime=int(mtime))
+
+    def read(self, path, offset=0, length=None):
+        if not offset and length is None:
+            return self._stream(cmd=f"cat {quote(path)}", user=self.username)
+        cmd = f"dd if={quote(path)} bs={utils.CHUNK_SIZE} skip={offset}"
+        if length is not None:
+            cmd = f"{cmd} count={length}"
+        cmd = f"{cmd} iflag=skip_bytes,count_bytes status=none"
+        return self._stream(cmd=cmd, user=self.username)
+
+    def archive(self, *paths):
+        # names are added as such, even if starting with a dash
+        members = " ".join(
+            f"-C {quote(os.path.dirname(path))} "
+            f"{quote(f'--add-file={os.path.basename(path)}')}"
+            for path in paths
+        )
+        return self._stream(cmd=f"tar -cpf - {members}", user=self.username)
+
+    def write(self, path, file, offset=None, exists=None):
+        cmd = f"tee {quote(path)}"
+        if offset is not None or exists is not None:
+            conv = {True: ["nocreat"], False: ["excl"], None: []}[exists]
+            cmd = f"dd of={quote(path)} bs={utils.CHUNK_SIZE}"
+            if offset is not None:
+                cmd = f"{cmd} seek={offset} oflag=seek_bytes"
+                conv.append("notrunc")
+            if conv:
+                cmd = f"{cmd} conv={','.join(conv)}"
+            cmd = f"{cmd} status=none"
+        try:
+            utils.feed(cmd=cmd, file=file, user=self.username)
+        except subprocess.CalledProcessError as ex:
+            self.raise_error(ex.stderr)
+
+    def append(self, path, file):
+        cmd = (
+            f"dd of={quote(path)} bs={utils.CHUNK_SIZE} oflag=append "
+            "conv=nocreat,notrunc status=none"
+        )
+        try:
+            utils.feed(cmd=cmd, file=file, user=self.username)
+        except subprocess.CalledProcessError as ex:
+            self.raise_error(ex.stderr)
+
+    def copy(self, src, dst):
+        # blocks are shared, or copied with copy_file_range, by cp itself
+        self._run(
+            cmd=f"cp --reflink=auto -T {quote(src)} {quote(dst)}",
+            stdout=subprocess.DEVNULL,
+            user=self.username,
+        )
+
+    def rename(self, src, dst, replace=True):
+        if replace:
+            self._run(
+                cmd=f"mv -T {quote(src)} {quote(dst)}",
+                stdout=subprocess.DEVNULL,
+                user=self.username,
+            )
+            return
+        # linking fails if the destination exists, unlike renaming
+        self._run(
+            cmd=f"ln -P -T {quote(src)} {quote(dst)}",
+            stdout=subprocess.DEVNULL,
+            user=self.username,
+        )
+        self.delete(src)
+
+    def delete(self, path):
+        self._run(
+            cmd=f"rm {quote(path)}",
+            stdout=subprocess.DEVNULL,
+            user=self.username,
+        )
+
+    def mkdir(self, path):
+        self._run(
+            cmd=f"mkdir {quote(path)}",
+            stdout=subprocess.DEVNULL,
+            user=self.username,
+        )
+
+    @classmethod
+    def _scan(cls, chunks):
+        """Parse the entries printed by find. The path itself comes first
+        and is left out if a directory."""
+        records = zip(*[cls._fields(chunks)] * 7)
+        for index, record in enumerate(records):
+            type_, size, mode, owner, mtime, target, name = record
+            if index == 0 and type_ == "d":
+                continue
+            yield Entry(
+                name=name,
+                type=FIND_TYPES.get(type_, "unknown"),
+                size=int(size),
+                mode=int(mode, 8),
+                owner=owner,
+                mtime=float(mtime),
+                target=target or None,
+            )
+
+    @classmethod
+    def _fields(cls, chunks):
+        """Split chunks into null-terminated fields."""
+        buffer = b""
+        try:
+            for chunk in chunks:
+                *fields, buffer = (buffer + chunk).split(b"\0")
+                yield from (field.decode(errors="surrogateescape") for field in fields)
+        except subprocess.CalledProcessError as ex:
+            cls.raise_error(ex.stderr)
+
+    @classmethod
+    def _run(cls, cmd, **kwargs):
+        try:
+            stdout = utils.shell(cmd, **kwargs)
+        except subprocess.CalledProcessError as ex:
+            cls.raise_error(ex.stderr)
+        else:
+            return stdout.splitlines() if isinstance(stdout, str) else stdout
+
+    @classmethod
+    def _stream(cls, cmd, **kwargs):
+        try:
+            return primed(utils.stream(cmd, **kwargs))
+        except subprocess.CalledProcessError as ex:
+            cls.raise_error(ex.stderr)
+
+    @staticmethod
+    def raise_error(stderr):
+        err = stderr.split(":")[-1].strip().lower()
+        error = ERRORS.get(err, Exception)
+        metrics.filesystem_errors.inc(error.__name__)
+        raise error(err)
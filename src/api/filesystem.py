@@ -1,95 +1,411 @@
+import base64
+import contextlib
+import heapq
 import io
+import json
 import os
-import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from flask import current_app
 from werkzeug.utils import secure_filename
 
 from src import utils
+from src.utils import archives
+from src.api.backends import CrossDeviceLinkError, create_backend
+from src.api.listings import ListingCache
 
 __all__ = ("FilesystemAPI",)
 
+# supported compressions for directory archives
+COMPRESSIONS = ("gzip", "none")
+
+# supported formats of archives of many paths
+ARCHIVE_FORMATS = ("tar", "zip")
+
+# uploaded files up to this size are read upfront and written concurrently
+# while the next ones are read; larger ones are written as they are read
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+# keys listings can be sorted by, in descending order if prefixed with "-"
+SORT_KEYS = ("name", "mtime", "size")
+
+# operations run in batches
+BATCH_OPERATIONS = ("ls", "stat", "delete", "mkdir")
+
 
 class FilesystemAPI:
-    def __init__(self, username=None):
+    # listings shared by the requests of the current process
+    listings = ListingCache()
+
+    def __init__(self, username=None, backend="shell"):
         self.username = str(username) if username else None
+        self.backend = create_backend(backend, username=self.username)
 
-    def ls(self, path, flags=""):
-        return self._run(cmd=f"ls {flags} {path}", user=self.username)
+    def ls(self, path, details=False):
+        """List the files in given path by name, or as entries with
+        the metadata of each file if ``details`` is set."""
+        if not details:
+            return self.listings.fetch(
+                self.username, utils.normpath(path), lambda: self.backend.ls(path)
+            )
+        entries, _ = self.page(path)
+        return entries
 
-    def attachment(self, path, mode=None) -> (str, bytes):
-        """Get attachable file tuple consisting of name and bytes content."""
+    def listing(self, path):
+        """Get the status of given path along with the names of the files
+        in it, cached together so that cached listings are validated with
+        no further operation."""
         path = utils.normpath(path)
+        return self.listings.fetch(
+            self.username,
+            path,
+            lambda: (self.backend.stat(path), self.backend.ls(path)),
+            kind="listing",
+        )
+
+    def scan(self, path):
+        """Get an iterator over the entries in given path, in the order
+        the directory is read."""
+        return self.backend.scan(utils.normpath(path))
+
+    def page(self, path, limit=None, cursor=None, sort="name") -> (list, str):
+        """Get the entries in given path sorted by ``sort``, up to ``limit``
+        entries past the one the cursor points at, along with the cursor
+        of the next page, if any. Only the entries of the page are held
+        in memory while the directory is read.
+        """
+        field, reverse = sort.lstrip("-"), sort.startswith("-")
+        if field not in SORT_KEYS:
+            raise ValueError("unsupported sort key")
+        if limit is not None and limit < 1:
+            raise ValueError("invalid limit")
+
+        def key(entry):
+            # names are unique, which makes the order total
+            if field == "name":
+                return (entry.name,)
+            return getattr(entry, field), entry.name
+
+        entries = self.scan(path)
+        if cursor is not None:
+            after = decode_cursor(cursor, sort=sort)
+            if reverse:
+                entries = (entry for entry in entries if key(entry) < after)
+            else:
+                entries = (entry for entry in entries if key(entry) > after)
+        if limit is None:
+            return sorted(entries, key=key, reverse=reverse), None
+
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        entries = select(limit + 1, entries, key=key)
+        if len(entries) <= limit:
+            return entries, None
+        entries = entries[:limit]
+        return entries, encode_cursor(key(entries[-1]), sort=sort)
+
+    def stat(self, path):
+        """Get the status of given path."""
+        return self.backend.stat(utils.normpath(path))
+
+    def read(self, path, offset=0, length=None):
+        """Get an iterator over the content of a file, or of a byte range
+        of it, in chunks of bytes."""
+        return self.backend.read(utils.normpath(path), offset=offset, length=length)
+
+    def attachment_name(self, path, mode=None, compression="gzip"):
+        """Get the name of the attachment of given path."""
+        name = os.path.basename(utils.normpath(path))
         if utils.isfile(mode):
-            cmd = f"cat {path}"
-            stream = self._run(cmd=cmd, user=self.username, universal_newlines=False)
-            filename = os.path.basename(path)
-            content = io.BytesIO(stream)
-            return filename, content
+            return name
         elif utils.isdir(mode):
-            archive_dir = os.path.dirname(path)
-            archive_name = os.path.basename(path)
-            cmd = f"tar -cvpf - -C {archive_dir} {archive_name}"
-            stream = self._run(cmd=cmd, user=self.username, universal_newlines=False)
-            filename = f"{os.path.basename(path)}.tar.gz"
-            content = io.BytesIO(stream)
-            return filename, content
+            if compression not in COMPRESSIONS:
+                raise ValueError("unsupported compression")
+            return f"{name}.tar.gz" if compression == "gzip" else f"{name}.tar"
 
         raise ValueError("unsupported file mode")
 
-    def upload_files(self, path, files=(), update=False):
-        """Upload given files to the specified path ensuring
-        files do not already exist.
+    def attachment(self, path, mode=None, compression="gzip", level=6) -> (str, iter):
+        """Get attachable file tuple consisting of name and an iterator
+        over the content in chunks of bytes. Directories are archived and
+        compressed on the fly with the given compression and level.
+        """
+        filename = self.attachment_name(path, mode=mode, compression=compression)
+        path = utils.normpath(path)
+        if utils.isfile(mode):
+            return filename, self.backend.read(path)
+
+        if not 0 <= level <= 9:
+            raise ValueError("unsupported compression level")
+        content = self.backend.archive(path)
+        if compression == "gzip":
+            content = utils.compress(content, level=level)
+        return filename, content
+
+    def archive(self, paths, format="tar", compression="gzip", level=6) -> (str, iter):
+        """Get attachable file tuple of a single archive of given paths,
+        each archived under its name. Tar archives are compressed with the
+        given compression while zip archives are deflated, both with the
+        given level. Archives are built on the fly as they are consumed.
         """
-        path = f"{utils.normpath(path)}/"
-        path_files = self.ls(path)
-        for file in files:
-            filename = secure_filename(file.filename)
-            if update and filename not in path_files:
-                raise FileNotFoundError("file does not exist")
-            elif not update and filename in path_files:
-                raise FileExistsError("file already exists")
-
-        for file in files:
-            filename = secure_filename(file.filename)
+        if not paths:
+            raise ValueError("missing paths")
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError("unsupported archive format")
+        if format == "tar" and compression not in COMPRESSIONS:
+            raise ValueError("unsupported compression")
+        if not 0 <= level <= 9:
+            raise ValueError("unsupported compression level")
+        paths = [utils.normpath(path) for path in paths]
+        names = [os.path.basename(path) for path in paths]
+        if not all(names):
+            raise ValueError("unsupported path")
+        if len(set(names)) < len(names):
+            raise ValueError("duplicate file names")
+
+        content = self.backend.archive(*paths)
+        if format == "zip":
+            return "archive.zip", archives.tar_to_zip(content, level=level)
+        elif compression == "gzip":
+            return "archive.tar.gz", utils.compress(content, level=level)
+        return "archive.tar", content
+
+    def upload_stream(self, path, files, update=False, workers=1) -> (list, dict):
+        """Upload files as they are read from an iterator over file objects
+        with a ``filename``, each to be read before the next one is taken.
+        Returns the names of the files along with the error of each file
+        that failed to be written by name.
+
+        Each file is created exclusively, failing if it exists, or is
+        opened unless it exists if ``update`` is set, before any of its
+        content is written, rather than checked against a listing of the
+        directory. New files are all or nothing: if any of them exists,
+        the error is raised and none is left created. Updated files are
+        written in place, not to lose their ownership and permissions. New
+        files failing halfway are deleted, as are all of them if the upload
+        fails as a whole, though never files that existed before the upload.
+        """
+        path = utils.normpath(path)
+        filenames, errors, futures = [], {}, []
+        # files this upload created, the only ones it may delete
+        created = set()
+        # bounds the content held in memory by the files waiting to be written
+        slots = threading.BoundedSemaphore(workers)
+
+        def write(filename, file):
             dst = f"{path}/{filename}"
-            self._run(
-                cmd=f"tee {dst}",
-                stdin=file,
-                stdout=subprocess.DEVNULL,
-                user=self.username,
-            )
+            try:
+                if not update:
+                    # created empty first, as the content may fail to be read
+                    # before a file failing to be created is told apart
+                    self.backend.write(dst, io.BytesIO(), exists=False)
+                    created.add(dst)
+                self.backend.write(dst, file, exists=True)
+            except Exception as ex:
+                errors[filename] = ex
+            finally:
+                slots.release()
+
+        def existing():
+            # the first of the files failing to be created for existing
+            failed = list(errors.values())
+            return next((ex for ex in failed if isinstance(ex, FileExistsError)), None)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for file in files:
+                    if existing():
+                        break
+                    filename = secure_filename(file.filename)
+                    if filename in filenames:
+                        raise ValueError("duplicate file names")
+                    filenames.append(filename)
+
+                    content = file.read(UPLOAD_BUFFER_SIZE + 1)
+                    slots.acquire()
+                    if len(content) <= UPLOAD_BUFFER_SIZE:
+                        content = io.BytesIO(content)
+                        futures.append(executor.submit(write, filename, content))
+                    else:
+                        write(filename, PrefixedFile(content, file))
+            except BaseException:
+                wait(futures)
+                self._discard(created)
+                raise
+
+            wait(futures)
+        error = existing()
+        if error:
+            self._discard(created)
+            raise error
+        self._discard(created & {f"{path}/{name}" for name in errors})
+        return filenames, errors
+
+    def write_range(self, path, file, offset, length):
+        """Write ``length`` bytes of a file object in place into an existing
+        file, from given offset, leaving the rest of the file untouched.
+        The length is to be checked against the request beforehand, as
+        the content written is only known to fall short once written."""
+        path = utils.normpath(path)
+        if offset < 0 or length < 0:
+            raise ValueError("invalid range")
+        content = LimitedFile(file, length)
+        self.backend.write(path, content, offset=offset, exists=True)
+        if content.limit:
+            raise ValueError("content shorter than its length")
+
+    def append(self, path, file, length):
+        """Append ``length`` bytes of a file object to an existing file,
+        at its end as of writing them, so that appends never overwrite
+        each other."""
+        path = utils.normpath(path)
+        if length < 0:
+            raise ValueError("invalid range")
+        content = LimitedFile(file, length)
+        self.backend.append(path, content)
+        if content.limit:
+            raise ValueError("content shorter than its length")
+
+    def _discard(self, paths):
+        """Delete files left behind by failed writes, as far as possible."""
+        for path in paths:
+            with contextlib.suppress(Exception):
+                self.backend.delete(path)
 
     def delete_file(self, path):
-        self._run(
-            cmd=f"rm {path}",
-            stdout=subprocess.DEVNULL,
-            user=self.username,
-        )
+        self.backend.delete(path)
 
-    @classmethod
-    def _run(cls, cmd, **kwargs):
+    def mkdir(self, path):
+        self.backend.mkdir(utils.normpath(path))
+
+    def copy(self, src, dst):
+        """Copy a file to given path, which must not exist. The copy is
+        written under a temporary name and only moved into place once
+        complete, unless the path exists by then."""
+        src, dst = utils.normpath(src), utils.normpath(dst)
+        if not utils.isfile(self.stat(src).mode):
+            raise ValueError("unsupported file mode")
+        temp = temporary(*os.path.split(dst))
         try:
-            stdout = utils.shell(cmd, **kwargs)
-        except subprocess.CalledProcessError as ex:
-            cls.raise_error(ex.stderr)
-        else:
-            return stdout.splitlines() if isinstance(stdout, str) else stdout
+            self.backend.copy(src, temp)
+            self.backend.rename(temp, dst, replace=False)
+        except BaseException:
+            self._discard([temp])
+            raise
 
-    @staticmethod
-    def raise_error(stderr):
-        err = stderr.split(":")[-1].strip().lower()
-        if err == "no such file or directory":
-            raise FileNotFoundError(err)
-        elif err == "permission denied":
-            raise PermissionError(err)
-        elif err == "is a directory":
-            raise IsADirectoryError(err)
-        elif err == "not a directory":
-            raise NotADirectoryError(err)
-        else:
-            raise Exception(err)
+    def move(self, src, dst):
+        """Move a file or directory to given path, which must not exist.
+        Files are renamed within a filesystem and otherwise copied over
+        before being deleted, while directories are only renamed."""
+        src, dst = utils.normpath(src), utils.normpath(dst)
+        if utils.isdir(self.stat(src).mode):
+            # directories cannot be linked, so the path is checked upfront
+            try:
+                self.stat(dst)
+            except FileNotFoundError:
+                self.backend.rename(src, dst)
+                return
+            raise FileExistsError("file already exists")
+        try:
+            self.backend.rename(src, dst, replace=False)
+        except CrossDeviceLinkError:
+            self.copy(src, dst)
+            self.backend.delete(src)
+
+    def batch(self, operations, paths, workers=1) -> iter:
+        """Run operations on files within given paths, up to ``workers`` at
+        a time. Each operation is a dict with the name of the operation
+        under ``op``, the path of the file and, for listings, whether to
+        list ``details``. Yields the result and the error of each, in
+        order, as soon as it and the ones before it are done. Operations
+        yet to run are cancelled once the iterator is closed.
+        """
+
+        def run(operation):
+            if not isinstance(operation, dict):
+                raise ValueError("invalid operation")
+            op, path = operation.get("op"), operation.get("path")
+            if op not in BATCH_OPERATIONS:
+                raise ValueError("unsupported operation")
+            if not isinstance(path, str):
+                raise ValueError("missing path")
+            path = utils.normpath(path)
+            if not any(path.startswith(p) for p in paths):
+                raise ValueError("unsupported path")
+            if op == "ls":
+                return self.ls(path, details=bool(operation.get("details")))
+            elif op == "stat":
+                return self.stat(path)
+            elif op == "delete":
+                return self.delete_file(path)
+            return self.mkdir(path)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        futures = [executor.submit(run, operation) for operation in operations]
+        try:
+            for future in futures:
+                error = future.exception()
+                yield (None, error) if error else (future.result(), None)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     @staticmethod
     def supported_paths():
         return current_app.config["SUPPORTED_PATHS"]
+
+
+def encode_cursor(key, sort):
+    """Opaque cursor pointing at the entry with given sort key."""
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+    try:
+        cursor_sort, *key = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("invalid cursor")
+    return tuple(key)
+
+
+def temporary(path, filename):
+    """Hidden, unique name to write a file under in given directory."""
+    return f"{path}/.{filename}.{uuid.uuid4().hex}.upload"
+
+
+class PrefixedFile:
+    """File object reading given bytes before the content of a file."""
+
+    def __init__(self, prefix, file):
+        self.prefix = prefix
+        self.file = file
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.file.read(size)
+        if size < 0:
+            data, self.prefix = self.prefix, b""
+            return data + self.file.read()
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data
+
+
+class LimitedFile:
+    """File object reading up to ``limit`` bytes of a file."""
+
+    def __init__(self, file, limit):
+        self.file = file
+        self.limit = limit
+
+    def read(self, size=-1):
+        if size < 0 or size > self.limit:
+            size = self.limit
+        if not size:
+            return b""
+        data = self.file.read(size)
+        self.limit -= len(data)
+        return data
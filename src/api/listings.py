@@ -0,0 +1,291 @@
+import collections
+import ctypes
+import functools
+import itertools
+import os
+import struct
+import threading
+import time
+
+__all__ = ("ListingCache", "Inotify")
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# events changing the names in a directory, or who may list them; symlinks
+# are not watched, as the directory they point to may change unnoticed
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+
+# struct inotify_event, followed by a null-padded name
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Non-blocking inotify instance, whose events are read on demand."""
+
+    def __init__(self):
+        self.fd = libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise_errno()
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = libc().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise_errno(path)
+        return wd
+
+    def rm_watch(self, wd):
+        # watches of removed directories are gone already
+        libc().inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """Yield the (wd, mask, name) of the pending events. Names are empty
+        for events on the watched directories themselves."""
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                yield wd, mask, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ListingCache:
+    """Bounded LRU cache of directory listings per user and path. Listings
+    are invalidated by inotify events on the directory and on each of its
+    parents, so that renames and permission changes along the path are
+    noticed as well. Pending events are read before each lookup, so changes
+    done by the time of a request are never missed. Listings expire after
+    ``ttl`` seconds regardless, as changes to the groups of a user raise
+    no events.
+
+    Listings are only cached when the directories can be watched, which
+    requires the server process, not the user, to have read access to them.
+    Directories only the user can read, like most home directories, are
+    listed on every request."""
+
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._tickets = itertools.count()
+        self._epoch = 0
+        self._refs = collections.Counter()
+        self._watches = collections.defaultdict(set)
+        self._paths = {}
+        self._inotify = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def fetch(self, username, path, load, kind="ls"):
+        """Get the cached listing of the user in given path, or else
+        ``load()`` it, caching it unless the directory changed meanwhile.
+        Listings of different ``kind`` are cached apart."""
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return load()
+        key = (username, path, kind)
+        with self._lock:
+            self._setup()
+            self._process_events()
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._discard(key)
+            self.misses += 1
+            # watches are set before listing, not to miss changes meanwhile
+            ticket = self._prepare(path)
+
+        if ticket is None:
+            return load()
+        try:
+            names = load()
+        except Exception:
+            with self._lock:
+                self._pending.pop(ticket, None)
+                self._void(ticket, path)
+            raise
+
+        with self._lock:
+            self._process_events()
+            if self._pending.pop(ticket, None) is None:
+                # changed while listing, or the cache was cleared
+                self._void(ticket, path)
+                return names
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, names)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+        return names
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _setup(self):
+        """Start watching, once per process, as forked processes must read
+        events of their own. Watching is left out where unsupported."""
+        if self._pid == os.getpid():
+            return
+        self._reset()
+        try:
+            self._inotify = Inotify()
+        except (OSError, AttributeError):  # no inotify in libc
+            self._inotify = None
+        self._pid = os.getpid()
+
+    def _prepare(self, path):
+        """Watch given path and its parents, returning a ticket valid
+        until any of them changes, or None if they cannot be watched."""
+        if self._inotify is None:
+            return None
+
+        watched = []
+        for directory in lineage(path):
+            if directory not in self._paths:
+                try:
+                    wd = self._inotify.add_watch(directory)
+                except OSError:
+                    for parent in watched:
+                        self._unref(parent)
+                    return None
+                # directories reached through several paths share a watch
+                self._watches[wd].add(directory)
+                self._paths[directory] = wd
+            self._refs[directory] += 1
+            watched.append(directory)
+
+        ticket = (self._epoch, next(self._tickets))
+        self._pending[ticket] = path
+        return ticket
+
+    def _void(self, ticket, path):
+        """Drop the watches of a ticket, unless dropped by a reset already."""
+        if ticket[0] == self._epoch:
+            self._release(path)
+
+    def _process_events(self):
+        if self._inotify is None:
+            return
+        for wd, mask, name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self._invalidate("/", recursive=True)
+                continue
+            for directory in list(self._watches.get(wd, ())):
+                # events with no name are on the directory itself,
+                # which affect what is listed beneath it
+                self._invalidate(directory, recursive=not name)
+            if mask & (IN_MOVE_SELF | IN_DELETE_SELF | IN_IGNORED):
+                # the watch no longer follows the paths it was set for
+                self._forget(wd, removed=bool(mask & IN_IGNORED))
+
+    def _invalidate(self, directory, recursive=False):
+        def matches(path):
+            return is_within(path, directory) if recursive else path == directory
+
+        for key in [key for key in self._entries if matches(key[1])]:
+            self._discard(key)
+        for ticket, path in list(self._pending.items()):
+            if matches(path):
+                del self._pending[ticket]
+
+    def _discard(self, key):
+        if self._entries.pop(key, None) is not None:
+            self._release(key[1])
+
+    def _release(self, path):
+        for directory in lineage(path):
+            self._unref(directory)
+
+    def _unref(self, directory):
+        self._refs[directory] -= 1
+        if self._refs[directory] > 0:
+            return
+        del self._refs[directory]
+        wd = self._paths.pop(directory, None)
+        if wd is not None:
+            self._watches[wd].discard(directory)
+            if not self._watches[wd]:
+                del self._watches[wd]
+                self._inotify.rm_watch(wd)
+
+    def _forget(self, wd, removed=False):
+        for directory in self._watches.pop(wd, ()):
+            del self._paths[directory]
+        if not removed:
+            self._inotify.rm_watch(wd)
+
+    def _reset(self):
+        """Forget all listings and watches. Pending tickets are voided,
+        their references being dropped along with the watches."""
+        if self._inotify is not None:
+            self._inotify.close()
+        self._inotify = None
+        self._pid = None
+        self._epoch += 1
+        self._entries.clear()
+        self._pending.clear()
+        self._refs.clear()
+        self._watches.clear()
+        self._paths.clear()
+
+
+def lineage(path):
+    """Given path followed by each of its parents."""
+    while True:
+        yield path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return
+        path = parent
+
+
+def is_within(path, directory):
+    return path == directory or path.startswith(directory.rstrip("/") + "/")
+
+
+def raise_errno(filename=None):
+    code = ctypes.get_errno()
+    raise OSError(code, os.strerror(code), filename)
+
+
+@functools.lru_cache(maxsize=None)
+def libc():
+    return ctypes.CDLL(None, use_errno=True)
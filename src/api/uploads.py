@@ -0,0 +1,202 @@
+import contextlib
+import dataclasses
+import io
+import os
+import re
+import time
+
+from itsdangerous import BadSignature
+from werkzeug.utils import secure_filename
+
+from src import utils
+from src.api.auth import token_serializer
+from src.api.filesystem import FilesystemAPI, LimitedFile, temporary
+
+__all__ = ("UploadsAPI", "UploadSession")
+
+# names of the files of upload sessions, or of other temporary files
+SESSION_FILE = re.compile(r"^\..+\.[0-9a-f]{32}\.upload(\.chunks)?$")
+
+
+@dataclasses.dataclass
+class UploadSession:
+    """Upload of a file assembled from chunks of ``chunk_size`` bytes, but
+    for the last one, into a temporary file next to its destination."""
+
+    path: str
+    temp: str
+    size: int
+    chunk_size: int
+    update: bool
+    username: str
+    expires: int
+
+    @property
+    def chunks(self):
+        return -(-self.size // self.chunk_size)
+
+    @property
+    def received_map(self):
+        """File marking each chunk received with a non-null byte at the
+        position of its index."""
+        return f"{self.temp}.chunks"
+
+    def chunk_range(self, index) -> (int, int):
+        """Start and stop offsets of the chunk of given index."""
+        if not 0 <= index < self.chunks:
+            raise ValueError("invalid chunk")
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.size)
+
+    def chunk_at(self, start, stop):
+        """Index of the chunk spanning given offsets."""
+        index, remainder = divmod(start, self.chunk_size)
+        if remainder or self.chunk_range(index) != (start, stop):
+            raise ValueError("invalid chunk")
+        return index
+
+
+class UploadsAPI(FilesystemAPI):
+    """Upload sessions, through which a file is uploaded in chunks, in any
+    order and possibly concurrently, and only created, or updated, once
+    all of them are received.
+
+    No state is kept in the process: sessions are identified by a signed
+    token carrying their properties, so any process sharing the secret
+    key serves them, and the chunks received are recorded on the
+    filesystem along with the temporary file. Sessions thus expire without
+    the process knowing, and the files of those abandoned are swept from
+    a directory as sessions are started in it."""
+
+    def create(self, path, size, chunk_size, secret_key, ttl=86400, update=False):
+        """Start the upload of a file to given path, returning the session
+        and its identifier. The file is checked to exist if updated, or
+        else not to, as for any other upload."""
+        path = utils.normpath(path)
+        directory, filename = os.path.split(path)
+        if not filename or secure_filename(filename) != filename:
+            raise ValueError("unsupported file name")
+        if size < 0:
+            raise ValueError("invalid size")
+        if chunk_size < 1:
+            raise ValueError("invalid chunk size")
+        # the key is checked before any file of the session is written
+        serializer = session_serializer(secret_key)
+        self._check(path, update=update)
+        self._sweep(directory, ttl=ttl)
+
+        session = UploadSession(
+            path=path,
+            temp=temporary(directory, filename),
+            size=size,
+            chunk_size=chunk_size,
+            update=update,
+            username=self.username,
+            expires=int(time.time()) + ttl,
+        )
+        self.backend.write(session.temp, io.BytesIO(), exists=False)
+        try:
+            self.backend.write(session.received_map, io.BytesIO(), exists=False)
+        except Exception:
+            self._discard([session.temp])
+            raise
+        payload = dataclasses.asdict(session)
+        return serializer.dumps(payload), session
+
+    def session(self, session_id, secret_key, expired=False):
+        """Get the session of given identifier, if started by the current
+        user and, unless ``expired`` is set, not yet expired."""
+        try:
+            session = UploadSession(**session_serializer(secret_key).loads(session_id))
+        except (BadSignature, TypeError):
+            raise FileNotFoundError("upload session does not exist")
+        if not expired and session.expires <= time.time():
+            raise FileNotFoundError("upload session does not exist")
+        if session.username != self.username:
+            raise PermissionError("upload session of another user")
+        return session
+
+    def write_chunk(self, session, index, file):
+        """Write the chunk of given index, read from a file object holding
+        exactly its content. Chunks may be written again, until committed
+        or aborted, after which the files of the session no longer exist."""
+        start, stop = session.chunk_range(index)
+        content = LimitedFile(file, stop - start)
+        try:
+            self.backend.write(session.temp, content, offset=start, exists=True)
+            if content.limit or file.read(1):
+                # what was written is overwritten as the chunk is sent again
+                raise ValueError("chunk size does not match")
+            marker = io.BytesIO(b"\1")
+            self.backend.write(session.received_map, marker, offset=index, exists=True)
+        except FileNotFoundError:
+            raise FileNotFoundError("upload session does not exist")
+
+    def received(self, session) -> list:
+        """Byte ranges received so far, as [start, stop) pairs."""
+        try:
+            received_map = b"".join(self.backend.read(session.received_map))
+        except FileNotFoundError:
+            raise FileNotFoundError("upload session does not exist")
+
+        ranges = []
+        for index, marker in enumerate(received_map[: session.chunks]):
+            if not marker:
+                continue
+            start, stop = session.chunk_range(index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = stop
+            else:
+                ranges.append([start, stop])
+        return ranges
+
+    def commit(self, session):
+        """Move the assembled file into place, once all of its chunks are
+        received, so the file is never seen partially written, unless the
+        destination exists by then. Updated files are instead written in
+        place from the assembled file, provided they still exist, not to
+        lose their ownership and permissions, as other updates."""
+        if self.received(session) != ([[0, session.size]] if session.size else []):
+            raise ValueError("missing chunks")
+        if session.update:
+            content = utils.ChunksFile(self.backend.read(session.temp))
+            self.backend.write(session.path, content, exists=True)
+            self._discard([session.temp, session.received_map])
+        else:
+            self.backend.rename(session.temp, session.path, replace=False)
+            self._discard([session.received_map])
+
+    def _check(self, path, update=False):
+        """Ensure a file exists if it is to be updated, or else that it
+        does not, by its status alone."""
+        try:
+            self.backend.stat(path)
+        except FileNotFoundError:
+            if update:
+                raise FileNotFoundError("file does not exist")
+        else:
+            if not update:
+                raise FileExistsError("file already exists")
+
+    def _sweep(self, directory, ttl):
+        """Delete the files of the sessions in given directory left untouched
+        for longer than sessions last, which have expired by then, as far
+        as possible."""
+        stale = time.time() - ttl
+        with contextlib.suppress(Exception):
+            self._discard(
+                f"{directory}/{entry.name}"
+                for entry in self.backend.scan(directory)
+                if entry.type == "file"
+                and SESSION_FILE.match(entry.name)
+                and entry.mtime < stale
+            )
+
+    def abort(self, session):
+        """Discard the file assembled so far."""
+        self.received(session)
+        self._discard([session.temp, session.received_map])
+
+
+def session_serializer(secret_key):
+    return token_serializer(secret_key, salt="upload-session")
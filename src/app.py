@@ -2,13 +2,24 @@ from apispec import APISpec
 from apispec.ext.marshmallow import MarshmallowPlugin
 from apispec_plugins.webframeworks.flask import FlaskPlugin
 from apispec_ui.flask import Swagger
-from flask import Blueprint, Flask, redirect, url_for
+from flask import Blueprint, Flask, redirect, request, url_for
 from werkzeug.exceptions import HTTPException
 
 from src import __meta__, __version__, utils
+from src.api.auth import AuthAPI, AuthCache
+from src.api.backends import helper
+from src.api.filesystem import FilesystemAPI
+from src.api.listings import ListingCache
+from src.resources.archive import blueprint as archive
+from src.resources.auth import blueprint as auth
+from src.resources.batch import blueprint as batch
 from src.resources.filesystem import blueprint as filesystem
+from src.resources.metrics import blueprint as metrics
+from src.resources.uploads import blueprint as uploads
 from src.settings import oas
 from src.settings.env import config_class, load_dotenv
+from src.utils import profiling, timing
+from src.utils.metrics import middleware, registry
 
 
 def create_app(config_name="development", dotenv=True, configs=None):
@@ -34,9 +45,49 @@ def setup_app(app):
 
     # initial blueprint wiring
     index = Blueprint("index", __name__)
+    index.register_blueprint(auth)
     index.register_blueprint(filesystem)
+    index.register_blueprint(batch)
+    index.register_blueprint(archive)
+    index.register_blueprint(uploads)
+    index.register_blueprint(metrics)
     app.register_blueprint(index, url_prefix=url_prefix)
 
+    # metrics of the requests, aggregated across the processes of the server
+    registry.configure(
+        directory=app.config["METRICS_DIR"], interval=app.config["METRICS_INTERVAL"]
+    )
+    app.wsgi_app = middleware(app.wsgi_app)
+
+    @app.before_request
+    def label_endpoint():
+        request.environ["filexplorer.endpoint"] = request.endpoint
+
+    # phases of the requests, in the Server-Timing HTTP header and slow log
+    app.before_request(timing.start)
+    app.after_request(timing.report)
+
+    # profiles of some requests, with no hooks at all unless enabled
+    if app.config["PROFILING_DIR"]:
+        app.before_request(profiling.start)
+        app.teardown_request(profiling.stop)
+
+    # cache of authentications
+    AuthAPI.cache = AuthCache(
+        ttl=app.config["AUTH_CACHE_TTL"],
+        negative_ttl=app.config["AUTH_CACHE_NEGATIVE_TTL"],
+        maxsize=app.config["AUTH_CACHE_SIZE"],
+    )
+
+    # cache of directory listings
+    FilesystemAPI.listings = ListingCache(
+        ttl=app.config["LISTING_CACHE_TTL"],
+        maxsize=app.config["LISTING_CACHE_SIZE"],
+    )
+
+    # helper processes of the helper backend
+    helper.pool.idle_timeout = app.config["HELPER_IDLE_TIMEOUT"]
+
     # base template for OpenAPI specs
     oas.converter = oas.create_spec_converter(openapi_version)
 
@@ -48,18 +99,33 @@ def setup_app(app):
             "description": __meta__["summary"],
         },
         servers=[oas.Server(url=url_prefix, description=app.config["ENV"])],
-        auths=[oas.AuthSchemes.BasicAuth],
+        auths=[oas.AuthSchemes.BasicAuth, oas.AuthSchemes.BearerAuth],
         tags=[
+            oas.Tag(
+                name="auth",
+                description="Access tokens for bearer authentication",
+            ),
             oas.Tag(
                 name="filesystem",
                 description="CRUD operations over files in the current filesystem",
-            )
+            ),
+            oas.Tag(
+                name="uploads",
+                description="Resumable uploads of files in chunks",
+            ),
+            oas.Tag(
+                name="metrics",
+                description="Metrics of the service, in the Prometheus text format",
+            ),
         ],
         responses=[
             utils.http_response(code=400, serialize=False),
             utils.http_response(code=401, serialize=False),
             utils.http_response(code=403, serialize=False),
             utils.http_response(code=404, serialize=False),
+            utils.http_response(code=411, serialize=False),
+            utils.http_response(code=412, serialize=False),
+            utils.http_response(code=416, serialize=False),
         ],
     )
 
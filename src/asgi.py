@@ -0,0 +1,182 @@
+import asyncio
+import contextvars
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import ClientDisconnected
+
+from src.app import create_app
+from src.utils import ChunksFile
+
+__all__ = ("create_asgi_app", "ASGIApp")
+
+
+def create_asgi_app(config_name="development", dotenv=True, configs=None):
+    """Create a new app served over ASGI, e.g. with
+    ``uvicorn --factory src.asgi:create_asgi_app``."""
+    app = create_app(config_name=config_name, dotenv=dotenv, configs=configs)
+    return ASGIApp(app, threads=app.config["ASGI_THREADS"])
+
+
+class ASGIApp:
+    """Serve a WSGI app on asyncio. The app runs in a pool of threads that
+    are held while it works on a request, reading its body included, or on
+    the next chunk of its response, but not while the client receives
+    them, so that slow downloads take no more than a coroutine each. The
+    app reads bodies synchronously, so slow uploads hold a thread each,
+    as they do a worker when served over WSGI."""
+
+    def __init__(self, app, threads=64):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="asgi"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"unsupported scope type '{scope['type']}'")
+
+        loop = asyncio.get_running_loop()
+        # the same context all along, as responses may depend on it lazily
+        context = contextvars.copy_context()
+
+        def run(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        body = RequestBody(receive, loop)
+        status = {}
+
+        def start_response(status_line, headers, exc_info=None):
+            status.update(code=int(status_line.split(" ", 1)[0]), headers=headers)
+
+        iterable = await run(self.app, environ(scope, body), start_response)
+        disconnected = None
+        try:
+            chunks = iter(iterable)
+            # headers may be set as late as the first chunk is produced
+            chunk = await run(next, chunks, None)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": status["code"],
+                    "headers": [
+                        (name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in status["headers"]
+                    ],
+                }
+            )
+            # no more content is produced for clients that went away
+            disconnected = body.watch_disconnect()
+            while chunk is not None and not disconnected.done():
+                if chunk:
+                    message = {"type": "http.response.body", "body": chunk}
+                    await send({**message, "more_body": True})
+                chunk = await run(next, chunks, None)
+            if not disconnected.done():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            if disconnected is not None:
+                disconnected.cancel()
+            if hasattr(iterable, "close"):
+                await run(iterable.close)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def environ(scope, body):
+    """WSGI environment of the request in an HTTP scope."""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": latin1(root_path),
+        "PATH_INFO": latin1(path),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        # bodies of unknown length are read up to their end
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name, value = name.decode("latin-1").upper(), value.decode("latin-1")
+        if name in ("CONTENT-TYPE", "CONTENT-LENGTH"):
+            key = name.replace("-", "_")
+        else:
+            key = f"HTTP_{name.replace('-', '_')}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def latin1(path):
+    """Decoded path as WSGI holds it, in the bytes of its UTF-8 encoding."""
+    return path.encode("utf-8").decode("latin-1")
+
+
+class RequestBody(ChunksFile):
+    """File object reading the body of a request from the thread of the app,
+    receiving each part of it from the event loop as it is needed, which
+    blocks the thread until the part arrives."""
+
+    def __init__(self, receive, loop):
+        super().__init__(self._receive())
+        self.receive = receive
+        self.loop = loop
+        self.complete = False
+
+    def readline(self, size=-1):
+        while b"\n" not in self.buffer and not 0 <= size <= len(self.buffer):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        end = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        if 0 <= size < end:
+            end = size
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def _receive(self):
+        """Yield the parts of the body as they are received, until the last
+        one or until what is left of it is discarded."""
+        while not self.complete:
+            future = asyncio.run_coroutine_threadsafe(self.receive(), self.loop)
+            message = future.result()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnected()
+            self.complete = not message.get("more_body", False)
+            yield message.get("body", b"")
+
+    def watch_disconnect(self):
+        """Future done once the client goes away. What is left of the body
+        is discarded, as the response is started by then."""
+        self.complete = True
+
+        async def watch():
+            while (await self.receive())["type"] != "http.disconnect":
+                pass
+
+        return asyncio.ensure_future(watch())
@@ -0,0 +1,98 @@
+from flask import Blueprint, current_app, request
+from flask_restful import Api, Resource
+
+from src import utils
+from src.api.filesystem import FilesystemAPI
+from src.resources.auth import current_username, requires_auth
+from src.resources.filesystem import archive_compression
+
+blueprint = Blueprint("archive", __name__, url_prefix="/filesystem:archive")
+api = Api(blueprint)
+
+
+@api.resource("", endpoint="archive")
+class Archive(Resource):
+    @requires_auth(schemes=["basic", "bearer"])
+    def post(self):
+        """
+        Download many files and directories as a single archive.
+        ---
+        tags:
+            - filesystem
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        requestBody:
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        required: [paths]
+                        properties:
+                            paths:
+                                type: array
+                                items:
+                                    type: string
+                                description: >
+                                    paths to archive, each under its name
+                            format:
+                                type: string
+                                enum: [tar, zip]
+                            compression:
+                                type: string
+                                enum: [gzip, none]
+                                description: >
+                                    compression of tar archives; when omitted,
+                                    gzip is used unless excluded by the
+                                    Accept-Encoding HTTP header
+                            level:
+                                type: integer
+                                minimum: 0
+                                maximum: 9
+                                description: compression level
+        responses:
+            200:
+                description: Ok
+                content:
+                    application/octet-stream:
+                        schema:
+                            type: string
+                            format: binary
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+        """
+        body = request.get_json(silent=True)
+        paths = body.get("paths") if isinstance(body, dict) else None
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+            utils.abort_with(code=400, message="missing paths")
+        paths = [utils.normpath(path) for path in paths]
+        fs_api = FilesystemAPI(
+            username=current_username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        supported_paths = fs_api.supported_paths()
+        if not all(any(path.startswith(p) for p in supported_paths) for path in paths):
+            utils.abort_with(code=400, message="unsupported path")
+
+        try:
+            level = body.get("level", current_app.config["ARCHIVE_COMPRESSION_LEVEL"])
+            if not isinstance(level, int):
+                raise ValueError("unsupported compression level")
+            name, content = fs_api.archive(
+                paths,
+                format=body.get("format", "tar"),
+                compression=body.get("compression") or archive_compression(),
+                level=level,
+            )
+            return utils.send_stream(content, filename=name)
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
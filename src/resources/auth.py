@@ -1,11 +1,15 @@
 from functools import wraps
 
-from flask import g, request
-from flask_restful import abort
+from flask import Blueprint, current_app, g, jsonify, request
+from flask_restful import Api, Resource, abort
 from werkzeug.local import LocalProxy
 
 from src.api.auth import AuthAPI
+from src import utils
+from src.utils import timing
 
+blueprint = Blueprint("auth", __name__, url_prefix="/auth")
+api = Api(blueprint)
 
 # proxy to get username from g
 current_username = LocalProxy(lambda: g.username)
@@ -18,18 +22,75 @@ def requires_auth(schemes=("basic",)):
     def wrapper(func):
         @wraps(func)
         def decorated(*args, **kwargs):
-            if "basic" in schemes:
-                auth = request.authorization
-                if auth and AuthAPI.authenticate(
-                    username=auth.username, password=auth.password
-                ):
-                    g.username = auth.username
-                    return func(*args, **kwargs)
-            elif "bearer" in schemes:
-                raise NotImplementedError
+            with timing.phase("auth"):
+                username = authenticate(schemes)
+            if username:
+                g.username = username
+                return func(*args, **kwargs)
 
             abort(401, code=401, reason="Unauthorized")
 
         return decorated
 
     return wrapper
+
+
+def authenticate(schemes):
+    """Get the username of the request authorization, if valid for one
+    of the given schemes."""
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    scheme = scheme.lower()
+    if "basic" in schemes and scheme == "basic":
+        auth = request.authorization
+        if auth and AuthAPI.authenticate(
+            username=auth.username, password=auth.password
+        ):
+            return auth.username
+    elif "bearer" in schemes and scheme == "bearer":
+        secret_key = current_app.config["SECRET_KEY"]
+        # no token is valid without a key to sign them
+        if secret_key:
+            return AuthAPI.verify_token(credentials.strip(), secret_key=secret_key)
+    return None
+
+
+@api.resource("/token", endpoint="token")
+class Token(Resource):
+    @requires_auth(schemes=["basic"])
+    def post(self):
+        """
+        Create a short-lived access token for bearer authentication.
+        ---
+        tags:
+            - auth
+        security:
+            - BasicAuth: []
+        responses:
+            200:
+                description: Ok
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                access_token:
+                                    type: string
+                                token_type:
+                                    type: string
+                                expires_in:
+                                    type: integer
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+        """
+        ttl = current_app.config["TOKEN_TTL"]
+        try:
+            token = AuthAPI.create_token(
+                username=str(current_username),
+                secret_key=current_app.config["SECRET_KEY"],
+                ttl=ttl,
+            )
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+        return jsonify(access_token=token, token_type="Bearer", expires_in=ttl)
@@ -0,0 +1,119 @@
+import dataclasses
+import json
+
+from flask import Blueprint, Response, current_app, request
+from flask_restful import Api, Resource
+
+from src import utils
+from src.api.filesystem import FilesystemAPI
+from src.resources.auth import current_username, requires_auth
+from src.resources.filesystem import error_code
+
+blueprint = Blueprint("batch", __name__, url_prefix="/filesystem:batch")
+api = Api(blueprint)
+
+# status of each operation when successful
+SUCCESS_CODES = {"ls": 200, "stat": 200, "delete": 204, "mkdir": 201}
+
+
+@api.resource("", endpoint="batch")
+class Batch(Resource):
+    @requires_auth(schemes=["basic", "bearer"])
+    def post(self):
+        """
+        Run many operations over files in one request.
+        ---
+        tags:
+            - filesystem
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        requestBody:
+            content:
+                application/json:
+                    schema:
+                        type: array
+                        items:
+                            type: object
+                            required: [op, path]
+                            properties:
+                                op:
+                                    type: string
+                                    enum: [ls, stat, delete, mkdir]
+                                path:
+                                    type: string
+                                details:
+                                    type: boolean
+                                    description: list entries with details
+        responses:
+            200:
+                description: >
+                    Ok, with the status of each operation, one JSON document
+                    per line, in order of the operations and sent as soon as
+                    each of them and the ones before it are done
+                content:
+                    application/x-ndjson:
+                        schema:
+                            type: object
+                            properties:
+                                index:
+                                    type: integer
+                                op:
+                                    type: string
+                                path:
+                                    type: string
+                                code:
+                                    type: integer
+                                reason:
+                                    type: string
+                                message:
+                                    type: string
+                                result:
+                                    description: >
+                                        listing of ls, or status of stat
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+        """
+        operations = request.get_json(silent=True)
+        if not isinstance(operations, list):
+            utils.abort_with(code=400, message="invalid operations")
+        if len(operations) > current_app.config["BATCH_MAX_OPERATIONS"]:
+            utils.abort_with(code=400, message="too many operations")
+
+        fs_api = FilesystemAPI(
+            username=current_username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        outcomes = fs_api.batch(
+            operations,
+            paths=fs_api.supported_paths(),
+            workers=current_app.config["BATCH_WORKERS"],
+        )
+
+        def generate():
+            for index, (result, error) in enumerate(outcomes):
+                line = {"index": index, **describe(operations[index])}
+                if error:
+                    status = utils.http_response(error_code(error), message=str(error))
+                else:
+                    status = utils.http_response(SUCCESS_CODES[line["op"]])
+                    status["result"] = serialize_result(result)
+                yield json.dumps({**line, **status}) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+
+def describe(operation):
+    """Name and path of an operation, as given."""
+    if not isinstance(operation, dict):
+        return {"op": None, "path": None}
+    return {"op": operation.get("op"), "path": operation.get("path")}
+
+
+def serialize_result(result):
+    if isinstance(result, list):
+        return [serialize_result(item) for item in result]
+    if dataclasses.is_dataclass(result):
+        return dataclasses.asdict(result)
+    return result
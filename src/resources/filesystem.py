@@ -1,8 +1,17 @@
-from flask import Blueprint, jsonify, request, send_file
+import dataclasses
+import json
+import os
+from urllib.parse import urlencode
+
+from flask import Blueprint, Response, current_app, jsonify, request
 from flask_restful import Api, Resource
+from werkzeug.datastructures import FileStorage
+from werkzeug.http import is_resource_modified, parse_content_range_header
+from werkzeug.utils import secure_filename
 from http.client import HTTPException
 
 from src import utils
+from src.utils import multipart, timing
 from src.api.filesystem import FilesystemAPI
 from src.resources.auth import current_username, requires_auth
 
@@ -12,7 +21,7 @@ api = Api(blueprint)
 
 @api.resource("/<path:path>", endpoint="filesystem")
 class Filesystem(Resource):
-    @requires_auth(schemes=["basic"])
+    @requires_auth(schemes=["basic", "bearer"])
     def get(self, path):
         """
         List files in given path.
@@ -24,23 +33,124 @@ class Filesystem(Resource):
             type: string
           required: true
           description: the path to list content from
+        - in: query
+          name: details
+          schema:
+            type: boolean
+          allowEmptyValue: true
+          description: >
+            list entries with the type, size, permissions, owner,
+            modification time and symlink target of each file
+        - in: query
+          name: sort
+          schema:
+            type: string
+            enum: [name, -name, mtime, -mtime, size, -size]
+          description: >
+            key to sort listings by, in descending order if prefixed with "-";
+            ties are ordered by name
+        - in: query
+          name: limit
+          schema:
+            type: integer
+            minimum: 1
+          description: >
+            maximum number of entries in a page of a listing; the Link HTTP
+            header points to the next page, if any
+        - in: query
+          name: cursor
+          schema:
+            type: string
+          description: position of a page of a listing, as given in Link headers
+        - in: query
+          name: compression
+          schema:
+            type: string
+            enum: [gzip, none]
+          description: >
+            compression of directory archives; when omitted, gzip is used
+            unless excluded by the Accept-Encoding HTTP header
+        - in: query
+          name: level
+          schema:
+            type: integer
+            minimum: 0
+            maximum: 9
+          description: compression level of directory archives
+        - in: header
+          name: Range
+          schema:
+            type: string
+          description: byte ranges of a file to get, e.g. bytes=0-1023
         tags:
             - filesystem
         security:
             - BasicAuth: []
+            - BearerAuth: []
         responses:
             200:
                 description: Ok
+                headers:
+                    ETag:
+                        schema:
+                            type: string
+                    Link:
+                        description: link to the next page of a listing
+                        schema:
+                            type: string
+                    Last-Modified:
+                        schema:
+                            type: string
                 content:
                     application/json:
                         schema:
                             type: array
                             items:
-                                type: string
+                                oneOf:
+                                    - type: string
+                                    - type: object
+                                      properties:
+                                        name:
+                                            type: string
+                                        type:
+                                            type: string
+                                            enum: [file, directory, symlink,
+                                                block-device, char-device,
+                                                fifo, socket, unknown]
+                                        size:
+                                            type: integer
+                                        mode:
+                                            type: integer
+                                        owner:
+                                            type: string
+                                        mtime:
+                                            type: number
+                                        target:
+                                            type: string
+                                            nullable: true
+                    application/x-ndjson:
+                        schema:
+                            type: string
+                            description: >
+                                entries, one JSON document per line, in the
+                                order the directory is read unless sorted
+                    application/octet-stream:
+                        schema:
+                            type: string
+                            format: binary
+            304:
+                description: Not Modified
+            206:
+                description: Partial Content
+                content:
                     application/octet-stream:
                         schema:
                             type: string
                             format: binary
+                    multipart/byteranges:
+                        schema:
+                            type: string
+                            format: binary
             400:
                 $ref: "#/components/responses/BadRequest"
             401:
@@ -49,21 +159,36 @@ class Filesystem(Resource):
                 $ref: "#/components/responses/Forbidden"
             404:
                 $ref: "#/components/responses/NotFound"
+            416:
+                $ref: "#/components/responses/RequestedRangeNotSatisfiable"
         """
         path = utils.normpath(path)
         username = current_username
-        fs_api = FilesystemAPI(username=username)
-        if not any(path.startswith(p) for p in fs_api.supported_paths()):
+        fs_api = FilesystemAPI(
+            username=username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        if not is_supported(fs_api, path):
             utils.abort_with(code=400, message="unsupported path")
         try:
             accept = request.headers.get("accept", "application/json")
             if accept == "application/json":
-                return jsonify(fs_api.ls(path=path))
+                if query_flag("details") or is_paginated():
+                    return send_listing(fs_api, path, details=query_flag("details"))
+                if request.method == "HEAD":
+                    # the length of a listing is only known by listing it,
+                    # so it is left out, unlike its validators
+                    stats = fs_api.stat(path=path)
+                    empty = Response(iter(()), mimetype=accept)
+                    return conditional(stats, lambda: empty)
+                stats, names = fs_api.listing(path=path)
+                return conditional(stats, lambda: json_response(names))
+            elif accept == "application/x-ndjson":
+                return send_ndjson(fs_api, path, details=query_flag("details"))
             elif accept == "application/octet-stream":
-                stats = fs_api.ls(path=path, flags="-dlL")[0]
-                mode = utils.file_mode(stats=stats)
-                name, content = fs_api.attachment(path=path, mode=mode)
-                return send_file(content, attachment_filename=name, as_attachment=True)
+                stats = fs_api.stat(path=path)
+                if utils.isfile(stats.mode):
+                    return conditional(stats, lambda: send_file(fs_api, path, stats))
+                return send_archive(fs_api, path, stats)
             raise HTTPException("unsupported 'accept' HTTP header")
 
         except PermissionError as ex:
@@ -73,10 +198,10 @@ class Filesystem(Resource):
         except Exception as ex:
             utils.abort_with(code=400, message=str(ex))
 
-    @requires_auth(schemes=["basic"])
+    @requires_auth(schemes=["basic", "bearer"])
     def post(self, path):
         """
-        Create files in given path.
+        Create files in given path, or copy or move the file in given path.
         ---
         parameters:
         - in: path
@@ -84,11 +209,27 @@ class Filesystem(Resource):
           schema:
             type: string
           required: true
-          description: the directory to create the resource at
+          description: >
+            the directory to create the resource at, the file to create
+            for raw content, or the file to copy or move
+        - in: query
+          name: op
+          schema:
+            type: string
+            enum: [copy, move]
+          description: >
+            copy or move the file in the path to the one given by "to",
+            which must not exist, rather than creating files
+        - in: query
+          name: to
+          schema:
+            type: string
+          description: the path to copy or move the file to
         tags:
             - filesystem
         security:
             - BasicAuth: []
+            - BearerAuth: []
         requestBody:
             content:
                 multipart/form-data:
@@ -101,6 +242,11 @@ class Filesystem(Resource):
                                 items:
                                     type: file
                                     description: file to create
+                application/octet-stream:
+                    schema:
+                        type: string
+                        format: binary
+                        description: content of the file to create at the path
         responses:
             201:
                 content:
@@ -108,6 +254,30 @@ class Filesystem(Resource):
                         schema:
                             "$ref": "#/components/schemas/HttpResponse"
 
+            207:
+                description: >
+                    Multi-Status, when only some of the files failed to be
+                    written, with the status of each file
+                content:
+                    application/json:
+                        schema:
+                            allOf:
+                                - "$ref": "#/components/schemas/HttpResponse"
+                                - type: object
+                                  properties:
+                                    files:
+                                        type: array
+                                        items:
+                                            type: object
+                                            properties:
+                                                name:
+                                                    type: string
+                                                code:
+                                                    type: integer
+                                                reason:
+                                                    type: string
+                                                message:
+                                                    type: string
             400:
                 $ref: "#/components/responses/BadRequest"
             401:
@@ -119,17 +289,16 @@ class Filesystem(Resource):
         """
         path = utils.normpath(path)
         username = current_username
-        fs_api = FilesystemAPI(username=username)
-        if not any(path.startswith(p) for p in fs_api.supported_paths()):
+        fs_api = FilesystemAPI(
+            username=username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        if not is_supported(fs_api, path):
             utils.abort_with(code=400, message="unsupported path")
 
-        files = request.files.to_dict(flat=False).get("files", [])
-        if not files:
-            utils.abort_with(code=400, message="missing files")
-
         try:
-            fs_api.upload_files(path=path, files=files)
-            return utils.http_response(201), 201
+            if "op" in request.args:
+                return transfer(fs_api, path, op=request.args["op"])
+            return upload(fs_api, path, update=False)
         except PermissionError as ex:
             utils.abort_with(code=403, message=str(ex))
         except FileNotFoundError as ex:
@@ -137,7 +306,7 @@ class Filesystem(Resource):
         except Exception as ex:
             utils.abort_with(code=400, message=str(ex))
 
-    @requires_auth(schemes=["basic"])
+    @requires_auth(schemes=["basic", "bearer"])
     def put(self, path):
         """
         Update files in given path.
@@ -148,11 +317,14 @@ class Filesystem(Resource):
           schema:
             type: string
           required: true
-          description: the directory to update the resource at
+          description: >
+            the directory to update the resource at, or the file to update
+            for raw content
         tags:
             - filesystem
         security:
             - BasicAuth: []
+            - BearerAuth: []
         requestBody:
             content:
                 multipart/form-data:
@@ -165,6 +337,11 @@ class Filesystem(Resource):
                                 items:
                                     type: file
                                     description: file to update
+                application/octet-stream:
+                    schema:
+                        type: string
+                        format: binary
+                        description: content of the file to update at the path
         responses:
             204:
                 content:
@@ -172,6 +349,30 @@ class Filesystem(Resource):
                         schema:
                             "$ref": "#/components/schemas/HttpResponse"
 
+            207:
+                description: >
+                    Multi-Status, when only some of the files failed to be
+                    written, with the status of each file
+                content:
+                    application/json:
+                        schema:
+                            allOf:
+                                - "$ref": "#/components/schemas/HttpResponse"
+                                - type: object
+                                  properties:
+                                    files:
+                                        type: array
+                                        items:
+                                            type: object
+                                            properties:
+                                                name:
+                                                    type: string
+                                                code:
+                                                    type: integer
+                                                reason:
+                                                    type: string
+                                                message:
+                                                    type: string
             400:
                 $ref: "#/components/responses/BadRequest"
             401:
@@ -183,17 +384,105 @@ class Filesystem(Resource):
         """
         path = utils.normpath(path)
         username = current_username
-        fs_api = FilesystemAPI(username=username)
-        if not any(path.startswith(p) for p in fs_api.supported_paths()):
+        fs_api = FilesystemAPI(
+            username=username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        if not is_supported(fs_api, path):
             utils.abort_with(code=400, message="unsupported path")
 
-        files = request.files.to_dict(flat=False).get("files", [])
-        if not files:
-            utils.abort_with(code=400, message="missing files")
+        try:
+            return upload(fs_api, path, update=True)
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+
+    @requires_auth(schemes=["basic", "bearer"])
+    def patch(self, path):
+        """
+        Write a byte range of the file in given path, or append to it.
+        ---
+        parameters:
+        - in: path
+          name: path
+          schema:
+            type: string
+          required: true
+          description: the path of the file
+        - in: header
+          name: Content-Range
+          schema:
+            type: string
+          description: >
+            byte range to write, e.g. bytes 1024-2047/*, which may extend
+            the file; content is appended when omitted
+        - in: header
+          name: If-Match
+          schema:
+            type: string
+          description: write only if the file still has one of these ETags
+        tags:
+            - filesystem
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        requestBody:
+            content:
+                application/octet-stream:
+                    schema:
+                        type: string
+                        format: binary
+                        description: content of the byte range
+        responses:
+            204:
+                description: No Content, with the ETag of the written file
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+            411:
+                $ref: "#/components/responses/LengthRequired"
+            412:
+                $ref: "#/components/responses/PreconditionFailed"
+            416:
+                $ref: "#/components/responses/RequestedRangeNotSatisfiable"
+        """
+        path = utils.normpath(path)
+        username = current_username
+        fs_api = FilesystemAPI(
+            username=username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        if not is_supported(fs_api, path):
+            utils.abort_with(code=400, message="unsupported path")
 
         try:
-            fs_api.upload_files(path=path, files=files, update=True)
-            return utils.http_response(204), 204
+            stats = fs_api.stat(path=path)
+            if not utils.isfile(stats.mode):
+                raise ValueError("unsupported file mode")
+            if request.if_match and not request.if_match.contains(utils.etag(stats)):
+                return utils.http_response(412, message="file was modified"), 412
+            # the length is checked before any content is written
+            if request.content_length is None:
+                return utils.http_response(411, message="missing length"), 411
+            offset, length = written_range(stats)
+            if offset is None:
+                fs_api.append(path, request.stream, length=length)
+            elif offset > stats.size:
+                # writing past the end would leave a hole in the file
+                return Response(
+                    status=416, headers={"Content-Range": f"bytes */{stats.size}"}
+                )
+            else:
+                fs_api.write_range(path, request.stream, offset=offset, length=length)
+            response = Response(status=204)
+            response.set_etag(utils.etag(fs_api.stat(path=path)))
+            return response
         except PermissionError as ex:
             utils.abort_with(code=403, message=str(ex))
         except FileNotFoundError as ex:
@@ -201,7 +490,7 @@ class Filesystem(Resource):
         except Exception as ex:
             utils.abort_with(code=400, message=str(ex))
 
-    @requires_auth(schemes=["basic"])
+    @requires_auth(schemes=["basic", "bearer"])
     def delete(self, path):
         """
         Delete file in given path.
@@ -217,6 +506,7 @@ class Filesystem(Resource):
             - filesystem
         security:
             - BasicAuth: []
+            - BearerAuth: []
         responses:
             204:
                 content:
@@ -235,8 +525,10 @@ class Filesystem(Resource):
         """
         path = utils.normpath(path)
         username = current_username
-        fs_api = FilesystemAPI(username=username)
-        if not any(path.startswith(p) for p in fs_api.supported_paths()):
+        fs_api = FilesystemAPI(
+            username=username, backend=current_app.config["FILESYSTEM_BACKEND"]
+        )
+        if not is_supported(fs_api, path):
             utils.abort_with(code=400, message="unsupported path")
 
         try:
@@ -250,6 +542,263 @@ class Filesystem(Resource):
             utils.abort_with(code=400, message=str(ex))
 
 
+def upload(fs_api, path, update=False):
+    """Upload the files in the body of the request as it is read, responding
+    with the status of each file if only some of them failed to be written,
+    or else raising the error of the first."""
+    code = 204 if update else 201
+    directory, files = uploaded_files(path)
+    if not is_supported(fs_api, directory):
+        raise ValueError("unsupported path")
+    filenames, errors = fs_api.upload_stream(
+        path=directory,
+        files=files,
+        update=update,
+        workers=current_app.config["UPLOAD_WORKERS"],
+    )
+    if not filenames:
+        raise ValueError("missing files")
+    if not errors:
+        return utils.http_response(code), code
+    if len(errors) == len(filenames):
+        raise next(iter(errors.values()))
+
+    response = utils.http_response(207, message="some files failed to be written")
+    response["files"] = []
+    for name in filenames:
+        error = errors.get(name)
+        if error:
+            status = utils.http_response(error_code(error), message=str(error))
+        else:
+            status = utils.http_response(code)
+        response["files"].append({"name": name, **status})
+    return response, 207
+
+
+def transfer(fs_api, path, op):
+    """Copy or move the file in given path to the one in the query string,
+    with no content going through the client."""
+    to = request.args.get("to")
+    if not to:
+        raise ValueError("missing destination")
+    to = utils.normpath(to)
+    if not is_supported(fs_api, to):
+        raise ValueError("unsupported path")
+    if op == "copy":
+        fs_api.copy(path, to)
+    elif op == "move":
+        fs_api.move(path, to)
+    else:
+        raise ValueError("unsupported operation")
+    return utils.http_response(201), 201
+
+
+def written_range(stats):
+    """Offset and length of the content to write into a file, given by
+    the Content-Range HTTP header or else appended to the file, in which
+    case there is no offset."""
+    header = request.headers.get("Content-Range")
+    if header is None:
+        return None, request.content_length
+    content_range = parse_content_range_header(header)
+    if content_range is None or content_range.units != "bytes":
+        raise ValueError("invalid range")
+    length = content_range.stop - content_range.start
+    if request.content_length != length:
+        raise ValueError("content length does not match range")
+    if content_range.length not in (None, max(stats.size, content_range.stop)):
+        raise ValueError("invalid range")
+    return content_range.start, length
+
+
+def uploaded_files(path):
+    """Directory to upload files to, along with an iterator over the files
+    read from the body of the request as it arrives: the raw content of
+    the file in given path, or else the parts of a form."""
+    if request.mimetype == "application/octet-stream":
+        filename = os.path.basename(path)
+        if secure_filename(filename) != filename:
+            raise ValueError("unsupported file name")
+        return os.path.dirname(path), [FileStorage(request.stream, filename=filename)]
+    boundary = request.mimetype_params.get("boundary")
+    if request.mimetype != "multipart/form-data" or not boundary:
+        raise ValueError("missing files")
+    parts = multipart.parts(request.stream, boundary=boundary)
+    return path, (part for part in parts if part.name == "files")
+
+
+def is_supported(fs_api, path):
+    """Whether the path is under one of the supported paths."""
+    with timing.phase("paths"):
+        return any(path.startswith(p) for p in fs_api.supported_paths())
+
+
+def json_response(data):
+    with timing.phase("serialize"):
+        return jsonify(data)
+
+
+def error_code(ex):
+    """HTTP status code of the error of a filesystem operation."""
+    if isinstance(ex, PermissionError):
+        return 403
+    if isinstance(ex, FileNotFoundError):
+        return 404
+    return 400
+
+
+def conditional(stats, send):
+    """Respond with ``send()`` along with validators derived from the status
+    of the file, or with 304 Not Modified if the client has it already."""
+    etag, last_modified = utils.etag(stats), utils.last_modified(stats)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = send()
+    else:
+        response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+def send_listing(fs_api, path, details=False):
+    """Send a sorted listing, a page at a time if a limit is given. Entries
+    change without their directory being modified, hence these listings
+    have no validators."""
+    entries, cursor = listing_page(fs_api, path)
+    with timing.phase("serialize"):
+        response = jsonify([serialize_entry(entry, details) for entry in entries])
+    set_next_link(response, cursor)
+    return response
+
+
+def send_ndjson(fs_api, path, details=False):
+    """Stream a listing, one JSON document per line. Unless sorted or
+    paginated, entries are sent as the directory is read, so memory stays
+    constant regardless of the size of the directory."""
+    cursor = None
+    if is_paginated():
+        entries, cursor = listing_page(fs_api, path)
+    else:
+        entries = fs_api.scan(path)
+
+    def generate():
+        # lines are sent in chunks rather than one write each
+        buffer = []
+        size = 0
+        for entry in entries:
+            line = json.dumps(serialize_entry(entry, details)) + "\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= utils.CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        yield "".join(buffer)
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    set_next_link(response, cursor)
+    return response
+
+
+def listing_page(fs_api, path):
+    return fs_api.page(
+        path,
+        limit=request.args.get("limit", type=int),
+        cursor=request.args.get("cursor"),
+        sort=request.args.get("sort", default="name"),
+    )
+
+
+def serialize_entry(entry, details=False):
+    return dataclasses.asdict(entry) if details else entry.name
+
+
+def set_next_link(response, cursor):
+    """Point the Link HTTP header to the page of a listing at given cursor."""
+    if cursor:
+        args = {**request.args.to_dict(), "cursor": cursor}
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+
+
+def send_file(fs_api, path, stats):
+    """Send a file, or the byte ranges of it requested."""
+    filename = os.path.basename(path)
+    if request.method == "HEAD":
+        return utils.send_stream((), filename=filename, length=stats.size)
+    if byte_ranges_requested(stats):
+        ranges = utils.byte_ranges(request.range, length=stats.size)
+        if not ranges:
+            return Response(
+                status=416, headers={"Content-Range": f"bytes */{stats.size}"}
+            )
+        # each range is read by a process of its own, so past a few of them
+        # the whole file is sent instead
+        if len(ranges) <= current_app.config["MAX_BYTE_RANGES"]:
+            return utils.send_ranges(
+                lambda start, stop: fs_api.read(
+                    path, offset=start, length=stop - start
+                ),
+                ranges,
+                filename=filename,
+                length=stats.size,
+            )
+    content = fs_api.read(path)
+    return utils.send_stream(content, filename=filename, length=stats.size)
+
+
+def send_archive(fs_api, path, stats):
+    """Send an archive of a directory. Archives have no validators, as their
+    content changes with any of the files archived."""
+    compression = archive_compression()
+    if request.method == "HEAD":
+        name = fs_api.attachment_name(path, mode=stats.mode, compression=compression)
+        return utils.send_stream((), filename=name)
+    name, content = fs_api.attachment(
+        path=path,
+        mode=stats.mode,
+        compression=compression,
+        level=request.args.get(
+            "level",
+            default=current_app.config["ARCHIVE_COMPRESSION_LEVEL"],
+            type=int,
+        ),
+    )
+    return utils.send_stream(content, filename=name)
+
+
+def byte_ranges_requested(stats):
+    """Whether byte ranges are requested and, per the If-Range HTTP header,
+    still apply to the file."""
+    if request.range is None or request.range.units != "bytes":
+        return False
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == utils.etag(stats)
+    if if_range.date:
+        return if_range.date >= utils.last_modified(stats)
+    return True
+
+
+def is_paginated():
+    return any(arg in request.args for arg in ("sort", "limit", "cursor"))
+
+
+def query_flag(name):
+    """Whether a flag is set in the query string, e.g. ``?details``
+    or ``?details=true``."""
+    value = request.args.get(name)
+    return value is not None and value.lower() not in ("0", "false", "no")
+
+
+def archive_compression():
+    """Compression for directory archives, from the query string or else
+    from the Accept-Encoding HTTP header."""
+    compression = request.args.get("compression")
+    if compression:
+        return compression
+    encodings = request.accept_encodings
+    return "gzip" if not encodings or encodings["gzip"] else "none"
+
+
 @api.resource("/supported-paths", endpoint="supported-paths")
 class SupportedPaths(Resource):
     def get(self):
@@ -0,0 +1,26 @@
+from flask import Blueprint, Response
+from flask_restful import Api, Resource
+
+from src.utils import metrics
+
+blueprint = Blueprint("metrics", __name__, url_prefix="/metrics")
+api = Api(blueprint)
+
+
+@api.resource("", endpoint="metrics")
+class Metrics(Resource):
+    def get(self):
+        """
+        Metrics of the service, aggregated across its processes.
+        ---
+        tags:
+            - metrics
+        responses:
+            200:
+                description: Ok, in the Prometheus text format
+                content:
+                    text/plain:
+                        schema:
+                            type: string
+        """
+        return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,400 @@
+from flask import Blueprint, current_app, request
+from flask_restful import Api, Resource
+from werkzeug.http import parse_content_range_header
+
+from src import utils
+from src.api.uploads import UploadsAPI
+from src.resources.auth import current_username, requires_auth
+
+blueprint = Blueprint("uploads", __name__, url_prefix="/uploads")
+api = Api(blueprint)
+
+
+@api.resource("", endpoint="uploads")
+class Uploads(Resource):
+    @requires_auth(schemes=["basic", "bearer"])
+    def post(self):
+        """
+        Start the upload of a file in chunks.
+        ---
+        tags:
+            - uploads
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        requestBody:
+            content:
+                application/json:
+                    schema:
+                        type: object
+                        required: [path, size]
+                        properties:
+                            path:
+                                type: string
+                                description: the file to create or update
+                            size:
+                                type: integer
+                                description: size of the file in bytes
+                            chunk_size:
+                                type: integer
+                                description: size of each chunk but the last
+                            update:
+                                type: boolean
+                                description: whether to update an existing file
+        responses:
+            201:
+                description: Created
+                headers:
+                    Location:
+                        description: the upload session
+                        schema:
+                            type: string
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                id:
+                                    type: string
+                                path:
+                                    type: string
+                                size:
+                                    type: integer
+                                chunk_size:
+                                    type: integer
+                                chunks:
+                                    type: integer
+                                update:
+                                    type: boolean
+                                expires:
+                                    type: integer
+                                received:
+                                    type: array
+                                    description: >
+                                        byte ranges received, as start
+                                        and stop offsets
+                                    items:
+                                        type: array
+                                        items:
+                                            type: integer
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get("path"), str):
+            utils.abort_with(code=400, message="missing path")
+        path = utils.normpath(body["path"])
+        uploads_api = UploadsAPI(
+            username=current_username,
+            backend=current_app.config["FILESYSTEM_BACKEND"],
+        )
+        if not any(path.startswith(p) for p in uploads_api.supported_paths()):
+            utils.abort_with(code=400, message="unsupported path")
+
+        try:
+            size = body.get("size")
+            chunk_size = body.get("chunk_size", current_app.config["UPLOAD_CHUNK_SIZE"])
+            if not all(isinstance(n, int) for n in (size, chunk_size)):
+                raise ValueError("invalid size")
+            session_id, session = uploads_api.create(
+                path=path,
+                size=size,
+                chunk_size=chunk_size,
+                update=bool(body.get("update")),
+                secret_key=current_app.config["SECRET_KEY"],
+                ttl=current_app.config["UPLOAD_SESSION_TTL"],
+            )
+            location = api.url_for(Upload, session_id=session_id)
+            return (
+                serialize_session(session_id, session, received=[]),
+                201,
+                {"Location": location},
+            )
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+
+
+@api.resource("/<string:session_id>", endpoint="upload")
+class Upload(Resource):
+    @requires_auth(schemes=["basic", "bearer"])
+    def get(self, session_id):
+        """
+        Get the status of an upload, along with the byte ranges received.
+        ---
+        parameters:
+        - in: path
+          name: session_id
+          schema:
+            type: string
+          required: true
+          description: the upload session
+        tags:
+            - uploads
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        responses:
+            200:
+                description: Ok
+                content:
+                    application/json:
+                        schema:
+                            type: object
+                            properties:
+                                id:
+                                    type: string
+                                path:
+                                    type: string
+                                size:
+                                    type: integer
+                                chunk_size:
+                                    type: integer
+                                chunks:
+                                    type: integer
+                                update:
+                                    type: boolean
+                                expires:
+                                    type: integer
+                                received:
+                                    type: array
+                                    description: >
+                                        byte ranges received, as start
+                                        and stop offsets
+                                    items:
+                                        type: array
+                                        items:
+                                            type: integer
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+        """
+        uploads_api, session = upload_session(session_id)
+        try:
+            received = uploads_api.received(session)
+            return serialize_session(session_id, session, received=received), 200
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+
+    @requires_auth(schemes=["basic", "bearer"])
+    def put(self, session_id):
+        """
+        Upload a chunk of a file. Chunks may be uploaded in any order and
+        concurrently.
+        ---
+        parameters:
+        - in: path
+          name: session_id
+          schema:
+            type: string
+          required: true
+          description: the upload session
+        - in: query
+          name: chunk
+          schema:
+            type: integer
+            minimum: 0
+          description: index of the chunk, unless given by Content-Range
+        - in: header
+          name: Content-Range
+          schema:
+            type: string
+          description: byte range of the chunk, e.g. bytes 0-1023/4096
+        tags:
+            - uploads
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        requestBody:
+            content:
+                application/octet-stream:
+                    schema:
+                        type: string
+                        format: binary
+                        description: content of the chunk
+        responses:
+            204:
+                content:
+                    application/json:
+                        schema:
+                            "$ref": "#/components/schemas/HttpResponse"
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+        """
+        uploads_api, session = upload_session(session_id)
+        try:
+            uploads_api.write_chunk(session, chunk_index(session), request.stream)
+            return utils.http_response(204), 204
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+
+    @requires_auth(schemes=["basic", "bearer"])
+    def post(self, session_id):
+        """
+        Commit an upload once all of its chunks are received, moving the
+        file into place.
+        ---
+        parameters:
+        - in: path
+          name: session_id
+          schema:
+            type: string
+          required: true
+          description: the upload session
+        tags:
+            - uploads
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        responses:
+            201:
+                content:
+                    application/json:
+                        schema:
+                            "$ref": "#/components/schemas/HttpResponse"
+            204:
+                content:
+                    application/json:
+                        schema:
+                            "$ref": "#/components/schemas/HttpResponse"
+            400:
+                $ref: "#/components/responses/BadRequest"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+        """
+        uploads_api, session = upload_session(session_id)
+        try:
+            uploads_api.commit(session)
+            code = 204 if session.update else 201
+            return utils.http_response(code), code
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+
+    @requires_auth(schemes=["basic", "bearer"])
+    def delete(self, session_id):
+        """
+        Abort an upload, discarding the chunks received, even once expired.
+        ---
+        parameters:
+        - in: path
+          name: session_id
+          schema:
+            type: string
+          required: true
+          description: the upload session
+        tags:
+            - uploads
+        security:
+            - BasicAuth: []
+            - BearerAuth: []
+        responses:
+            204:
+                content:
+                    application/json:
+                        schema:
+                            "$ref": "#/components/schemas/HttpResponse"
+            401:
+                $ref: "#/components/responses/Unauthorized"
+            403:
+                $ref: "#/components/responses/Forbidden"
+            404:
+                $ref: "#/components/responses/NotFound"
+        """
+        # expired sessions are aborted too, for their files not to be left
+        uploads_api, session = upload_session(session_id, expired=True)
+        try:
+            uploads_api.abort(session)
+            return utils.http_response(204), 204
+        except PermissionError as ex:
+            utils.abort_with(code=403, message=str(ex))
+        except FileNotFoundError as ex:
+            utils.abort_with(code=404, message=str(ex))
+        except Exception as ex:
+            utils.abort_with(code=400, message=str(ex))
+
+
+def upload_session(session_id, expired=False):
+    """API of the current user along with the upload session of given
+    identifier, aborting if it is not one of theirs or, unless ``expired``
+    is set, if it expired."""
+    uploads_api = UploadsAPI(
+        username=current_username,
+        backend=current_app.config["FILESYSTEM_BACKEND"],
+    )
+    try:
+        session = uploads_api.session(
+            session_id, secret_key=current_app.config["SECRET_KEY"], expired=expired
+        )
+    except PermissionError as ex:
+        utils.abort_with(code=403, message=str(ex))
+    except FileNotFoundError as ex:
+        utils.abort_with(code=404, message=str(ex))
+    except Exception as ex:
+        utils.abort_with(code=400, message=str(ex))
+    return uploads_api, session
+
+
+def chunk_index(session):
+    """Index of the chunk in the request, given by its byte range in the
+    Content-Range HTTP header or else by the query string."""
+    header = request.headers.get("Content-Range")
+    if header is not None:
+        content_range = parse_content_range_header(header)
+        if content_range is None or content_range.units != "bytes":
+            raise ValueError("invalid chunk")
+        if content_range.length not in (None, session.size):
+            raise ValueError("invalid chunk")
+        return session.chunk_at(content_range.start, content_range.stop)
+    index = request.args.get("chunk", type=int)
+    if index is None:
+        raise ValueError("missing chunk")
+    return index
+
+
+def serialize_session(session_id, session, received):
+    return {
+        "id": session_id,
+        "path": session.path,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "chunks": session.chunks,
+        "update": session.update,
+        "expires": session.expires,
+        "received": received,
+    }
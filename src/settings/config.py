@@ -19,6 +19,64 @@ class BaseConfig:
     # supported queryable paths
     SUPPORTED_PATHS = env.list("SUPPORTED_PATHS", [])
 
+    # key signing access tokens, shared by all the instances
+    SECRET_KEY = env.str("SECRET_KEY", None)
+
+    # seconds access tokens are valid for
+    TOKEN_TTL = env.int("TOKEN_TTL", 900)
+
+    # seconds successful and failed authentications are cached for
+    AUTH_CACHE_TTL = env.int("AUTH_CACHE_TTL", 300)
+    AUTH_CACHE_NEGATIVE_TTL = env.int("AUTH_CACHE_NEGATIVE_TTL", 5)
+
+    # maximum number of cached authentications
+    AUTH_CACHE_SIZE = env.int("AUTH_CACHE_SIZE", 1024)
+
+    # backend running filesystem operations: shell, helper or fsuid
+    FILESYSTEM_BACKEND = env.str("FILESYSTEM_BACKEND", "shell")
+
+    # seconds an idle helper process is kept around
+    HELPER_IDLE_TIMEOUT = env.int("HELPER_IDLE_TIMEOUT", 300)
+
+    # byte ranges of a download served at most, the whole file if more
+    MAX_BYTE_RANGES = env.int("MAX_BYTE_RANGES", 16)
+
+    # seconds directory listings are cached for at most, and how many
+    LISTING_CACHE_TTL = env.int("LISTING_CACHE_TTL", 60)
+    LISTING_CACHE_SIZE = env.int("LISTING_CACHE_SIZE", 1024)
+
+    # files of an upload written concurrently
+    UPLOAD_WORKERS = env.int("UPLOAD_WORKERS", 4)
+
+    # seconds upload sessions are valid for, and their default chunk size
+    UPLOAD_SESSION_TTL = env.int("UPLOAD_SESSION_TTL", 86400)
+    UPLOAD_CHUNK_SIZE = env.int("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024)
+
+    # operations of a batch run concurrently, and how many a batch holds
+    BATCH_WORKERS = env.int("BATCH_WORKERS", 8)
+    BATCH_MAX_OPERATIONS = env.int("BATCH_MAX_OPERATIONS", 1000)
+
+    # gzip level (0-9) for directory archives
+    ARCHIVE_COMPRESSION_LEVEL = env.int("ARCHIVE_COMPRESSION_LEVEL", 6)
+
+    # threads running requests when served over ASGI
+    ASGI_THREADS = env.int("ASGI_THREADS", 64)
+
+    # directory each server process dumps its metrics to, for them to be
+    # aggregated across processes, and seconds between dumps
+    METRICS_DIR = env.str("METRICS_DIR", None)
+    METRICS_INTERVAL = env.int("METRICS_INTERVAL", 5)
+
+    # seconds above which requests are logged with the duration of their
+    # phases, if any
+    SLOW_REQUEST_THRESHOLD = env.float("SLOW_REQUEST_THRESHOLD", 2.0)
+
+    # directory requests are profiled to, if any, when sampled 1 in every
+    # given number (0 for none) or asked for by one of the given users
+    PROFILING_DIR = env.str("PROFILING_DIR", None)
+    PROFILING_SAMPLE_RATE = env.int("PROFILING_SAMPLE_RATE", 0)
+    PROFILING_USERS = env.list("PROFILING_USERS", [])
+
 
 @dataclass
 class ProductionConfig(BaseConfig):
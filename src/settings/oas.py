@@ -40,6 +40,11 @@ class AuthSchemes:
         type: str = "http"
         scheme: str = "basic"
 
+    @dataclass
+    class BearerAuth:
+        type: str = "http"
+        scheme: str = "bearer"
+
 
 def create_spec_converter(openapi_version):
     return OpenAPIConverter(
@@ -1,32 +1,55 @@
+import mimetypes
 import os
+import shlex
 import stat
 import subprocess
+import time
+import unicodedata
+import uuid
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import quote
 
+from flask import Response, request
 from flask_restful import abort
 from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.wsgi import FileWrapper, wrap_file
 
 from src.schemas.serlializers.http import HttpResponseSchema
 from src.settings import oas
+from src.utils import metrics, timing
 
 
 def normpath(path):
     return os.path.normpath(f"/{path.strip('/')}")
 
 
-def shell(cmd, universal_newlines=True, **kwargs):
-    user = kwargs.pop("user", None)
-    if user:
-        cmd = f"sudo -u {user} {cmd}"
-    popen = subprocess.Popen(
-        cmd.split(),
-        stdin=kwargs.pop("stdin", subprocess.PIPE),
-        stdout=kwargs.pop("stdout", subprocess.PIPE),
-        stderr=kwargs.pop("stderr", subprocess.PIPE),
-        universal_newlines=universal_newlines,
-        **kwargs,
-    )
+# size of the chunks read from streamed processes
+CHUNK_SIZE = 64 * 1024
+
+
+def sudo(cmd, user=None):
+    return f"sudo -u {shlex.quote(user)} {cmd}" if user else cmd
+
 
-    stdout, stderr = popen.communicate()
+def command(cmd):
+    """Name of the program a command runs, as measured."""
+    return os.path.basename(cmd.split(maxsplit=1)[0]) if cmd.strip() else ""
+
+
+def shell(cmd, universal_newlines=True, **kwargs):
+    name = command(cmd)
+    cmd = sudo(cmd, user=kwargs.pop("user", None))
+    with metrics.timed(metrics.subprocess_duration, name), timing.phase(name):
+        popen = subprocess.Popen(
+            shlex.split(cmd),
+            stdin=kwargs.pop("stdin", subprocess.PIPE),
+            stdout=kwargs.pop("stdout", subprocess.PIPE),
+            stderr=kwargs.pop("stderr", subprocess.PIPE),
+            universal_newlines=universal_newlines,
+            **kwargs,
+        )
+        stdout, stderr = popen.communicate()
     if popen.returncode > 0:
         raise subprocess.CalledProcessError(
             returncode=popen.returncode, cmd=cmd, stderr=stderr
@@ -34,6 +57,107 @@ def shell(cmd, universal_newlines=True, **kwargs):
     return stdout
 
 
+def stream(cmd, chunk_size=CHUNK_SIZE, **kwargs):
+    """Lazily yield the stdout of a command in chunks of at most ``chunk_size``
+    bytes. The process blocks on a full pipe while the consumer is not reading,
+    so memory stays bounded regardless of the output size."""
+    name, start = command(cmd), time.perf_counter()
+    cmd = sudo(cmd, user=kwargs.pop("user", None))
+    popen = subprocess.Popen(
+        shlex.split(cmd),
+        stdin=kwargs.pop("stdin", subprocess.DEVNULL),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **kwargs,
+    )
+
+    try:
+        while True:
+            chunk = popen.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+        stderr = popen.stderr.read().decode(errors="replace")
+        if popen.wait() > 0:
+            raise subprocess.CalledProcessError(
+                returncode=popen.returncode, cmd=cmd, stderr=stderr
+            )
+    finally:
+        # consumer went away before the end of the stream
+        if popen.poll() is None:
+            popen.kill()
+            popen.wait()
+        popen.stdout.close()
+        popen.stderr.close()
+        duration = time.perf_counter() - start
+        metrics.subprocess_duration.observe(duration, name)
+        timing.record(name, duration)
+
+
+def feed(cmd, file, chunk_size=CHUNK_SIZE, **kwargs):
+    """Run a command writing the content of a file object to its stdin as it
+    is read, in chunks of at most ``chunk_size`` bytes, so that the content
+    is never held in memory nor spooled as a whole."""
+    name = command(cmd)
+    cmd = sudo(cmd, user=kwargs.pop("user", None))
+    with metrics.timed(metrics.subprocess_duration, name), timing.phase(name):
+        popen = subprocess.Popen(
+            shlex.split(cmd),
+            stdin=subprocess.PIPE,
+            stdout=kwargs.pop("stdout", subprocess.DEVNULL),
+            stderr=subprocess.PIPE,
+            **kwargs,
+        )
+
+        with popen.stderr:
+            try:
+                with popen.stdin:
+                    for chunk in iter(lambda: file.read(chunk_size), b""):
+                        popen.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # exited early, which its status tells about
+            except BaseException:
+                popen.kill()
+                popen.wait()
+                raise
+            stderr = popen.stderr.read().decode(errors="replace")
+
+        if popen.wait() > 0:
+            raise subprocess.CalledProcessError(
+                returncode=popen.returncode, cmd=cmd, stderr=stderr
+            )
+
+
+class ChunksFile:
+    """File object reading from an iterator over chunks of bytes, taking
+    only as many of them as each read needs."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        size = len(self.buffer) if size < 0 else size
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def compress(chunks, level=zlib.Z_DEFAULT_COMPRESSION):
+    """Lazily gzip given chunks of bytes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 def isfile(mode):
     return stat.S_ISREG(mode or 0)
 
@@ -42,17 +166,123 @@ def isdir(mode):
     return stat.S_ISDIR(mode or 0)
 
 
-def file_mode(stats):
-    """Return first character from a stat string like '-rwx'."""
-    if not stats or not isinstance(stats, str):
-        return None
-    permissions = next(iter(stats.split()), "")
-    char = next(iter(permissions), None)
-    if char == "-":
-        return stat.S_IFREG
-    elif char == "d":
-        return stat.S_IFDIR
-    return 0
+def etag(stats):
+    """Entity tag derived from the inode, size and modification time of a file."""
+    return f"{stats.ino:x}-{stats.size:x}-{int(stats.mtime * 10**6):x}"
+
+
+def last_modified(stats):
+    return datetime.fromtimestamp(int(stats.mtime), tz=timezone.utc)
+
+
+def byte_ranges(range_, length):
+    """Resolve the ranges of a Range HTTP header against the length of the
+    content, as sorted (start, stop) tuples. Unsatisfiable ranges are left
+    out and overlapping or adjacent ones are coalesced."""
+    ranges = []
+    for start, stop in range_.ranges:
+        if start < 0:
+            start, stop = max(length + start, 0), length
+        else:
+            stop = length if stop is None else min(stop, length)
+        if start < stop:
+            ranges.append((start, stop))
+    coalesced = []
+    for start, stop in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1]:
+            coalesced[-1] = (coalesced[-1][0], max(stop, coalesced[-1][1]))
+        else:
+            coalesced.append((start, stop))
+    return coalesced
+
+
+def send_stream(chunks, filename, length=None):
+    """Send given chunks of bytes as an attachment named after ``filename``.
+    Wrapped files are handed to the server, which may send them with sendfile.
+    Byte ranges are accepted when the length of the content is known."""
+    if isinstance(chunks, FileWrapper):
+        chunks = wrap_file(request.environ, chunks.file, buffer_size=CHUNK_SIZE)
+    response = Response(chunks, mimetype=mimetype(filename), direct_passthrough=True)
+    if length is not None:
+        response.content_length = length
+        response.accept_ranges = "bytes"
+    set_attachment(response, filename)
+    return response
+
+
+def send_ranges(read, ranges, filename, length):
+    """Send byte ranges of the content of a file as a partial content, in
+    a multipart body for multiple ranges. Each range is only read, with
+    ``read(start, stop)``, when it is reached."""
+    content_type = mimetype(filename)
+    if len(ranges) == 1:
+        ((start, stop),) = ranges
+        response = Response(
+            read(start, stop), 206, mimetype=content_type, direct_passthrough=True
+        )
+        response.content_length = stop - start
+        response.headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+    else:
+        boundary = uuid.uuid4().hex
+        headers = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{length}\r\n\r\n"
+            ).encode()
+            for start, stop in ranges
+        ]
+        end = f"--{boundary}--\r\n".encode()
+
+        def generate():
+            for header, (start, stop) in zip(headers, ranges):
+                yield header
+                yield from read(start, stop)
+                yield b"\r\n"
+            yield end
+
+        response = Response(
+            generate(),
+            206,
+            mimetype=f"multipart/byteranges; boundary={boundary}",
+            direct_passthrough=True,
+        )
+        response.content_length = len(end) + sum(
+            len(header) + stop - start + 2
+            for header, (start, stop) in zip(headers, ranges)
+        )
+    response.accept_ranges = "bytes"
+    set_attachment(response, filename)
+    return response
+
+
+# types of compressed files, which mimetypes reports as encodings
+COMPRESSED_TYPES = {
+    "gzip": "application/gzip",
+    "bzip2": "application/x-bzip2",
+    "xz": "application/x-xz",
+}
+
+
+def mimetype(filename):
+    type_, encoding = mimetypes.guess_type(filename)
+    if encoding in COMPRESSED_TYPES:
+        return COMPRESSED_TYPES[encoding]
+    return type_ or "application/octet-stream"
+
+
+def set_attachment(response, filename):
+    """Set the Content-Disposition HTTP header of an attachment."""
+    try:
+        filename.encode("ascii")
+        options = {"filename": filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename)
+        options = {
+            "filename": simple.encode("ascii", "ignore").decode("ascii"),
+            "filename*": f"UTF-8''{quote(filename, safe='')}",
+        }
+    response.headers.set("Content-Disposition", "attachment", **options)
 
 
 def http_response(code: int, message="", serialize=True, **kwargs):
@@ -0,0 +1,74 @@
+import functools
+import tarfile
+import time
+import zipfile
+
+from src.utils import CHUNK_SIZE, ChunksFile
+
+__all__ = ("tar_to_zip",)
+
+# earliest modification time zip archives can hold
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def tar_to_zip(chunks, level=6):
+    """Lazily convert a tar archive, given in chunks of bytes, into a zip
+    archive of the same directories and regular files, deflated with given
+    level unless 0. Members are read from the tar archive as the zip
+    archive is consumed, so memory stays bounded regardless of their size.
+    Members other than directories and regular files are left out."""
+    sink = Sink()
+    compression = zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED
+    options = {"compresslevel": level} if level else {}
+    tar = tarfile.open(fileobj=ChunksFile(chunks), mode="r|")
+    with zipfile.ZipFile(sink, mode="w", compression=compression, **options) as zf:
+        for member in tar:
+            if not (member.isdir() or member.isreg()):
+                continue
+            name = f"{member.name}/" if member.isdir() else member.name
+            info = zipfile.ZipInfo(name, date_time=date_time(member.mtime))
+            info.external_attr = (member.mode | tar_type(member)) << 16
+            if member.isdir():
+                zf.writestr(info, b"")
+                yield from sink.drain()
+                continue
+
+            info.compress_type = compression
+            # the size is known upfront, which tells whether zip64 is needed
+            info.file_size = member.size
+            content = tar.extractfile(member)
+            with zf.open(info, mode="w") as dst:
+                for chunk in iter(functools.partial(content.read, CHUNK_SIZE), b""):
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def date_time(mtime):
+    return max(ZIP_EPOCH, time.localtime(mtime)[:6])
+
+
+def tar_type(member):
+    """File type bits of a tar member, as held in zip archives."""
+    return 0o040000 if member.isdir() else 0o100000
+
+
+class Sink:
+    """Unseekable file object holding what is written until drained."""
+
+    def __init__(self):
+        self.buffer = []
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Yield what was written since last drained, if anything."""
+        data, self.buffer = b"".join(self.buffer), []
+        if data:
+            yield data
@@ -0,0 +1,361 @@
+import bisect
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+
+__all__ = (
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "registry",
+    "middleware",
+    "timed",
+)
+
+# upper bounds of the buckets of histograms of durations, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Registry:
+    """Metrics of the current process. When given a directory, each process
+    dumps its samples there, every ``interval`` seconds, to be aggregated
+    with the ones of the other processes of the server when rendered."""
+
+    def __init__(self):
+        self.metrics = []
+        self.directory = None
+        self.interval = 5
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def configure(self, directory=None, interval=5):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+
+    def start(self):
+        """Dump samples periodically from this process, if not already.
+        Processes forked from this one start on their own."""
+        if not self.directory or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._dump_periodically, daemon=True)
+            thread.start()
+
+    def _dump_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            with contextlib.suppress(OSError):
+                self.dump()
+
+    def snapshot(self) -> dict:
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def dump(self):
+        """Write the samples of this process, replacing the previous ones."""
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        temp = f"{path}.tmp"
+        with open(temp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp, path)
+
+    def collect(self) -> dict:
+        """Samples of every process, or of this one only if no directory is
+        given. Gauges of processes no longer running are left out, while
+        their counters and histograms still add up."""
+        if not self.directory:
+            return {name: [values] for name, values in self.snapshot().items()}
+        self.dump()
+        collected = {metric.name: [] for metric in self.metrics}
+        for filename in os.listdir(self.directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != ".json":
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            running = is_running(int(pid))
+            for metric in self.metrics:
+                if metric.kind != "gauge" or running:
+                    collected[metric.name].append(snapshot.get(metric.name, []))
+        return collected
+
+    def render(self) -> str:
+        """Samples of every process in the Prometheus text format."""
+        collected = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render(collected[metric.name]))
+        return "\n".join(lines) + "\n"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, snapshots) -> dict:
+        merged = {}
+        for snapshot in snapshots:
+            for key, value in snapshot:
+                key = tuple(key)
+                merged[key] = self.add(merged[key], value) if key in merged else value
+        return merged
+
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+    def render(self, snapshots):
+        for key, value in sorted(self.merge(snapshots).items()):
+            yield f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Histogram whose values are the count of each bucket, followed by
+    the sum and the count of the observations."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        super().__init__(name, documentation, labels=labels)
+        self.buckets = buckets
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            values = self.values.get(labels)
+            if values is None:
+                values = self.values[labels] = [0] * (len(self.buckets) + 3)
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @staticmethod
+    def add(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def render(self, snapshots):
+        bounds = [*self.buckets, math.inf]
+        for key, values in sorted(self.merge(snapshots).items()):
+            cumulative = 0
+            for bound, count in zip(bounds, values):
+                cumulative += count
+                labels = format_labels((*self.labels, "le"), (*key, bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {format_value(values[-2])}"
+            yield f"{self.name}_count{labels} {values[-1]}"
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape(format_value(v))}"' for name, v in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "+Inf" if value == math.inf else repr(value)
+    return str(value)
+
+
+def escape(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextlib.contextmanager
+def timed(histogram, *labels):
+    """Observe the duration of the block with given labels."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+registry = Registry()
+
+request_duration = registry.register(
+    Histogram(
+        "filexplorer_http_request_duration_seconds",
+        "Duration of HTTP requests, until their response is sent.",
+        labels=("endpoint", "method", "code"),
+    )
+)
+requests_in_flight = registry.register(
+    Gauge(
+        "filexplorer_http_requests_in_flight",
+        "HTTP requests being served.",
+        labels=("method",),
+    )
+)
+received_bytes = registry.register(
+    Counter(
+        "filexplorer_http_received_bytes_total",
+        "Bytes read from the bodies of HTTP requests.",
+    )
+)
+sent_bytes = registry.register(
+    Counter(
+        "filexplorer_http_sent_bytes_total",
+        "Bytes sent in the bodies of HTTP responses.",
+    )
+)
+subprocess_duration = registry.register(
+    Histogram(
+        "filexplorer_subprocess_duration_seconds",
+        "Duration of the subprocesses spawned, by command.",
+        labels=("command",),
+    )
+)
+auth_duration = registry.register(
+    Histogram(
+        "filexplorer_auth_duration_seconds",
+        "Duration of PAM authentications, by result.",
+        labels=("result",),
+    )
+)
+filesystem_errors = registry.register(
+    Counter(
+        "filexplorer_filesystem_errors_total",
+        "Errors of filesystem operations, by exception type.",
+        labels=("type",),
+    )
+)
+
+
+def middleware(app):
+    """Wrap a WSGI app so that its requests are measured, up to the end of
+    their responses. File wrappers are left as they are, for the server to
+    send them as it can, with their length taken from the headers."""
+
+    def wrapper(environ, start_response):
+        registry.start()
+        start = time.perf_counter()
+        method = environ.get("REQUEST_METHOD", "")
+        status = {}
+
+        def measured_start_response(status_line, headers, exc_info=None):
+            status["code"] = status_line.split(" ", 1)[0]
+            status["length"] = next(
+                (v for k, v in headers if k.lower() == "content-length"), None
+            )
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            requests_in_flight.dec(method)
+            endpoint = environ.get("filexplorer.endpoint") or ""
+            duration = time.perf_counter() - start
+            request_duration.observe(duration, endpoint, method, status.get("code", ""))
+
+        if "wsgi.input" in environ:
+            environ["wsgi.input"] = CountedInput(environ["wsgi.input"])
+        requests_in_flight.inc(method)
+        try:
+            iterable = app(environ, measured_start_response)
+        except BaseException:
+            status["code"] = "500"
+            finish()
+            raise
+
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(file_wrapper, type) and isinstance(iterable, file_wrapper):
+            sent_bytes.inc(amount=int(status.get("length") or 0))
+            finish()
+            return iterable
+        return CountedResponse(iterable, finish)
+
+    return wrapper
+
+
+class CountedInput:
+    """Body of a request counting the bytes read from it."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        received_bytes.inc(amount=len(data))
+        return data
+
+    def readline(self, *args):
+        data = self.stream.readline(*args)
+        received_bytes.inc(amount=len(data))
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+class CountedResponse:
+    """Body of a response counting the bytes sent, calling ``finish``
+    once closed."""
+
+    def __init__(self, iterable, finish):
+        self.iterable = iterable
+        self.finish = finish
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            sent_bytes.inc(amount=len(chunk))
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, "close"):
+                self.iterable.close()
+        finally:
+            self.finish()
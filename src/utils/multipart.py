@@ -0,0 +1,60 @@
+from werkzeug.sansio.multipart import (
+    Data,
+    Epilogue,
+    File,
+    MultipartDecoder,
+    NeedData,
+    Preamble,
+)
+
+from src.utils import CHUNK_SIZE, ChunksFile
+
+__all__ = ("Part", "parts")
+
+
+class Part(ChunksFile):
+    """File part of a multipart body, whose content is read from the body
+    as it arrives."""
+
+    def __init__(self, name, filename, headers, chunks):
+        super().__init__(chunks)
+        self.name = name
+        self.filename = filename
+        self.headers = headers
+
+
+def parts(stream, boundary, chunk_size=CHUNK_SIZE):
+    """Lazily yield the file parts of a multipart body read from a stream in
+    chunks of ``chunk_size`` bytes. Parts are to be read in order, whatever
+    is left unread of a part being skipped once the next one is taken.
+    Other parts are skipped altogether."""
+    events = _events(MultipartDecoder(boundary.encode()), stream, chunk_size)
+    for event in events:
+        chunks = _data(events)
+        if isinstance(event, File):
+            yield Part(event.name, event.filename, event.headers, chunks)
+        for _ in chunks:
+            pass
+
+
+def _events(decoder, stream, chunk_size):
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            # an empty read completes the body, truncated or not
+            decoder.receive_data(stream.read(chunk_size) or None)
+        elif isinstance(event, Epilogue):
+            return
+        elif not isinstance(event, Preamble):
+            yield event
+
+
+def _data(events):
+    """Yield the content of the current part."""
+    for event in events:
+        if not isinstance(event, Data):
+            raise ValueError("invalid multipart body")
+        if event.data:
+            yield event.data
+        if not event.more_data:
+            return
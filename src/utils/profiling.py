@@ -0,0 +1,58 @@
+import cProfile
+import os
+import random
+import re
+import time
+import uuid
+
+from flask import current_app, g, request
+
+from src.resources.auth import authenticate
+
+__all__ = ("HEADER", "start", "stop")
+
+# header with which authorized users ask for their request to be profiled
+HEADER = "X-Profile"
+
+
+def start():
+    """Profile the request, up to its response, if asked for by one of the
+    authorized users or else sampled."""
+    if not selected():
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return  # another profiler is active in this thread
+    g.profiler = profiler
+
+
+def stop(exc=None):
+    """Write the profile of the request, if any, in the pstats format."""
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    directory = current_app.config["PROFILING_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename())
+    profiler.dump_stats(path)
+    current_app.logger.info("request profiled in %s", path)
+
+
+def selected():
+    config = current_app.config
+    if request.headers.get(HEADER):
+        # authentications are cached, so the view does not repeat this one
+        username = authenticate(schemes=("basic", "bearer"))
+        return username is not None and username in config["PROFILING_USERS"]
+    rate = config["PROFILING_SAMPLE_RATE"]
+    return rate > 0 and random.randrange(rate) == 0
+
+
+def filename():
+    """Unique name of the profile of the request, telling when and what."""
+    path = re.sub(r"[^\w.-]+", "_", request.path).strip("_")[:100]
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    return f"{stamp}-{uuid.uuid4().hex[:8]}-{request.method}-{path}.pstats"
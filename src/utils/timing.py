@@ -0,0 +1,86 @@
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+from flask import current_app, g, request
+
+__all__ = ("phase", "record", "start", "report")
+
+# requests slower than configured, one JSON document each
+slow_log = logging.getLogger("filexplorer.slow")
+
+# phases of the request being served, kept in a context variable rather
+# than on ``g`` so that the ones ending as the response is sent still count
+current = contextvars.ContextVar("timings", default=None)
+
+
+class Timings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Time the block as a phase of the request being served, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record(name, duration):
+    timings = current.get()
+    if timings is not None:
+        timings.phases.append((name, duration))
+
+
+def start():
+    current.set(Timings())
+
+
+def report(response):
+    """Report the phases of the request done by now in the Server-Timing
+    HTTP header, and log all of them once the response is sent if the
+    request took longer than the configured threshold."""
+    timings = current.get()
+    if timings is None:
+        return response
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={duration * 1000:.1f}"
+        for name, duration in [*timings.phases, ("total", timings.elapsed())]
+    )
+
+    threshold = current_app.config["SLOW_REQUEST_THRESHOLD"]
+    # the request context is gone by the time the response is closed
+    entry = {
+        "method": request.method,
+        "path": request.path,
+        "user": g.get("username"),
+        "status": response.status_code,
+    }
+
+    def finish():
+        current.set(None)
+        duration = timings.elapsed()
+        if threshold and duration >= threshold:
+            slow_log.warning(json.dumps({**entry, **serialize(timings, duration)}))
+
+    response.call_on_close(finish)
+    return response
+
+
+def serialize(timings, duration):
+    return {
+        "duration_ms": round(duration * 1000, 3),
+        "phases": [
+            {"name": name, "duration_ms": round(spent * 1000, 3)}
+            for name, spent in timings.phases
+        ],
+    }
@@ -15,6 +15,8 @@ def app():
             "SUPPORTED_MEASURABLES": ["foo", "bar"],
             "OPENAPI": "3.0.3",  # default version
             "SUPPORTED_PATHS": ["/tmp"],
+            "SECRET_KEY": "secret",
+            "LISTING_CACHE_SIZE": 0,
         },
     )
     with app.test_request_context():
@@ -1,6 +1,11 @@
+import os
+import pstats
+from base64 import b64encode
+
 import pytest
 
 from src.app import create_app
+from src.utils import profiling
 
 
 @pytest.fixture(scope="function")
@@ -18,6 +23,21 @@ def local_app():
         yield app
 
 
+@pytest.fixture(scope="function")
+def profiling_app(tmp_path):
+    app = create_app(
+        config_name="testing",
+        dotenv=False,
+        configs={
+            "SUPPORTED_PATHS": ["/tmp"],
+            "PROFILING_DIR": str(tmp_path),
+            "PROFILING_USERS": ["admin"],
+        },
+    )
+    with app.app_context():
+        yield app
+
+
 class TestApp:
     def test_can_create_app(self, app):
         """Ensure app is created."""
@@ -52,3 +72,74 @@ class TestApp:
         response = client.get("/invalid")
         assert response.status_code == 404
         assert response.json == {"code": 404, "reason": "Not Found"}
+
+    def test_metrics_returns_200(self, client, mocker):
+        """Ensure app serves the metrics of its requests."""
+        stderr = "stat: cannot statx '/tmp/x': Permission denied"
+        mocker.patch("src.api.auth.AuthAPI.authenticate", return_value=True)
+        popen = mocker.patch("subprocess.Popen")
+        popen.return_value.communicate.return_value = ("", stderr)
+        popen.return_value.returncode = 1
+        auth = {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
+        # measured once closed, as servers do once it is sent
+        client.get("/filesystem/tmp/x", headers=auth).close()
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        lines = response.get_data(as_text=True).splitlines()
+        assert any(
+            line.startswith(
+                "filexplorer_http_request_duration_seconds_count"
+                '{endpoint="filesystem.filesystem",method="GET",code="403"}'
+            )
+            for line in lines
+        )
+        assert any(
+            line.startswith(
+                'filexplorer_filesystem_errors_total{type="PermissionError"}'
+            )
+            for line in lines
+        )
+
+    def test_profiling_is_off_by_default(self, app):
+        """Ensure requests are not hooked unless profiling is enabled."""
+        hooks = app.before_request_funcs.get(None, [])
+        assert profiling.start not in hooks
+
+    def test_profile_asked_for_by_authorized_user(self, profiling_app, mocker):
+        """Ensure the request of an authorized user asking for it is profiled
+        down to its shell commands."""
+        mocker.patch("src.api.auth.AuthAPI.authenticate", return_value=True)
+        popen = mocker.patch("subprocess.Popen")
+        popen.return_value.communicate.return_value = ("", "Permission denied")
+        popen.return_value.returncode = 1
+        client = profiling_app.test_client()
+        credentials = b64encode(b"admin:pass").decode()
+        headers = {"Authorization": f"Basic {credentials}", "X-Profile": "1"}
+        response = client.get("/filesystem/tmp/x", headers=headers)
+        assert response.status_code == 403
+
+        directory = profiling_app.config["PROFILING_DIR"]
+        (profile,) = os.listdir(directory)
+        assert profile.endswith("-GET-filesystem_tmp_x.pstats")
+        stats = pstats.Stats(os.path.join(directory, profile))
+        functions = {name for _, _, name in stats.stats}
+        assert {"decorated", "authenticate", "shell"} <= functions
+
+    def test_profile_asked_for_by_other_user(self, profiling_app, mocker):
+        """Ensure requests of other users are not profiled."""
+        mocker.patch("src.api.auth.AuthAPI.authenticate", return_value=True)
+        client = profiling_app.test_client()
+        credentials = b64encode(b"user:pass").decode()
+        headers = {"Authorization": f"Basic {credentials}", "X-Profile": "1"}
+        client.get("/filesystem/tmp/x", headers=headers)
+        assert os.listdir(profiling_app.config["PROFILING_DIR"]) == []
+
+    def test_profile_sampled_requests(self, profiling_app):
+        """Ensure requests are profiled when sampled."""
+        profiling_app.config["PROFILING_SAMPLE_RATE"] = 1
+        client = profiling_app.test_client()
+        client.get("/filesystem/supported-paths")
+        client.get("/filesystem/supported-paths")
+        assert len(os.listdir(profiling_app.config["PROFILING_DIR"])) == 2
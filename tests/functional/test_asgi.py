@@ -0,0 +1,96 @@
+import asyncio
+from base64 import b64encode
+
+import pytest
+
+from src.api.auth import AuthAPI
+from src.asgi import ASGIApp
+
+
+@pytest.fixture()
+def auth(mocker):
+    mocker.patch.object(AuthAPI, "authenticate", return_value=True)
+    return [(b"authorization", b"Basic " + b64encode(b"user:pass"))]
+
+
+def request(app, method, path, headers=(), body=(b"",), query=b"", disconnect=False):
+    """Run a request through the ASGI app, returning the messages sent."""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": list(headers),
+    }
+    sent = []
+
+    async def run():
+        parts = list(body)
+        gone = asyncio.Event()
+
+        async def receive():
+            if parts:
+                part = parts.pop(0)
+                return {"type": "http.request", "body": part, "more_body": bool(parts)}
+            if not disconnect:
+                await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        await ASGIApp(app, threads=2)(scope, receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+class TestASGI:
+    def test_get(self, app, auth, mocker):
+        mocker.patch("src.utils.shell", side_effect=["41ed:4096:1:0", "file.txt"])
+        start, *body = request(app, "GET", "/filesystem/tmp", headers=auth)
+        assert start["status"] == 200
+        assert (b"content-type", b"application/json") in start["headers"]
+        assert b"".join(m["body"] for m in body) == b'["file.txt"]\n'
+        assert body[-1] == {"type": "http.response.body", "body": b""}
+
+    def test_query_string(self, app):
+        start, *_ = request(app, "GET", "/filesystem/tmp", query=b"limit=x")
+        assert start["status"] == 401
+
+    def test_body_is_read_as_it_arrives(self, app, auth, mocker):
+        feed = mocker.patch("src.utils.feed", side_effect=lambda file, **_: file.read())
+        mocker.patch("src.utils.shell", return_value="")
+        headers = [*auth, (b"content-type", b"application/octet-stream")]
+        parts = (b"te", b"x", b"t")
+        start, *_ = request(app, "POST", "/filesystem/tmp/a.txt", headers, parts)
+        assert start["status"] == 201
+        assert feed.call_args[1]["cmd"].startswith("dd of=/tmp/a.txt ")
+
+    def test_disconnect_stops_the_response(self, app, auth, mocker):
+        produced = []
+
+        def chunks():
+            for i in range(1000):
+                produced.append(i)
+                yield b"x"
+
+        mocker.patch("src.utils.shell", return_value="81a4:1000:1:0")
+        mocker.patch("src.utils.stream", return_value=chunks())
+        headers = [*auth, (b"accept", b"application/octet-stream")]
+        sent = request(app, "GET", "/filesystem/tmp/a.txt", headers, disconnect=True)
+        assert sent[0]["status"] == 200
+        assert len(produced) < 1000
+
+    def test_lifespan(self, app):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        asyncio.run(ASGIApp(app)({"type": "lifespan"}, receive, send))
+        assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
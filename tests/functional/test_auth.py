@@ -0,0 +1,77 @@
+from base64 import b64encode
+
+import pytest
+
+from src.api.auth import AuthAPI
+
+
+@pytest.fixture()
+def auth(mocker):
+    mocker.patch.object(AuthAPI, "authenticate", return_value=True)
+    return {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
+
+
+class TestToken:
+    def test_create_token_returns_200(self, client, auth):
+        response = client.post("/auth/token", headers=auth)
+        assert response.status_code == 200
+        assert response.json["token_type"] == "Bearer"
+        assert response.json["expires_in"] == 900
+        assert AuthAPI.verify_token(response.json["access_token"], "secret") == "user"
+
+    def test_unauthorized_request_returns_401(self, client, mocker):
+        mocker.patch.object(AuthAPI, "authenticate", return_value=False)
+        headers = {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
+        response = client.post("/auth/token", headers=headers)
+        assert response.status_code == 401
+
+    def test_bearer_token_cannot_create_token(self, client):
+        token = AuthAPI.create_token("user", secret_key="secret")
+        response = client.post(
+            "/auth/token", headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 401
+
+    def test_create_token_without_secret_key_returns_400(self, app, client, auth):
+        app.config["SECRET_KEY"] = None
+        try:
+            response = client.post("/auth/token", headers=auth)
+        finally:
+            app.config["SECRET_KEY"] = "secret"
+        assert response.status_code == 400
+        assert response.json["message"] == "missing secret key for signing tokens"
+
+
+class TestBearerAuth:
+    def test_valid_token_returns_200(self, client, mocker):
+        mock = mocker.patch(
+            "src.utils.shell", side_effect=["41ed:4096:1:0", "file.txt"]
+        )
+        token = AuthAPI.create_token("user", secret_key="secret")
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/filesystem/tmp/", headers=headers)
+        assert response.status_code == 200
+        assert response.json == ["file.txt"]
+        mock.assert_called_with("ls /tmp", user="user")
+
+    def test_expired_token_returns_401(self, client, mocker):
+        token = AuthAPI.create_token("user", secret_key="secret", ttl=-1)
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/filesystem/tmp/", headers=headers)
+        assert response.status_code == 401
+
+    def test_invalid_token_returns_401(self, client):
+        token = AuthAPI.create_token("user", secret_key="other")
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("/filesystem/tmp/", headers=headers)
+        assert response.status_code == 401
+
+    def test_token_without_secret_key_returns_401(self, app, client):
+        token = AuthAPI.create_token("user", secret_key="secret")
+        headers = {"Authorization": f"Bearer {token}"}
+        app.config["SECRET_KEY"] = None
+        try:
+            response = client.get("/filesystem/tmp/", headers=headers)
+        finally:
+            app.config["SECRET_KEY"] = "secret"
+        assert response.status_code == 401
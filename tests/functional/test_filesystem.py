@@ -1,5 +1,8 @@
 import io
+import json
 import subprocess
+import tarfile
+import zipfile
 from base64 import b64encode
 
 import pytest
@@ -7,6 +10,12 @@ import pytest
 from src.api.auth import AuthAPI
 
 
+@pytest.fixture(autouse=True)
+def feed(mocker):
+    # files are not written for real
+    return mocker.patch("src.utils.feed")
+
+
 @pytest.fixture()
 def auth(mocker):
     mocker.patch.object(AuthAPI, "authenticate", return_value=True)
@@ -27,11 +36,27 @@ class TestFilesystemGET:
         assert response.status_code == 400
 
     def test_valid_path_returns_200(self, client, auth, mocker):
-        mocker.patch("src.utils.shell", return_value="file.txt")
+        mocker.patch("src.utils.shell", side_effect=["41ed:4096:1:0", "file.txt"])
         response = client.get("/filesystem/tmp/", headers=auth)
         assert response.status_code == 200
         assert response.json == ["file.txt"]
 
+    def test_phases_are_reported(self, app, client, auth, mocker, caplog):
+        mocker.patch("src.utils.shell", side_effect=["41ed:4096:1:0", "file.txt"])
+        mocker.patch.dict(app.config, {"SLOW_REQUEST_THRESHOLD": 1e-9})
+        response = client.get("/filesystem/tmp/", headers=auth)
+        phases = [
+            p.split(";")[0] for p in response.headers["Server-Timing"].split(", ")
+        ]
+        assert phases == ["auth", "paths", "serialize", "total"]
+        assert not caplog.records
+        response.close()
+        entry = json.loads(caplog.records[-1].getMessage())
+        assert entry["path"] == "/filesystem/tmp/"
+        assert entry["user"] == "user"
+        assert entry["status"] == 200
+        assert [p["name"] for p in entry["phases"]] == phases[:-1]
+
     def test_error_path_returns_400(self, client, auth, mocker):
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr="err")
         mocker.patch("src.utils.shell", side_effect=err)
@@ -64,26 +89,286 @@ class TestFilesystemGET:
         }
 
     def test_file_attachment_returns_200(self, client, auth, mocker):
-        mocker.patch("src.utils.shell", side_effect=["file.txt", b""])
-        mocker.patch("src.utils.isfile", return_value=True)
+        mocker.patch("src.utils.shell", return_value="81a4:7:1:0")
+        mocker.patch("src.utils.stream", return_value=iter([b"con", b"tent"]))
         headers = {**auth, "accept": "application/octet-stream"}
         response = client.get("/filesystem/tmp/file.txt", headers=headers)
         assert response.status_code == 200
+        assert response.is_streamed
+        assert response.data == b"content"
+        assert response.headers["Content-Length"] == "7"
+        assert response.headers["Accept-Ranges"] == "bytes"
         assert (
             response.headers["Content-Disposition"] == "attachment; filename=file.txt"
         )
         assert response.headers["Content-Type"] == "text/plain; charset=utf-8"
 
     def test_directory_attachment_returns_200(self, client, auth, mocker):
-        mocker.patch("src.utils.shell", side_effect=["dir/", b""])
-        mocker.patch("src.utils.isdir", return_value=True)
+        mocker.patch("src.utils.shell", return_value="41ed:4096:1:0")
+        mocker.patch("src.utils.stream", return_value=iter([b""]))
         headers = {**auth, "accept": "application/octet-stream"}
         response = client.get("/filesystem/tmp/dir/", headers=headers)
         assert response.status_code == 200
         assert (
             response.headers["Content-Disposition"] == "attachment; filename=dir.tar.gz"
         )
-        assert response.headers["Content-Type"] == "application/x-tar"
+        assert response.headers["Content-Type"] == "application/gzip"
+
+    @pytest.mark.parametrize(
+        "query, encoding, filename",
+        [
+            ("", "gzip, deflate", "dir.tar.gz"),
+            ("", "identity", "dir.tar"),
+            ("?compression=none", "gzip", "dir.tar"),
+            ("?compression=gzip&level=1", "identity", "dir.tar.gz"),
+        ],
+    )
+    def test_directory_attachment_compression(
+        self, client, auth, mocker, query, encoding, filename
+    ):
+        mocker.patch("src.utils.shell", return_value="41ed:4096:1:0")
+        mocker.patch("src.utils.stream", return_value=iter([b"content"]))
+        headers = {
+            **auth,
+            "accept": "application/octet-stream",
+            "accept-encoding": encoding,
+        }
+        response = client.get(f"/filesystem/tmp/dir/{query}", headers=headers)
+        assert response.status_code == 200
+        assert (
+            response.headers["Content-Disposition"]
+            == f"attachment; filename={filename}"
+        )
+
+    def test_directory_attachment_invalid_compression_returns_400(
+        self, client, auth, mocker
+    ):
+        mocker.patch("src.utils.shell", return_value="41ed:4096:1:0")
+        headers = {**auth, "accept": "application/octet-stream"}
+        response = client.get("/filesystem/tmp/dir/?compression=xz", headers=headers)
+        assert response.status_code == 400
+        assert response.json["message"] == "unsupported compression"
+
+    def test_file_range_returns_206(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:10:1:0")
+        mock = mocker.patch("src.utils.stream", return_value=iter([b"345"]))
+        headers = {**auth, "accept": "application/octet-stream", "range": "bytes=3-5"}
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 206
+        assert response.data == b"345"
+        assert response.headers["Content-Range"] == "bytes 3-5/10"
+        assert response.headers["Content-Length"] == "3"
+        mock.assert_called_once_with(
+            "dd if=/tmp/file.txt bs=65536 skip=3 count=3 "
+            "iflag=skip_bytes,count_bytes status=none",
+            user="user",
+        )
+
+    def test_file_multiple_ranges_returns_206(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:10:1:0")
+        mocker.patch("src.utils.stream", side_effect=[iter([b"01"]), iter([b"89"])])
+        headers = {
+            **auth,
+            "accept": "application/octet-stream",
+            "range": "bytes=0-1,-2",
+        }
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 206
+        assert response.mimetype == "multipart/byteranges"
+        boundary = response.mimetype_params["boundary"]
+        assert (
+            response.data
+            == (
+                f"--{boundary}\r\n"
+                "Content-Type: text/plain\r\n"
+                "Content-Range: bytes 0-1/10\r\n\r\n01\r\n"
+                f"--{boundary}\r\n"
+                "Content-Type: text/plain\r\n"
+                "Content-Range: bytes 8-9/10\r\n\r\n89\r\n"
+                f"--{boundary}--\r\n"
+            ).encode()
+        )
+        assert response.headers["Content-Length"] == str(len(response.data))
+
+    def test_too_many_ranges_returns_200(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:40:1:0")
+        mock = mocker.patch("src.utils.stream", return_value=iter([b"0" * 40]))
+        ranges = ",".join(f"{i}-{i}" for i in range(0, 40, 2))
+        headers = {
+            **auth,
+            "accept": "application/octet-stream",
+            "range": f"bytes={ranges}",
+        }
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 200
+        assert response.data == b"0" * 40
+        mock.assert_called_once_with("cat /tmp/file.txt", user="user")
+
+    def test_unsatisfiable_range_returns_416(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:10:1:0")
+        headers = {**auth, "accept": "application/octet-stream", "range": "bytes=10-"}
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == "bytes */10"
+
+    def test_directory_range_is_ignored(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="41ed:4096:1:0")
+        mocker.patch("src.utils.stream", return_value=iter([b"content"]))
+        headers = {**auth, "accept": "application/octet-stream", "range": "bytes=0-1"}
+        response = client.get("/filesystem/tmp/dir/", headers=headers)
+        assert response.status_code == 200
+
+    def test_detailed_listing_returns_200(self, client, auth, mocker):
+        output = b"d\x004096\x00755\x00root\x001\x00\x00tmp\x00"
+        output += b"f\x007\x00644\x00user\x002.5\x00\x00file.txt\x00"
+        mocker.patch("src.utils.stream", return_value=iter([output]))
+        response = client.get("/filesystem/tmp/?details", headers=auth)
+        assert response.status_code == 200
+        assert response.json == [
+            {
+                "name": "file.txt",
+                "type": "file",
+                "size": 7,
+                "mode": 0o644,
+                "owner": "user",
+                "mtime": 2.5,
+                "target": None,
+            }
+        ]
+        assert "ETag" not in response.headers
+
+    def test_paginated_listing_returns_200(self, client, auth, mocker):
+        records = [["d", "4096", "755", "root", "1", "", "tmp"]]
+        records += [["f", "1", "644", "user", "1", "", name] for name in "cab"]
+        output = b"".join(f"{field}\0".encode() for r in records for field in r)
+        mocker.patch("src.utils.stream", side_effect=lambda *_, **__: iter([output]))
+        response = client.get("/filesystem/tmp/?limit=2", headers=auth)
+        assert response.status_code == 200
+        assert response.json == ["a", "b"]
+        link = response.headers["Link"]
+        assert link.startswith("<http://localhost/filesystem/tmp/?limit=2&cursor=")
+        assert link.endswith('>; rel="next"')
+        response = client.get(link[1 : link.index(">")], headers=auth)
+        assert response.json == ["c"]
+        assert "Link" not in response.headers
+
+    def test_ndjson_listing_returns_200(self, client, auth, mocker):
+        records = [["d", "4096", "755", "root", "1", "", "tmp"]]
+        records += [["f", "1", "644", "user", "1", "", name] for name in "ba"]
+        output = b"".join(f"{field}\0".encode() for r in records for field in r)
+        mocker.patch("src.utils.stream", side_effect=lambda *_, **__: iter([output]))
+        headers = {**auth, "accept": "application/x-ndjson"}
+        response = client.get("/filesystem/tmp/", headers=headers)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == "application/x-ndjson"
+        assert response.data == b'"b"\n"a"\n'
+        response = client.get("/filesystem/tmp/?details&sort=name", headers=headers)
+        lines = response.data.decode().splitlines()
+        assert [json.loads(line)["name"] for line in lines] == ["a", "b"]
+        assert json.loads(lines[0])["type"] == "file"
+
+    def test_ndjson_listing_missing_path_returns_404(self, client, auth, mocker):
+        stderr = "find: '/tmp/missing': No such file or directory"
+        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
+        mocker.patch("src.utils.stream", side_effect=err)
+        headers = {**auth, "accept": "application/x-ndjson"}
+        response = client.get("/filesystem/tmp/missing", headers=headers)
+        assert response.status_code == 404
+
+    def test_listing_sets_validators(self, client, auth, mocker):
+        mocker.patch(
+            "src.utils.shell", side_effect=["41ed:4096:1:1666000000", "file.txt"]
+        )
+        response = client.get("/filesystem/tmp/", headers=auth)
+        assert response.status_code == 200
+        assert response.headers["ETag"] == '"1-1000-5eb37da322000"'
+        assert response.headers["Last-Modified"] == "Mon, 17 Oct 2022 09:46:40 GMT"
+
+    def test_listing_if_none_match_returns_304(self, client, auth, mocker):
+        mocker.patch(
+            "src.utils.shell", side_effect=["41ed:4096:1:1666000000", "file.txt"]
+        )
+        headers = {**auth, "if-none-match": '"1-1000-5eb37da322000"'}
+        response = client.get("/filesystem/tmp/", headers=headers)
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_file_if_modified_since_returns_304(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:7:1:1666000000")
+        mock = mocker.patch("src.utils.stream")
+        headers = {
+            **auth,
+            "accept": "application/octet-stream",
+            "if-modified-since": "Mon, 17 Oct 2022 09:46:40 GMT",
+        }
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 304
+        mock.assert_not_called()
+
+    def test_modified_file_returns_200(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:7:1:1666000001")
+        mocker.patch("src.utils.stream", return_value=iter([b"content"]))
+        headers = {
+            **auth,
+            "accept": "application/octet-stream",
+            "if-none-match": '"1-7-5eb37da322000"',
+        }
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 200
+        assert response.data == b"content"
+        assert response.headers["ETag"] == '"1-7-5eb37da416240"'
+
+    def test_file_head_does_not_read(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:7:1:1666000000")
+        mock = mocker.patch("src.utils.stream")
+        headers = {**auth, "accept": "application/octet-stream"}
+        response = client.head("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["Content-Length"] == "7"
+        assert response.headers["ETag"] == '"1-7-5eb37da322000"'
+        mock.assert_not_called()
+
+    def test_listing_head_matches_get(self, client, auth, mocker):
+        stats = "41ed:4096:1:1666000000"
+        mock = mocker.patch("src.utils.shell", side_effect=[stats, "file.txt", stats])
+        get = client.get("/filesystem/tmp/", headers=auth)
+        head = client.head("/filesystem/tmp/", headers=auth)
+        assert head.status_code == get.status_code == 200
+        for name in ("Content-Type", "ETag", "Last-Modified"):
+            assert head.headers[name] == get.headers[name]
+        assert get.headers["Content-Length"] == str(len(get.data))
+        # the length is not known without listing the directory
+        assert "Content-Length" not in head.headers
+        assert head.data == b""
+        # a single stat
+        assert mock.call_count == 3
+        assert mock.call_args[0][0].startswith("stat ")
+
+    def test_directory_head_does_not_archive(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="41ed:4096:1:0")
+        mock = mocker.patch("src.utils.stream")
+        headers = {**auth, "accept": "application/octet-stream"}
+        response = client.head("/filesystem/tmp/dir/", headers=headers)
+        assert response.status_code == 200
+        assert (
+            response.headers["Content-Disposition"] == "attachment; filename=dir.tar.gz"
+        )
+        assert "ETag" not in response.headers
+        mock.assert_not_called()
+
+    def test_stale_if_range_returns_full_file(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:10:1:0")
+        mocker.patch("src.utils.stream", return_value=iter([b"0123456789"]))
+        headers = {
+            **auth,
+            "accept": "application/octet-stream",
+            "range": "bytes=3-5",
+            "if-range": '"stale"',
+        }
+        response = client.get("/filesystem/tmp/file.txt", headers=headers)
+        assert response.status_code == 200
+        assert response.data == b"0123456789"
 
     def test_unsupported_accept_header_path_returns_400(self, client, auth):
         headers = {**auth, "accept": "text/html"}
@@ -107,10 +392,88 @@ class TestFilesystemPOST:
         )
         assert response.status_code == 201
 
-    def test_path_not_a_directory_returns_400(self, client, auth, mocker):
-        stderr = "/tmp/file.txt: Not a directory"
+    def test_raw_file_returns_201(self, client, auth, mocker, feed):
+        mock = mocker.patch("src.utils.shell", return_value="")
+        response = client.post(
+            "/filesystem/tmp/file.txt",
+            headers=auth,
+            data=b"text",
+            content_type="application/octet-stream",
+        )
+        assert response.status_code == 201
+        # created exclusively, then written, with no other command run
+        cmds = [call[1]["cmd"] for call in feed.call_args_list]
+        assert cmds == [
+            "dd of=/tmp/file.txt bs=65536 conv=excl status=none",
+            "dd of=/tmp/file.txt bs=65536 conv=nocreat status=none",
+        ]
+        assert feed.call_args[1]["file"].read() == b"text"
+        mock.assert_not_called()
+
+    def test_unsupported_raw_file_name_returns_400(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="")
+        response = client.post(
+            "/filesystem/tmp/fi le.txt",
+            headers=auth,
+            data=b"text",
+            content_type="application/octet-stream",
+        )
+        assert response.status_code == 400
+        assert response.json["message"] == "unsupported file name"
+
+    def test_missing_files_returns_400(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="")
+        response = client.post("/filesystem/tmp/", headers=auth, data={})
+        assert response.status_code == 400
+        assert response.json["message"] == "missing files"
+
+    def test_partially_failed_upload_returns_207(self, client, auth, mocker, feed):
+        def write(cmd, file, **kwargs):
+            if "b.txt" in cmd:
+                stderr = f"{cmd}: Permission denied"
+                raise subprocess.CalledProcessError(1, cmd=cmd, stderr=stderr)
+
+        mocker.patch("src.utils.shell", return_value="")
+        feed.side_effect = write
+        response = client.post(
+            "/filesystem/tmp/",
+            headers=auth,
+            data={"files": [(io.BytesIO(b"a"), "a.txt"), (io.BytesIO(b"b"), "b.txt")]},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 207
+        assert response.json == {
+            "code": 207,
+            "reason": "Multi Status",
+            "message": "some files failed to be written",
+            "files": [
+                {"name": "a.txt", "code": 201, "reason": "Created", "message": ""},
+                {
+                    "name": "b.txt",
+                    "code": 403,
+                    "reason": "Forbidden",
+                    "message": "permission denied",
+                },
+            ],
+        }
+
+    def test_failed_upload_returns_error(self, client, auth, mocker, feed):
+        stderr = "tee: /tmp/a.txt: Permission denied"
+        feed.side_effect = subprocess.CalledProcessError(1, cmd="", stderr=stderr)
+        mocker.patch("src.utils.shell", return_value="")
+        response = client.post(
+            "/filesystem/tmp/",
+            headers=auth,
+            data={"files": [(io.BytesIO(b"a"), "a.txt"), (io.BytesIO(b"b"), "b.txt")]},
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 403
+
+    def test_path_not_a_directory_returns_400(self, client, auth, mocker, feed):
+        stderr = "dd: failed to open '/tmp/file.txt/file.txt': Not a directory"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+        mocker.patch("src.utils.shell", return_value="")
+        feed.side_effect = err
         response = client.post(
             "/filesystem/tmp/file.txt",
             headers=auth,
@@ -119,20 +482,50 @@ class TestFilesystemPOST:
         )
         assert response.status_code == 400
 
-    def test_create_existing_file_returns_400(self, client, auth, mocker):
-        mocker.patch("src.utils.shell", return_value="file.txt")
+    def test_create_existing_file_returns_400(self, client, auth, mocker, feed):
+        stderr = "dd: failed to open '/tmp/file.txt': File exists"
+        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
+        mocker.patch("src.utils.shell", return_value="")
+        feed.side_effect = err
         response = client.post(
-            "/filesystem/tmp/file.txt",
+            "/filesystem/tmp/",
             headers=auth,
             data={"files": (io.BytesIO(b"text"), "file.txt")},
             content_type="multipart/form-data",
         )
         assert response.status_code == 400
+        assert response.json["message"] == "file exists"
 
-    def test_permission_denied_returns_403(self, client, auth, mocker):
-        stderr = "/tmp/root/: Permission denied"
+    def test_create_some_existing_files_creates_none(self, client, auth, mocker, feed):
+        def write(cmd, file, **kwargs):
+            if cmd.startswith("dd of=/tmp/b.txt ") and "excl" in cmd:
+                stderr = "dd: failed to open '/tmp/b.txt': File exists"
+                raise subprocess.CalledProcessError(1, cmd=cmd, stderr=stderr)
+
+        mock = mocker.patch("src.utils.shell", return_value="")
+        feed.side_effect = write
+        response = client.post(
+            "/filesystem/tmp/",
+            headers=auth,
+            data={
+                "files": [
+                    (io.BytesIO(b"a"), "a.txt"),
+                    (io.BytesIO(b"b"), "b.txt"),
+                ]
+            },
+            content_type="multipart/form-data",
+        )
+        assert response.status_code == 400
+        assert response.json["message"] == "file exists"
+        mock.assert_called_once_with(
+            "rm /tmp/a.txt", stdout=subprocess.DEVNULL, user="user"
+        )
+
+    def test_permission_denied_returns_403(self, client, auth, mocker, feed):
+        stderr = "dd: failed to open '/tmp/root/file.txt': Permission denied"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+        mocker.patch("src.utils.shell", return_value="")
+        feed.side_effect = err
         response = client.post(
             "/filesystem/tmp/root/",
             headers=auth,
@@ -146,10 +539,11 @@ class TestFilesystemPOST:
             "reason": "Forbidden",
         }
 
-    def test_missing_path_returns_404(self, client, auth, mocker):
-        stderr = "/tmp/missing/: No such file or directory"
+    def test_missing_path_returns_404(self, client, auth, mocker, feed):
+        stderr = "dd: failed to open '/tmp/missing/file.txt': No such file or directory"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+        mocker.patch("src.utils.shell", return_value="")
+        feed.side_effect = err
         response = client.post(
             "/filesystem/tmp/missing/",
             headers=auth,
@@ -163,6 +557,46 @@ class TestFilesystemPOST:
             "reason": "Not Found",
         }
 
+    def test_copy_returns_201(self, client, auth, mocker):
+        # any stat reports a regular file
+        mock = mocker.patch("src.utils.shell", return_value="81a4:4:1:0")
+        response = client.post(
+            "/filesystem/tmp/a.txt?op=copy&to=/tmp/b.txt", headers=auth
+        )
+        assert response.status_code == 201
+        cmd = mock.call_args_list[1][0][0]
+        temp = cmd.split()[-1]
+        assert temp.startswith("/tmp/.b.txt.")
+        assert cmd == f"cp --reflink=auto -T /tmp/a.txt {temp}"
+        mock.assert_any_call(
+            f"ln -P -T {temp} /tmp/b.txt", stdout=subprocess.DEVNULL, user="user"
+        )
+
+    def test_move_returns_201(self, client, auth, mocker):
+        mock = mocker.patch("src.utils.shell", return_value="81a4:4:1:0")
+        response = client.post(
+            "/filesystem/tmp/a.txt?op=move&to=/tmp/b.txt", headers=auth
+        )
+        assert response.status_code == 201
+        mock.assert_any_call(
+            "ln -P -T /tmp/a.txt /tmp/b.txt", stdout=subprocess.DEVNULL, user="user"
+        )
+        mock.assert_called_with("rm /tmp/a.txt", stdout=subprocess.DEVNULL, user="user")
+
+    @pytest.mark.parametrize(
+        "query, message",
+        [
+            ("op=copy", "missing destination"),
+            ("op=copy&to=/unsupported/b.txt", "unsupported path"),
+            ("op=link&to=/tmp/b.txt", "unsupported operation"),
+        ],
+    )
+    def test_invalid_transfer_returns_400(self, client, auth, mocker, query, message):
+        mocker.patch("src.utils.shell", return_value="81a4:4:1:0")
+        response = client.post(f"/filesystem/tmp/a.txt?{query}", headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == message
+
 
 class TestFilesystemPUT:
     def test_valid_file_returns_204(self, client, auth, mocker):
@@ -175,10 +609,21 @@ class TestFilesystemPUT:
         )
         assert response.status_code == 204
 
-    def test_path_not_a_directory_returns_400(self, client, auth, mocker):
-        stderr = "/tmp/file.txt: Not a directory"
-        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+    def test_raw_file_returns_204(self, client, auth, mocker, feed):
+        mocker.patch("src.utils.shell", return_value="file.txt")
+        response = client.put(
+            "/filesystem/tmp/file.txt",
+            headers=auth,
+            data=b"text",
+            content_type="application/octet-stream",
+        )
+        assert response.status_code == 204
+        cmd = "dd of=/tmp/file.txt bs=65536 conv=nocreat status=none"
+        assert feed.call_args[1]["cmd"] == cmd
+
+    def test_path_not_a_directory_returns_400(self, client, auth, feed):
+        stderr = "dd: failed to open '/tmp/file.txt/file.txt': Not a directory"
+        feed.side_effect = subprocess.CalledProcessError(1, cmd="", stderr=stderr)
         response = client.put(
             "/filesystem/tmp/file.txt",
             headers=auth,
@@ -187,10 +632,9 @@ class TestFilesystemPUT:
         )
         assert response.status_code == 400
 
-    def test_permission_denied_returns_403(self, client, auth, mocker):
-        stderr = "/tmp/root/: Permission denied"
-        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+    def test_permission_denied_returns_403(self, client, auth, feed):
+        stderr = "dd: failed to open '/tmp/root/file.txt': Permission denied"
+        feed.side_effect = subprocess.CalledProcessError(1, cmd="", stderr=stderr)
         response = client.put(
             "/filesystem/tmp/root/",
             headers=auth,
@@ -204,10 +648,9 @@ class TestFilesystemPUT:
             "reason": "Forbidden",
         }
 
-    def test_missing_path_returns_404(self, client, auth, mocker):
-        stderr = "/tmp/missing/: No such file or directory"
-        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+    def test_missing_path_returns_404(self, client, auth, feed):
+        stderr = "dd: failed to open '/tmp/missing/file.txt': No such file or directory"
+        feed.side_effect = subprocess.CalledProcessError(1, cmd="", stderr=stderr)
         response = client.put(
             "/filesystem/tmp/missing/",
             headers=auth,
@@ -221,8 +664,9 @@ class TestFilesystemPUT:
             "reason": "Not Found",
         }
 
-    def test_update_missing_file_returns_404(self, client, auth, mocker):
-        mocker.patch("src.utils.shell", return_value="")
+    def test_update_missing_file_returns_404(self, client, auth, feed):
+        stderr = "dd: failed to open '/tmp/file.txt': No such file or directory"
+        feed.side_effect = subprocess.CalledProcessError(1, cmd="", stderr=stderr)
         response = client.put(
             "/filesystem/tmp/",
             headers=auth,
@@ -232,11 +676,90 @@ class TestFilesystemPUT:
         assert response.status_code == 404
         assert response.json == {
             "code": 404,
-            "message": "file does not exist",
+            "message": "no such file or directory",
             "reason": "Not Found",
         }
 
 
+class TestFilesystemPATCH:
+    @pytest.fixture(autouse=True)
+    def reading_feed(self, feed):
+        # content is read for its length to be checked
+        feed.side_effect = lambda file, **_: file.read()
+
+    def test_byte_range_returns_204(self, client, auth, mocker, feed):
+        mocker.patch("src.utils.shell", return_value="81a4:8:1:0")
+        headers = {**auth, "Content-Range": "bytes 2-5/*", "If-Match": '"1-8-0"'}
+        response = client.patch(
+            "/filesystem/tmp/file.txt", data=b"abcd", headers=headers
+        )
+        assert response.status_code == 204
+        assert response.headers["ETag"] == '"1-8-0"'
+        cmd = feed.call_args[1]["cmd"]
+        assert cmd == (
+            "dd of=/tmp/file.txt bs=65536 seek=2 oflag=seek_bytes "
+            "conv=nocreat,notrunc status=none"
+        )
+
+    def test_append_returns_204(self, client, auth, mocker, feed):
+        mocker.patch("src.utils.shell", return_value="81a4:8:1:0")
+        response = client.patch("/filesystem/tmp/file.txt", data=b"abcd", headers=auth)
+        assert response.status_code == 204
+        assert feed.call_args[1]["cmd"] == (
+            "dd of=/tmp/file.txt bs=65536 oflag=append conv=nocreat,notrunc status=none"
+        )
+
+    def test_missing_length_returns_411(self, client, auth, mocker, feed):
+        mocker.patch("src.utils.shell", return_value="81a4:8:1:0")
+        headers = {**auth, "Transfer-Encoding": "chunked"}
+        response = client.patch(
+            "/filesystem/tmp/file.txt",
+            input_stream=io.BytesIO(b"abcd"),
+            headers=headers,
+        )
+        assert response.status_code == 411
+        feed.assert_not_called()
+
+    def test_modified_file_returns_412(self, client, auth, mocker, feed):
+        mocker.patch("src.utils.shell", return_value="81a4:8:1:0")
+        headers = {**auth, "If-Match": '"1-4-0"'}
+        response = client.patch(
+            "/filesystem/tmp/file.txt", data=b"abcd", headers=headers
+        )
+        assert response.status_code == 412
+        feed.assert_not_called()
+
+    def test_range_past_the_end_returns_416(self, client, auth, mocker, feed):
+        mocker.patch("src.utils.shell", return_value="81a4:8:1:0")
+        headers = {**auth, "Content-Range": "bytes 9-12/*"}
+        response = client.patch(
+            "/filesystem/tmp/file.txt", data=b"abcd", headers=headers
+        )
+        assert response.status_code == 416
+        assert response.headers["Content-Range"] == "bytes */8"
+        feed.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "content_range, message",
+        [
+            ("bytes 0-1/*", "content length does not match range"),
+            ("bytes 0-3/4", "invalid range"),
+            ("lines 0-3/*", "invalid range"),
+        ],
+    )
+    def test_invalid_range_returns_400(
+        self, client, auth, mocker, feed, content_range, message
+    ):
+        mocker.patch("src.utils.shell", return_value="81a4:8:1:0")
+        headers = {**auth, "Content-Range": content_range}
+        response = client.patch(
+            "/filesystem/tmp/file.txt", data=b"abcd", headers=headers
+        )
+        assert response.status_code == 400
+        assert response.json["message"] == message
+        feed.assert_not_called()
+
+
 class TestFilesystemDELETE:
     def test_valid_file_returns_204(self, client, auth, mocker):
         mocker.patch("src.utils.shell")
@@ -273,3 +796,107 @@ class TestFilesystemDELETE:
             "message": "no such file or directory",
             "reason": "Not Found",
         }
+
+
+class TestFilesystemBatch:
+    def test_operations_return_status_in_order(self, client, auth, mocker):
+        def shell(cmd, **kwargs):
+            if cmd.startswith("stat"):
+                return "81a4:7:1:0"
+            if cmd.startswith("ls"):
+                return "file.txt"
+            if cmd == "rm /tmp/missing.txt":
+                stderr = (
+                    "rm: cannot remove '/tmp/missing.txt': No such file or directory"
+                )
+                raise subprocess.CalledProcessError(1, cmd=cmd, stderr=stderr)
+            return ""
+
+        mock = mocker.patch("src.utils.shell", side_effect=shell)
+        operations = [
+            {"op": "ls", "path": "/tmp/"},
+            {"op": "stat", "path": "/tmp/file.txt"},
+            {"op": "mkdir", "path": "/tmp/dir"},
+            {"op": "delete", "path": "/tmp/missing.txt"},
+            {"op": "delete", "path": "/etc/passwd"},
+        ]
+        response = client.post("/filesystem:batch", json=operations, headers=auth)
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.data.splitlines()]
+        assert [(line["index"], line["op"], line["code"]) for line in lines] == [
+            (0, "ls", 200),
+            (1, "stat", 200),
+            (2, "mkdir", 201),
+            (3, "delete", 404),
+            (4, "delete", 400),
+        ]
+        assert lines[0]["result"] == ["file.txt"]
+        assert lines[1]["result"] == {"mode": 0o100644, "size": 7, "ino": 1, "mtime": 0}
+        assert lines[3]["message"] == "no such file or directory"
+        assert lines[4]["message"] == "unsupported path"
+        mock.assert_any_call("mkdir /tmp/dir", stdout=subprocess.DEVNULL, user="user")
+
+    def test_invalid_operations_return_400(self, client, auth):
+        response = client.post("/filesystem:batch", json={"op": "ls"}, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "invalid operations"
+
+    def test_too_many_operations_return_400(self, client, auth):
+        operations = [{"op": "stat", "path": "/tmp"}] * 1001
+        response = client.post("/filesystem:batch", json=operations, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "too many operations"
+
+    def test_unauthorized_request_throws_401(self, client):
+        response = client.post("/filesystem:batch", json=[])
+        assert response.status_code == 401
+
+
+class TestFilesystemArchive:
+    def test_many_paths_are_archived_at_once(self, client, auth, mocker):
+        mock = mocker.patch("src.utils.stream", return_value=iter([b"tar"]))
+        body = {"paths": ["/tmp/dir", "/tmp/other/file.txt"], "compression": "none"}
+        response = client.post("/filesystem:archive", json=body, headers=auth)
+        assert response.status_code == 200
+        assert response.data == b"tar"
+        assert response.headers["Content-Disposition"].endswith("archive.tar")
+        cmd = "tar -cpf - -C /tmp --add-file=dir -C /tmp/other --add-file=file.txt"
+        assert mock.call_args[0][0] == cmd
+
+    def test_zip(self, client, auth, mocker):
+        content = io.BytesIO()
+        with tarfile.open(fileobj=content, mode="w") as tar:
+            info = tarfile.TarInfo("file.txt")
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b"text"))
+        mocker.patch("src.utils.stream", return_value=iter([content.getvalue()]))
+        body = {"paths": ["/tmp/file.txt"], "format": "zip"}
+        response = client.post("/filesystem:archive", json=body, headers=auth)
+        assert response.status_code == 200
+        assert response.headers["Content-Disposition"].endswith("archive.zip")
+        with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+            assert zf.read("file.txt") == b"text"
+
+    def test_unsupported_path_returns_400(self, client, auth):
+        body = {"paths": ["/tmp/file.txt", "/etc/passwd"]}
+        response = client.post("/filesystem:archive", json=body, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "unsupported path"
+
+    def test_missing_paths_returns_400(self, client, auth):
+        response = client.post("/filesystem:archive", json={}, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "missing paths"
+        body = {"paths": ["/tmp/file.txt"], "level": "high"}
+        response = client.post("/filesystem:archive", json=body, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "unsupported compression level"
+
+    def test_missing_file_returns_404(self, client, auth, mocker):
+        stderr = "tar: missing: Cannot stat: No such file or directory"
+        err = subprocess.CalledProcessError(cmd="", returncode=2, stderr=stderr)
+        mocker.patch("src.utils.stream", side_effect=err)
+        body = {"paths": ["/tmp/missing"]}
+        response = client.post("/filesystem:archive", json=body, headers=auth)
+        assert response.status_code == 404
@@ -0,0 +1,187 @@
+import subprocess
+from base64 import b64encode
+
+import pytest
+
+from src.api.auth import AuthAPI
+
+
+@pytest.fixture(autouse=True)
+def feed(mocker):
+    # files are not written for real, but their content is read
+    return mocker.patch("src.utils.feed", side_effect=lambda file, **_: file.read())
+
+
+@pytest.fixture()
+def auth(mocker):
+    mocker.patch.object(AuthAPI, "authenticate", return_value=True)
+    return {"Authorization": f"Basic {b64encode(b'user:pass').decode()}"}
+
+
+def missing():
+    stderr = "stat: cannot statx '/tmp/file.txt': No such file or directory"
+    return subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
+
+
+@pytest.fixture(autouse=True)
+def stream(mocker):
+    # directories swept of abandoned sessions are empty
+    return mocker.patch("src.utils.stream", return_value=iter([]))
+
+
+@pytest.fixture()
+def session(client, auth, mocker):
+    mocker.patch("src.utils.shell", side_effect=missing())
+    body = {"path": "/tmp/file.txt", "size": 10, "chunk_size": 4}
+    return client.post("/uploads", json=body, headers=auth).json
+
+
+class TestUploads:
+    def test_create(self, client, auth, mocker, feed, stream):
+        mocker.patch("src.utils.shell", side_effect=missing())
+        body = {"path": "/tmp/file.txt", "size": 10, "chunk_size": 4}
+        response = client.post("/uploads", json=body, headers=auth)
+        assert response.status_code == 201
+        session_id = response.json["id"]
+        assert response.headers["Location"].endswith(f"/uploads/{session_id}")
+        assert response.json["chunks"] == 3
+        assert response.json["received"] == []
+        cmd = feed.call_args_list[0][1]["cmd"]
+        temp = cmd.split()[1][len("of=") :]
+        assert temp.startswith("/tmp/.file.txt.")
+        assert cmd == f"dd of={temp} bs=65536 conv=excl status=none"
+        cmd = feed.call_args_list[1][1]["cmd"]
+        assert cmd == f"dd of={temp}.chunks bs=65536 conv=excl status=none"
+        assert stream.call_args[0][0].startswith("find -H /tmp -maxdepth 1 ")
+
+    def test_create_existing_file_returns_400(self, client, auth, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:4:1:0")
+        body = {"path": "/tmp/file.txt", "size": 10}
+        response = client.post("/uploads", json=body, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "file already exists"
+
+    def test_create_unsupported_path_returns_400(self, client, auth):
+        body = {"path": "/unsupported/file.txt", "size": 10}
+        response = client.post("/uploads", json=body, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "unsupported path"
+        response = client.post("/uploads", json={"size": 10}, headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "missing path"
+
+    def test_put_chunk(self, client, auth, session, feed):
+        url = f"/uploads/{session['id']}"
+        response = client.put(f"{url}?chunk=1", data=b"4567", headers=auth)
+        assert response.status_code == 204
+        cmd = feed.call_args_list[-2][1]["cmd"]
+        assert cmd.startswith("dd of=/tmp/.file.txt.")
+        assert "seek=4 " in cmd
+        assert "seek=1 " in feed.call_args[1]["cmd"]
+
+        headers = {**auth, "Content-Range": "bytes 8-9/10"}
+        response = client.put(url, data=b"89", headers=headers)
+        assert response.status_code == 204
+        assert "seek=8 " in feed.call_args_list[-2][1]["cmd"]
+
+    def test_put_chunk_of_finished_session_returns_404(
+        self, client, auth, session, feed
+    ):
+        stderr = "dd: failed to open '/tmp/.file.txt.upload': No such file or directory"
+        feed.side_effect = subprocess.CalledProcessError(1, cmd="", stderr=stderr)
+        response = client.put(
+            f"/uploads/{session['id']}?chunk=1", data=b"4567", headers=auth
+        )
+        assert response.status_code == 404
+        assert response.json["message"] == "upload session does not exist"
+        # written only into the files of the session, never created again
+        assert "conv=nocreat,notrunc " in feed.call_args[1]["cmd"]
+
+    def test_put_invalid_chunk_returns_400(self, client, auth, session):
+        url = f"/uploads/{session['id']}"
+        response = client.put(f"{url}?chunk=1", data=b"45", headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "chunk size does not match"
+        headers = {**auth, "Content-Range": "bytes 2-5/10"}
+        response = client.put(url, data=b"2345", headers=headers)
+        assert response.status_code == 400
+        assert response.json["message"] == "invalid chunk"
+        response = client.put(url, data=b"0123", headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "missing chunk"
+
+    def test_status(self, client, auth, session, mocker):
+        mocker.patch("src.utils.stream", return_value=iter([b"\1\0\1"]))
+        response = client.get(f"/uploads/{session['id']}", headers=auth)
+        assert response.status_code == 200
+        assert response.json["received"] == [[0, 4], [8, 10]]
+
+    def test_commit(self, client, auth, session, mocker):
+        mocker.patch("src.utils.stream", return_value=iter([b"\1\1\1"]))
+        shell = mocker.patch("src.utils.shell", return_value="")
+        response = client.post(f"/uploads/{session['id']}", headers=auth)
+        assert response.status_code == 201
+        cmd = shell.call_args_list[0][0][0]
+        assert cmd.startswith("ln -P -T /tmp/.file.txt.")
+        assert cmd.endswith(" /tmp/file.txt")
+
+    def test_commit_missing_chunks_returns_400(self, client, auth, session, mocker):
+        mocker.patch("src.utils.stream", return_value=iter([b"\1\0\1"]))
+        response = client.post(f"/uploads/{session['id']}", headers=auth)
+        assert response.status_code == 400
+        assert response.json["message"] == "missing chunks"
+
+    def test_abort(self, client, auth, session, mocker):
+        mocker.patch("src.utils.stream", return_value=iter([b""]))
+        shell = mocker.patch("src.utils.shell", return_value="")
+        response = client.delete(f"/uploads/{session['id']}", headers=auth)
+        assert response.status_code == 204
+        assert [call[0][0].split()[0] for call in shell.call_args_list] == ["rm", "rm"]
+
+    def test_abort_expired_session(self, app, client, auth, mocker):
+        mocker.patch("src.utils.shell", side_effect=missing())
+        app.config["UPLOAD_SESSION_TTL"] = 0
+        try:
+            body = {"path": "/tmp/file.txt", "size": 10}
+            session_id = client.post("/uploads", json=body, headers=auth).json["id"]
+        finally:
+            app.config["UPLOAD_SESSION_TTL"] = 86400
+        response = client.get(f"/uploads/{session_id}", headers=auth)
+        assert response.status_code == 404
+        mocker.patch("src.utils.stream", return_value=iter([b""]))
+        shell = mocker.patch("src.utils.shell", return_value="")
+        response = client.delete(f"/uploads/{session_id}", headers=auth)
+        assert response.status_code == 204
+        assert [call[0][0].split()[0] for call in shell.call_args_list] == ["rm", "rm"]
+
+    def test_missing_secret_key_returns_400(self, app, client, auth, session, feed):
+        url = f"/uploads/{session['id']}"
+        feed.reset_mock()
+        app.config["SECRET_KEY"] = None
+        try:
+            body = {"path": "/tmp/other.txt", "size": 10}
+            responses = [
+                client.post("/uploads", json=body, headers=auth),
+                client.get(url, headers=auth),
+                client.put(f"{url}?chunk=1", data=b"4567", headers=auth),
+                client.post(url, headers=auth),
+                client.delete(url, headers=auth),
+            ]
+        finally:
+            app.config["SECRET_KEY"] = "secret"
+        for response in responses:
+            assert response.status_code == 400
+            assert response.json["message"] == "missing secret key for signing tokens"
+        # no file of a session is written
+        feed.assert_not_called()
+
+    def test_invalid_session_returns_404(self, client, auth):
+        response = client.get("/uploads/invalid", headers=auth)
+        assert response.status_code == 404
+        assert response.json["message"] == "upload session does not exist"
+
+    def test_session_of_another_user_returns_403(self, client, session, mocker):
+        mocker.patch.object(AuthAPI, "authenticate", return_value=True)
+        auth = {"Authorization": f"Basic {b64encode(b'other:pass').decode()}"}
+        response = client.get(f"/uploads/{session['id']}", headers=auth)
+        assert response.status_code == 403
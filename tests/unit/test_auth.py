@@ -0,0 +1,91 @@
+import pytest
+
+from src.api.auth import AuthAPI, AuthCache
+
+
+@pytest.fixture()
+def cache(mocker):
+    cache = AuthCache(ttl=60, negative_ttl=5, maxsize=2, iterations=1)
+    mocker.patch.object(AuthAPI, "cache", cache)
+    return cache
+
+
+class TestAuthCache:
+    def test_key_is_salted(self, cache):
+        assert cache.key("user", "pass") == cache.key("user", "pass")
+        assert cache.key("user", "pass") != cache.key("user", "other")
+        assert cache.key("user", "pass") != AuthCache(iterations=1).key("user", "pass")
+
+    def test_hits_and_misses(self, cache):
+        key = cache.key("user", "pass")
+        assert cache.get(key) is None
+        cache.set(key, True)
+        assert cache.get(key) is True
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_entries_expire(self, cache, mocker):
+        key = cache.key("user", "pass")
+        cache.set(key, True)
+        cache.set(cache.key("user", "wrong"), False)
+        mocker.patch("time.monotonic", return_value=10**9)
+        assert cache.get(key) is None
+        assert cache.get(cache.key("user", "wrong")) is None
+        assert len(cache) == 0
+
+    def test_failures_expire_first(self, cache, mocker):
+        now = 1000
+        mocker.patch("time.monotonic", return_value=now)
+        cache.set(cache.key("user", "pass"), True)
+        cache.set(cache.key("user", "wrong"), False)
+        mocker.patch("time.monotonic", return_value=now + 10)
+        assert cache.get(cache.key("user", "pass")) is True
+        assert cache.get(cache.key("user", "wrong")) is None
+
+    def test_least_recently_used_is_evicted(self, cache):
+        keys = [cache.key("user", str(i)) for i in range(3)]
+        cache.set(keys[0], True)
+        cache.set(keys[1], True)
+        cache.get(keys[0])
+        cache.set(keys[2], True)
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is True
+        assert cache.get(keys[2]) is True
+
+    def test_disabled_cache(self):
+        cache = AuthCache(ttl=0, negative_ttl=0, iterations=1)
+        cache.set(cache.key("user", "pass"), True)
+        assert len(cache) == 0
+
+
+class TestAuthAPI:
+    def test_authentication_is_cached(self, cache, mocker):
+        mock = mocker.patch("pam.authenticate", return_value=True)
+        assert AuthAPI.authenticate("user", "pass") is True
+        assert AuthAPI.authenticate("user", "pass") is True
+        mock.assert_called_once_with("user", "pass")
+
+    def test_failed_authentication_is_cached(self, cache, mocker):
+        mock = mocker.patch("pam.authenticate", return_value=False)
+        assert AuthAPI.authenticate("user", "wrong") is False
+        assert AuthAPI.authenticate("user", "wrong") is False
+        mock.assert_called_once_with("user", "wrong")
+
+    def test_valid_token(self):
+        token = AuthAPI.create_token("user", secret_key="secret", ttl=60)
+        assert AuthAPI.verify_token(token, secret_key="secret") == "user"
+
+    def test_expired_token(self, mocker):
+        token = AuthAPI.create_token("user", secret_key="secret", ttl=60)
+        mocker.patch("time.time", return_value=10**12)
+        assert AuthAPI.verify_token(token, secret_key="secret") is None
+
+    def test_tampered_token(self):
+        token = AuthAPI.create_token("user", secret_key="secret", ttl=60)
+        assert AuthAPI.verify_token(token, secret_key="other") is None
+        assert AuthAPI.verify_token(f"x{token}", secret_key="secret") is None
+        assert AuthAPI.verify_token("invalid", secret_key="secret") is None
+
+    def test_missing_secret_key(self):
+        with pytest.raises(RuntimeError) as ex:
+            AuthAPI.create_token("user", secret_key=None)
+        assert str(ex.value) == "missing secret key for signing tokens"
@@ -0,0 +1,308 @@
+import errno
+import io
+import os
+import pathlib
+import stat
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+import pytest
+
+from src.api.backends import (
+    FsuidBackend,
+    HelperBackend,
+    LocalBackend,
+    create_backend,
+)
+from src.api.backends.fsuid import credentials
+from src.api.backends.helper import HelperPool
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    directory = tmp_path / "dir"
+    (directory / "sub").mkdir(parents=True)
+    (directory / "file.txt").write_bytes(b"content")
+    (directory / "sub" / "nested.txt").write_bytes(b"nested" * 100000)
+    return directory
+
+
+@pytest.fixture(scope="module")
+def helpers():
+    pool = HelperPool(idle_timeout=60)
+    yield pool
+    pool.close()
+
+
+def test_create_backend():
+    assert isinstance(create_backend("helper", username="test"), HelperBackend)
+    assert isinstance(create_backend("fsuid", username="test"), FsuidBackend)
+    with pytest.raises(ValueError) as ex:
+        create_backend("invalid")
+    assert str(ex.value) == "unsupported backend 'invalid'"
+
+
+class TestLocalBackend:
+    def test_ls(self, tree):
+        assert LocalBackend().ls(str(tree)) == ["file.txt", "sub"]
+        assert LocalBackend().ls(str(tree / "file.txt")) == [str(tree / "file.txt")]
+        with pytest.raises(FileNotFoundError):
+            LocalBackend().ls(str(tree / "missing"))
+
+    def test_scan(self, tree):
+        (tree / "link").symlink_to("file.txt")
+        entries = sorted(LocalBackend().scan(str(tree)), key=lambda e: e.name)
+        assert [(e.name, e.type, e.target) for e in entries] == [
+            ("file.txt", "file", None),
+            ("link", "symlink", "file.txt"),
+            ("sub", "directory", None),
+        ]
+        assert entries[0].size == 7
+        assert entries[0].mode == stat.S_IMODE((tree / "file.txt").stat().st_mode)
+        assert entries[0].mtime == (tree / "file.txt").stat().st_mtime
+        (entry,) = LocalBackend().scan(str(tree / "file.txt"))
+        assert entry == entries[0]
+        with pytest.raises(FileNotFoundError):
+            LocalBackend().scan(str(tree / "missing"))
+
+    def test_stat(self, tree):
+        assert stat.S_ISDIR(LocalBackend().stat(str(tree)).mode)
+        assert stat.S_ISREG(LocalBackend().stat(str(tree / "file.txt")).mode)
+        assert LocalBackend().stat(str(tree / "file.txt")).size == 7
+
+    def test_read(self, tree):
+        path = str(tree / "file.txt")
+        assert b"".join(LocalBackend().read(path)) == b"content"
+        assert b"".join(LocalBackend().read(path, offset=3)) == b"tent"
+        assert b"".join(LocalBackend().read(path, offset=1, length=3)) == b"ont"
+        assert b"".join(LocalBackend().read(path, offset=10, length=3)) == b""
+        with pytest.raises(IsADirectoryError):
+            LocalBackend().read(str(tree))
+
+    def test_archive(self, tree):
+        content = b"".join(LocalBackend().archive(str(tree)))
+        assert len(content) % tarfile.RECORDSIZE == 0
+        with tarfile.open(fileobj=io.BytesIO(content)) as tar:
+            assert tar.getnames() == [
+                "dir",
+                "dir/file.txt",
+                "dir/sub",
+                "dir/sub/nested.txt",
+            ]
+            nested = tar.extractfile("dir/sub/nested.txt").read()
+            assert nested == b"nested" * 100000
+
+    def test_archive_many_paths(self, tree, tmp_path):
+        (tmp_path / "other.txt").write_bytes(b"other")
+        paths = (str(tree / "sub"), str(tmp_path / "other.txt"))
+        content = b"".join(LocalBackend().archive(*paths))
+        with tarfile.open(fileobj=io.BytesIO(content)) as tar:
+            assert tar.getnames() == ["sub", "sub/nested.txt", "other.txt"]
+            assert tar.extractfile("other.txt").read() == b"other"
+
+    def test_write_and_delete(self, tree):
+        path = str(tree / "new.txt")
+        LocalBackend().write(path, io.BytesIO(b"new"))
+        assert (tree / "new.txt").read_bytes() == b"new"
+        LocalBackend().rename(path, str(tree / "file.txt"))
+        assert (tree / "file.txt").read_bytes() == b"new"
+        path = str(tree / "file.txt")
+        LocalBackend().delete(path)
+        assert not (tree / "new.txt").exists()
+
+    def test_write_at_offset(self, tree):
+        path = str(tree / "file.txt")
+        LocalBackend().write(path, io.BytesIO(b"ON"), offset=1)
+        assert (tree / "file.txt").read_bytes() == b"cONtent"
+        LocalBackend().write(str(tree / "new.txt"), io.BytesIO(b"x"), offset=2)
+        assert (tree / "new.txt").read_bytes() == b"\0\0x"
+
+    def test_write_checks_existence(self, tree):
+        path = str(tree / "file.txt")
+        with pytest.raises(FileExistsError):
+            LocalBackend().write(path, io.BytesIO(b"new"), exists=False)
+        LocalBackend().write(path, io.BytesIO(b"new"), exists=True)
+        assert (tree / "file.txt").read_bytes() == b"new"
+        with pytest.raises(FileNotFoundError):
+            LocalBackend().write(str(tree / "new.txt"), io.BytesIO(b"x"), exists=True)
+        LocalBackend().write(str(tree / "new.txt"), io.BytesIO(b"x"), exists=False)
+        assert (tree / "new.txt").read_bytes() == b"x"
+
+    def test_append(self, tree):
+        path = str(tree / "file.txt")
+        LocalBackend().append(path, io.BytesIO(b"!"))
+        assert (tree / "file.txt").read_bytes() == b"content!"
+        with pytest.raises(FileNotFoundError):
+            LocalBackend().append(str(tree / "new.txt"), io.BytesIO(b"x"))
+
+    def test_mkdir(self, tree):
+        LocalBackend().mkdir(str(tree / "new"))
+        assert (tree / "new").is_dir()
+        with pytest.raises(FileExistsError):
+            LocalBackend().mkdir(str(tree / "new"))
+
+    def test_copy(self, tree):
+        LocalBackend().copy(str(tree / "sub" / "nested.txt"), str(tree / "copy.txt"))
+        assert (tree / "copy.txt").read_bytes() == b"nested" * 100000
+        with pytest.raises(FileExistsError):
+            LocalBackend().copy(str(tree / "copy.txt"), str(tree / "file.txt"))
+        assert (tree / "file.txt").read_bytes() == b"content"
+
+    def test_copy_falls_back_to_chunks(self, tree, mocker):
+        mocker.patch("fcntl.ioctl", side_effect=OSError(errno.EOPNOTSUPP, ""))
+        err = OSError(errno.EXDEV, "")
+        copy_file_range = mocker.patch("os.copy_file_range", side_effect=err)
+        LocalBackend().copy(str(tree / "sub" / "nested.txt"), str(tree / "copy.txt"))
+        assert (tree / "copy.txt").read_bytes() == b"nested" * 100000
+        copy_file_range.assert_called_once()
+
+    def test_rename_without_replacing(self, tree):
+        path = str(tree / "new.txt")
+        LocalBackend().write(path, io.BytesIO(b"new"))
+        with pytest.raises(FileExistsError):
+            LocalBackend().rename(path, str(tree / "file.txt"), replace=False)
+        assert (tree / "file.txt").read_bytes() == b"content"
+        LocalBackend().rename(path, str(tree / "renamed.txt"), replace=False)
+        assert (tree / "renamed.txt").read_bytes() == b"new"
+        assert not (tree / "new.txt").exists()
+
+
+class TestHelperBackend:
+    def test_operations(self, tree, helpers):
+        backend = HelperBackend(helpers=helpers)
+        assert backend.ls(str(tree)) == ["file.txt", "sub"]
+        assert backend.stat(str(tree / "file.txt")) == LocalBackend().stat(
+            str(tree / "file.txt")
+        )
+        assert sorted(backend.scan(str(tree)), key=lambda e: e.name) == sorted(
+            LocalBackend().scan(str(tree)), key=lambda e: e.name
+        )
+        assert b"".join(backend.read(str(tree / "file.txt"))) == b"content"
+        assert b"".join(backend.read(str(tree / "file.txt"), 1, 3)) == b"ont"
+        archive = b"".join(backend.archive(str(tree)))
+        assert archive == b"".join(LocalBackend().archive(str(tree)))
+        paths = (str(tree / "sub"), str(tree / "file.txt"))
+        archive = b"".join(backend.archive(*paths))
+        assert archive == b"".join(LocalBackend().archive(*paths))
+        backend.write(str(tree / "new.txt"), io.BytesIO(b"new" * 100000))
+        assert (tree / "new.txt").read_bytes() == b"new" * 100000
+        backend.append(str(tree / "new.txt"), io.BytesIO(b"!"))
+        assert (tree / "new.txt").read_bytes() == b"new" * 100000 + b"!"
+        backend.rename(str(tree / "new.txt"), str(tree / "renamed.txt"))
+        assert (tree / "renamed.txt").read_bytes() == b"new" * 100000 + b"!"
+        backend.delete(str(tree / "renamed.txt"))
+        assert not (tree / "renamed.txt").exists()
+        backend.mkdir(str(tree / "new"))
+        assert (tree / "new").is_dir()
+        backend.copy(str(tree / "file.txt"), str(tree / "new" / "copy.txt"))
+        assert (tree / "new" / "copy.txt").read_bytes() == b"content"
+
+    def test_errors(self, tree, helpers):
+        backend = HelperBackend(helpers=helpers)
+        with pytest.raises(FileNotFoundError) as ex:
+            backend.ls(str(tree / "missing"))
+        assert str(ex.value) == "no such file or directory"
+        with pytest.raises(IsADirectoryError) as ex:
+            backend.read(str(tree))
+        assert str(ex.value) == "is a directory"
+        with pytest.raises(FileNotFoundError):
+            backend.scan(str(tree / "missing"))
+        with pytest.raises(FileNotFoundError):
+            backend.write(str(tree / "missing" / "file.txt"), io.BytesIO(b"x"))
+        with pytest.raises(FileExistsError) as ex:
+            backend.write(str(tree / "file.txt"), io.BytesIO(b"x"), exists=False)
+        assert str(ex.value) == "file exists"
+        assert backend.ls(str(tree)) == ["file.txt", "sub"]
+
+    def test_helper_is_reused(self, tree, helpers):
+        backend = HelperBackend(helpers=helpers)
+        backend.ls(str(tree))
+        (helper,) = helpers._idle[None]
+        backend.ls(str(tree))
+        assert helpers._idle[None] == [helper]
+
+    def test_abandoned_stream_discards_helper(self, tree, helpers):
+        backend = HelperBackend(helpers=helpers)
+        backend.ls(str(tree))
+        (helper,) = helpers._idle[None]
+        chunks = backend.read(str(tree / "sub" / "nested.txt"))
+        next(chunks)
+        chunks.close()
+        assert not helper.alive()
+        assert not helpers._idle.get(None)
+
+    def test_idle_helpers_are_discarded(self, tree):
+        helpers = HelperPool(idle_timeout=0.1)
+        backend = HelperBackend(helpers=helpers)
+        backend.ls(str(tree))
+        (helper,) = helpers._idle[None]
+        time.sleep(0.2)
+        backend.ls(str(tree))
+        assert not helper.alive()
+        assert helpers._idle[None] != [helper]
+        helpers.close()
+
+
+@pytest.mark.skipif(
+    not sys.platform.startswith("linux") or os.geteuid() != 0,
+    reason="switching credentials requires root on linux",
+)
+class TestFsuidBackend:
+    @pytest.fixture()
+    def restricted(self):
+        # temporary directories of pytest are private to their owner
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = pathlib.Path(tmp) / "dir"
+            (directory / "sub").mkdir(parents=True)
+            (directory / "file.txt").write_bytes(b"content")
+            os.chmod(tmp, 0o755)
+            os.chmod(directory / "file.txt", 0o600)
+            yield directory
+
+    def test_operations(self, restricted):
+        backend = FsuidBackend(username="nobody")
+        assert backend.ls(str(restricted)) == ["file.txt", "sub"]
+        assert stat.S_ISDIR(backend.stat(str(restricted)).mode)
+        assert {entry.name for entry in backend.scan(str(restricted))} == {
+            "file.txt",
+            "sub",
+        }
+        with pytest.raises(PermissionError) as ex:
+            backend.read(str(restricted / "file.txt"))
+        assert str(ex.value) == "permission denied"
+        with pytest.raises(PermissionError):
+            backend.write(str(restricted / "new.txt"), io.BytesIO(b"new"))
+        with pytest.raises(PermissionError):
+            b"".join(backend.archive(str(restricted)))
+        with pytest.raises(FileNotFoundError) as ex:
+            backend.ls(str(restricted / "missing"))
+        assert str(ex.value) == "no such file or directory"
+
+    def test_credentials_are_restored(self, restricted):
+        FsuidBackend(username="nobody").ls(str(restricted))
+        assert (restricted / "file.txt").read_bytes() == b"content"
+
+    def test_credentials_are_per_thread(self, restricted):
+        switched, done = threading.Event(), threading.Event()
+
+        def impersonate():
+            with credentials("nobody"):
+                switched.set()
+                done.wait()
+
+        thread = threading.Thread(target=impersonate)
+        thread.start()
+        switched.wait()
+        try:
+            assert (restricted / "file.txt").read_bytes() == b"content"
+        finally:
+            done.set()
+            thread.join()
+
+    def test_unknown_user(self, restricted):
+        with pytest.raises(PermissionError) as ex:
+            FsuidBackend(username="unknown-user").ls(str(restricted))
+        assert str(ex.value) == "unknown user"
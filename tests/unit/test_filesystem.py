@@ -1,16 +1,38 @@
+import gzip
 import io
+import os
 import stat
 import subprocess
+import sys
+import tarfile
+import zipfile
+from dataclasses import asdict
 
 import pytest
 from flask import Flask
+from werkzeug.datastructures import FileStorage
 
-from src.api.filesystem import FilesystemAPI
+from src.api.backends import CrossDeviceLinkError
+from src.api.filesystem import UPLOAD_BUFFER_SIZE, FilesystemAPI
+from src.api.listings import ListingCache
+
+
+def find_output(*entries):
+    """Output of find for the /tmp directory and entries of name, size
+    and mtime."""
+    records = [("d", 4096, 755, "root", 1, "", "tmp")]
+    records += [
+        ("f", size, 644, "test", mtime, "", name) for name, size, mtime in entries
+    ]
+    return "".join(f"{field}\0" for record in records for field in record).encode()
 
 
 @pytest.fixture(scope="class")
 def api():
-    return FilesystemAPI(username="test")
+    api = FilesystemAPI(username="test")
+    # listings of mocked commands are not to be cached
+    api.listings = ListingCache(maxsize=0)
+    return api
 
 
 class TestFilesystemAPI:
@@ -24,6 +46,26 @@ class TestFilesystemAPI:
         mocker.patch("src.utils.shell", return_value="file.txt")
         assert api.ls(path="/tmp/") == ["file.txt"]
 
+    @pytest.mark.skipif(
+        not sys.platform.startswith("linux"), reason="inotify is only on linux"
+    )
+    def test_cached_listing_is_not_stated(self, tmp_path, mocker):
+        (tmp_path / "file.txt").write_bytes(b"content")
+        api = FilesystemAPI(backend="fsuid")
+        api.listings = ListingCache()
+        mock = mocker.spy(api.backend, "stat")
+        stats, names = api.listing(path=str(tmp_path))
+        assert api.listing(path=str(tmp_path)) == (stats, names)
+        assert names == ["file.txt"]
+        mock.assert_called_once_with(str(tmp_path))
+
+    def test_paths_are_single_arguments(self, api, mocker):
+        popen = mocker.patch("subprocess.Popen")
+        popen.return_value.communicate.return_value = ("", "")
+        popen.return_value.returncode = 0
+        api.delete_file(path="/tmp/a b -rf /")
+        assert popen.call_args[0][0] == ["sudo", "-u", "test", "rm", "/tmp/a b -rf /"]
+
     def test_ls_on_restricted_path_raises_exception(self, api, mocker):
         stderr = "/tmp/root/: Permission denied"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
@@ -48,22 +90,156 @@ class TestFilesystemAPI:
             assert api.ls(path="/tmp/error")
         assert str(ex.value) == stderr
 
+    def test_valid_detailed_ls(self, api, mocker):
+        output = (
+            b"d\x004096\x00755\x00root\x001.5\x00\x00tmp\x00"
+            b"f\x007\x00644\x00test\x001666000000.5\x00\x00b.txt\x00"
+            b"l\x005\x00777\x00test\x001.0\x00b.txt\x00a"
+        )
+        mock = mocker.patch(
+            "src.utils.stream", return_value=iter([output[:30], output[30:], b"\x00"])
+        )
+        entries = api.ls(path="/tmp", details=True)
+        assert [asdict(entry) for entry in entries] == [
+            {
+                "name": "a",
+                "type": "symlink",
+                "size": 5,
+                "mode": 0o777,
+                "owner": "test",
+                "mtime": 1.0,
+                "target": "b.txt",
+            },
+            {
+                "name": "b.txt",
+                "type": "file",
+                "size": 7,
+                "mode": 0o644,
+                "owner": "test",
+                "mtime": 1666000000.5,
+                "target": None,
+            },
+        ]
+        mock.assert_called_once_with(
+            "find -H /tmp -maxdepth 1 -printf '%y\\0%s\\0%m\\0%u\\0%T@\\0%l\\0%f\\0'",
+            user="test",
+        )
+
+    def test_detailed_ls_on_missing_file_raises_exception(self, api, mocker):
+        stderr = "find: '/tmp/missing': No such file or directory"
+        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
+        mocker.patch("src.utils.stream", side_effect=err)
+        with pytest.raises(FileNotFoundError) as ex:
+            api.ls(path="/tmp/missing", details=True)
+        assert str(ex.value) == "no such file or directory"
+
+    @pytest.mark.parametrize(
+        "sort, names",
+        [
+            ("name", ["a", "b", "c", "d"]),
+            ("-name", ["d", "c", "b", "a"]),
+            ("size", ["c", "a", "b", "d"]),
+            ("-mtime", ["a", "d", "b", "c"]),
+        ],
+    )
+    def test_paginated_ls(self, api, mocker, sort, names):
+        output = find_output(("b", 2, 5), ("d", 3, 5), ("a", 2, 6), ("c", 1, 1))
+        mocker.patch("src.utils.stream", side_effect=lambda *_, **__: iter([output]))
+        entries, cursor = api.page(path="/tmp", limit=3, sort=sort)
+        assert [entry.name for entry in entries] == names[:3]
+        entries, cursor = api.page(path="/tmp", limit=3, cursor=cursor, sort=sort)
+        assert [entry.name for entry in entries] == names[3:]
+        assert cursor is None
+        entries, cursor = api.page(path="/tmp", sort=sort)
+        assert [entry.name for entry in entries] == names
+        assert cursor is None
+
+    def test_invalid_paginated_ls_raises_exception(self, api, mocker):
+        output = find_output(("a", 1, 1), ("b", 1, 1))
+        mocker.patch("src.utils.stream", side_effect=lambda *_, **__: iter([output]))
+        with pytest.raises(ValueError) as ex:
+            api.page(path="/tmp", sort="owner")
+        assert str(ex.value) == "unsupported sort key"
+        with pytest.raises(ValueError) as ex:
+            api.page(path="/tmp", limit=0)
+        assert str(ex.value) == "invalid limit"
+        with pytest.raises(ValueError) as ex:
+            api.page(path="/tmp", cursor="invalid")
+        assert str(ex.value) == "invalid cursor"
+        _, cursor = api.page(path="/tmp", limit=1, sort="size")
+        with pytest.raises(ValueError) as ex:
+            api.page(path="/tmp", cursor=cursor, sort="name")
+        assert str(ex.value) == "invalid cursor"
+
+    def test_valid_stat(self, api, mocker):
+        mocker.patch("src.utils.shell", return_value="81a4:7:12:1666000000")
+        stats = api.stat(path="/tmp/file.txt")
+        assert stats.mode == stat.S_IFREG | 0o644
+        assert stats.size == 7
+        assert stats.ino == 12
+        assert stats.mtime == 1666000000
+
+    def test_valid_file_read(self, api, mocker):
+        mock = mocker.patch("src.utils.stream", return_value=iter([b"content"]))
+        assert b"".join(api.read(path="/tmp/file.txt")) == b"content"
+        mock.assert_called_once_with("cat /tmp/file.txt", user="test")
+
+    def test_valid_file_range_read(self, api, mocker):
+        mock = mocker.patch("src.utils.stream", return_value=iter([b"tent"]))
+        assert b"".join(api.read(path="/tmp/file.txt", offset=3)) == b"tent"
+        mock.assert_called_once_with(
+            "dd if=/tmp/file.txt bs=65536 skip=3 iflag=skip_bytes,count_bytes "
+            "status=none",
+            user="test",
+        )
+
     def test_valid_file_attachment(self, api, mocker):
-        mocker.patch("src.utils.shell", return_value=b"content")
+        mocker.patch("src.utils.stream", return_value=iter([b"con", b"tent"]))
+        name, content = api.attachment(path="/tmp/file.txt", mode=stat.S_IFREG)
+        assert name == "file.txt"
+        assert b"".join(content) == b"content"
+
+    def test_empty_file_attachment(self, api, mocker):
+        mocker.patch("src.utils.stream", return_value=iter([]))
         name, content = api.attachment(path="/tmp/file.txt", mode=stat.S_IFREG)
         assert name == "file.txt"
-        assert content.read() == io.BytesIO(b"content").read()
+        assert b"".join(content) == b""
 
     def test_valid_directory_attachment(self, api, mocker):
-        mocker.patch("src.utils.shell", return_value=b"content")
+        mock = mocker.patch("src.utils.stream", return_value=iter([b"content"]))
         name, content = api.attachment(path="/tmp/dir/", mode=stat.S_IFDIR)
         assert name == "dir.tar.gz"
-        assert content.read() == io.BytesIO(b"content").read()
+        assert gzip.decompress(b"".join(content)) == b"content"
+        mock.assert_called_once_with("tar -cpf - -C /tmp --add-file=dir", user="test")
+
+    def test_uncompressed_directory_attachment(self, api, mocker):
+        mocker.patch("src.utils.stream", return_value=iter([b"content"]))
+        name, content = api.attachment(
+            path="/tmp/dir/", mode=stat.S_IFDIR, compression="none"
+        )
+        assert name == "dir.tar"
+        assert b"".join(content) == b"content"
+
+    def test_attachment_name(self, api):
+        assert api.attachment_name("/tmp/file.txt", mode=stat.S_IFREG) == "file.txt"
+        assert api.attachment_name("/tmp/dir/", mode=stat.S_IFDIR) == "dir.tar.gz"
+        assert (
+            api.attachment_name("/tmp/dir", mode=stat.S_IFDIR, compression="none")
+            == "dir.tar"
+        )
+
+    def test_invalid_compression_attachment_raises_exception(self, api):
+        with pytest.raises(ValueError) as ex:
+            api.attachment(path="/tmp/dir/", mode=stat.S_IFDIR, compression="xz")
+        assert str(ex.value) == "unsupported compression"
+        with pytest.raises(ValueError) as ex:
+            api.attachment(path="/tmp/dir/", mode=stat.S_IFDIR, level=10)
+        assert str(ex.value) == "unsupported compression level"
 
     def test_restricted_file_attachment_raises_exceptions(self, api, mocker):
         stderr = "Couldn't list extended attributes: Permission denied"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+        mocker.patch("src.utils.stream", side_effect=err)
         with pytest.raises(PermissionError) as ex:
             assert api.attachment(path="/tmp/file.txt", mode=stat.S_IFREG)
         assert str(ex.value) == "permission denied"
@@ -71,7 +247,7 @@ class TestFilesystemAPI:
     def test_restricted_directory_attachment_raises_exceptions(self, api, mocker):
         stderr = "Couldn't list extended attributes: Permission denied"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
+        mocker.patch("src.utils.stream", side_effect=err)
         with pytest.raises(PermissionError) as ex:
             assert api.attachment(path="/tmp/dir/", mode=stat.S_IFDIR)
         assert str(ex.value) == "permission denied"
@@ -105,39 +281,90 @@ class TestFilesystemAPI:
             assert api.ls(path="/tmp/dir/")
         assert str(ex.value) == "some error occurred"
 
+    @staticmethod
+    def files(*names):
+        return [FileStorage(io.BytesIO(b"text"), filename=name) for name in names]
+
     def test_valid_file_upload(self, api, mocker):
-        mocker.patch("src.utils.shell")
-        file = mocker.MagicMock(filename="file.txt")
-        api.upload_files(path="/tmp/dir/", files=[])
-        api.upload_files(path="/tmp/dir/", files=[file])
+        shell = mocker.patch("src.utils.shell")
+        feed = mocker.patch("src.utils.feed")
+        assert api.upload_stream(path="/tmp/dir/", files=[]) == ([], {})
+        files = self.files("file.txt")
+        assert api.upload_stream(path="/tmp/dir/", files=files) == (["file.txt"], {})
+        # created exclusively and written in place, with no other command run
+        assert [call[1]["cmd"] for call in feed.call_args_list] == [
+            "dd of=/tmp/dir/file.txt bs=65536 conv=excl status=none",
+            "dd of=/tmp/dir/file.txt bs=65536 conv=nocreat status=none",
+        ]
+        shell.assert_not_called()
 
     def test_existing_file_upload_raises_exception(self, api, mocker):
-        mocker.patch("src.utils.shell", return_value="file.txt")
-        file = mocker.MagicMock(filename="file.txt")
+        stderr = "dd: failed to open '/tmp/dir/file.txt': File exists"
+        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
+        shell = mocker.patch("src.utils.shell")
+        mocker.patch("src.utils.feed", side_effect=err)
+        files = self.files("file.txt")
         with pytest.raises(FileExistsError) as ex:
-            api.upload_files(path="/tmp/dir/", files=[file])
-        assert str(ex.value) == "file already exists"
+            api.upload_stream(path="/tmp/dir/", files=files)
+        assert str(ex.value) == "file exists"
+        # checked as the file is opened, with no listing of the directory,
+        # and left alone for not being created
+        shell.assert_not_called()
 
-    def test_wrong_directory_file_upload_raises_exception(self, api, mocker):
-        stderr = "/tmp/file.txt/: Not a directory"
+    def test_wrong_directory_file_upload_reports_error(self, api, mocker):
+        stderr = "dd: failed to open '/tmp/file.txt/file.txt': Not a directory"
         err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
-        mocker.patch("src.utils.shell", side_effect=err)
-        with pytest.raises(NotADirectoryError) as ex:
-            api.upload_files(path="/tmp/file.txt", files=[])
-        assert str(ex.value) == "not a directory"
+        mocker.patch("src.utils.shell")
+        mocker.patch("src.utils.feed", side_effect=err)
+        files = self.files("file.txt")
+        _, errors = api.upload_stream(path="/tmp/file.txt", files=files)
+        assert isinstance(errors["file.txt"], NotADirectoryError)
+        assert str(errors["file.txt"]) == "not a directory"
+
+    def test_parallel_file_upload_reports_errors(self, api, mocker):
+        def feed(cmd, file, **kwargs):
+            if "b.txt" in cmd:
+                stderr = "dd: failed to open '/tmp/dir/b.txt': Permission denied"
+                raise subprocess.CalledProcessError(1, cmd=cmd, stderr=stderr)
+
+        mocker.patch("src.utils.shell", return_value="")
+        mock = mocker.patch("src.utils.feed", side_effect=feed)
+        files = self.files("a.txt", "b.txt", "c")
+        _, errors = api.upload_stream(path="/tmp/dir/", files=files, workers=3)
+        assert list(errors) == ["b.txt"]
+        assert isinstance(errors["b.txt"], PermissionError)
+        cmds = [call[1]["cmd"] for call in mock.call_args_list]
+        assert "dd of=/tmp/dir/c bs=65536 conv=excl status=none" in cmds
+
+    def test_duplicate_file_upload_raises_exception(self, api, mocker):
+        shell = mocker.patch("src.utils.shell", return_value="")
+        mocker.patch("src.utils.feed")
+        files = self.files("file.txt", "file.txt")
+        with pytest.raises(ValueError) as ex:
+            api.upload_stream(path="/tmp/dir/", files=files)
+        assert str(ex.value) == "duplicate file names"
+        # the file written before is deleted along with the upload
+        shell.assert_called_once_with(
+            "rm /tmp/dir/file.txt", stdout=subprocess.DEVNULL, user="test"
+        )
 
     def test_valid_file_update(self, api, mocker):
-        mocker.patch("src.utils.shell", return_value="file.txt")
-        file = mocker.MagicMock(filename="file.txt")
-        api.upload_files(path="/tmp/dir/", files=[], update=True)
-        api.upload_files(path="/tmp/dir/", files=[file], update=True)
+        feed = mocker.patch("src.utils.feed")
+        files = self.files("file.txt")
+        assert api.upload_stream(path="/tmp/dir/", files=[], update=True) == ([], {})
+        _, errors = api.upload_stream(path="/tmp/dir/", files=files, update=True)
+        assert errors == {}
+        assert feed.call_args[1]["cmd"] == (
+            "dd of=/tmp/dir/file.txt bs=65536 conv=nocreat status=none"
+        )
 
-    def test_missing_file_update_raises_exception(self, api, mocker):
-        mocker.patch("src.utils.shell")
-        file = mocker.MagicMock(filename="file.txt")
-        with pytest.raises(FileNotFoundError) as ex:
-            api.upload_files(path="/tmp/dir/", files=[file], update=True)
-        assert str(ex.value) == "file does not exist"
+    def test_missing_file_update_reports_error(self, api, mocker):
+        stderr = "dd: failed to open '/tmp/dir/file.txt': No such file or directory"
+        err = subprocess.CalledProcessError(cmd="", returncode=1, stderr=stderr)
+        mocker.patch("src.utils.feed", side_effect=err)
+        files = self.files("file.txt")
+        _, errors = api.upload_stream(path="/tmp/dir/", files=files, update=True)
+        assert isinstance(errors["file.txt"], FileNotFoundError)
 
     def test_valid_file_delete(self, api, mocker):
         mocker.patch("src.utils.shell")
@@ -166,3 +393,257 @@ class TestFilesystemAPI:
         with pytest.raises(PermissionError) as ex:
             assert api.delete_file(path="/tmp/file.txt")
         assert str(ex.value) == "permission denied"
+
+
+class TestUploadStream:
+    @pytest.fixture()
+    def local_api(self):
+        # native operations with the credentials of the current process
+        api = FilesystemAPI(backend="fsuid")
+        api.listings = ListingCache(maxsize=0)
+        return api
+
+    @staticmethod
+    def files(**contents):
+        for name, content in contents.items():
+            yield FileStorage(io.BytesIO(content), filename=name)
+
+    def test_new_files_are_uploaded(self, local_api, tmp_path):
+        content = b"x" * (UPLOAD_BUFFER_SIZE + 1)
+        files = self.files(**{"a.txt": b"a", "b.txt": content})
+        filenames, errors = local_api.upload_stream(str(tmp_path), files, workers=2)
+        assert filenames == ["a.txt", "b.txt"]
+        assert errors == {}
+        assert sorted(os.listdir(tmp_path)) == ["a.txt", "b.txt"]
+        assert (tmp_path / "b.txt").read_bytes() == content
+
+    def test_failed_check_uploads_nothing(self, local_api, tmp_path):
+        (tmp_path / "b.txt").write_bytes(b"b")
+        files = self.files(**{"a.txt": b"a", "b.txt": b"new", "c.txt": b"c"})
+        with pytest.raises(FileExistsError):
+            local_api.upload_stream(str(tmp_path), files)
+        assert os.listdir(tmp_path) == ["b.txt"]
+        assert (tmp_path / "b.txt").read_bytes() == b"b"
+
+    def test_files_failing_halfway_are_deleted(self, local_api, tmp_path):
+        class FailingFile(io.BytesIO):
+            def read(self, size=-1):
+                data = super().read(size)
+                if not data:
+                    raise OSError("connection reset")
+                return data
+
+        content = b"x" * (UPLOAD_BUFFER_SIZE + 1)
+        files = [FileStorage(FailingFile(content), filename="a.txt")]
+        _, errors = local_api.upload_stream(str(tmp_path), files)
+        assert str(errors["a.txt"]) == "connection reset"
+        assert os.listdir(tmp_path) == []
+
+    def test_existing_files_are_kept_on_failure(self, local_api, tmp_path):
+        (tmp_path / "b.txt").write_bytes(b"precious")
+
+        class TruncatedFile(io.BytesIO):
+            def read(self, size=-1):
+                raise OSError("connection reset")
+
+        files = [
+            FileStorage(io.BytesIO(b"a"), filename="a.txt"),
+            FileStorage(TruncatedFile(), filename="b.txt"),
+        ]
+        with pytest.raises(OSError):
+            local_api.upload_stream(str(tmp_path), files)
+        assert os.listdir(tmp_path) == ["b.txt"]
+        assert (tmp_path / "b.txt").read_bytes() == b"precious"
+
+    def test_files_are_updated_in_place(self, local_api, tmp_path):
+        (tmp_path / "a.txt").write_bytes(b"a")
+        os.chmod(tmp_path / "a.txt", 0o640)
+        files = self.files(**{"a.txt": b"new"})
+        _, errors = local_api.upload_stream(str(tmp_path), files, update=True)
+        assert errors == {}
+        assert (tmp_path / "a.txt").read_bytes() == b"new"
+        assert stat.S_IMODE((tmp_path / "a.txt").stat().st_mode) == 0o640
+        files = self.files(**{"b.txt": b"b"})
+        _, errors = local_api.upload_stream(str(tmp_path), files, update=True)
+        assert isinstance(errors["b.txt"], FileNotFoundError)
+        assert not (tmp_path / "b.txt").exists()
+
+
+class TestBatch:
+    @pytest.fixture()
+    def local_api(self):
+        # native operations with the credentials of the current process
+        api = FilesystemAPI(backend="fsuid")
+        api.listings = ListingCache(maxsize=0)
+        return api
+
+    def test_outcomes_are_in_order(self, local_api, tmp_path):
+        (tmp_path / "file.txt").write_bytes(b"content")
+        operations = [
+            {"op": "mkdir", "path": f"{tmp_path}/dir"},
+            {"op": "stat", "path": f"{tmp_path}/file.txt"},
+            {"op": "delete", "path": f"{tmp_path}/file.txt"},
+            {"op": "ls", "path": f"{tmp_path}/missing"},
+        ]
+        outcomes = list(local_api.batch(operations, paths=[str(tmp_path)], workers=1))
+        assert outcomes[0] == (None, None)
+        assert outcomes[1][0].size == 7
+        assert outcomes[2] == (None, None)
+        assert isinstance(outcomes[3][1], FileNotFoundError)
+        assert os.listdir(tmp_path) == ["dir"]
+
+    def test_invalid_operations_fail_alone(self, local_api, tmp_path):
+        operations = [
+            {"op": "chmod", "path": str(tmp_path)},
+            {"op": "ls"},
+            {"op": "ls", "path": "/etc"},
+            "ls",
+            {"op": "ls", "path": str(tmp_path), "details": True},
+        ]
+        outcomes = list(local_api.batch(operations, paths=[str(tmp_path)], workers=4))
+        errors = [str(error) for _, error in outcomes[:4]]
+        assert errors == [
+            "unsupported operation",
+            "missing path",
+            "unsupported path",
+            "invalid operation",
+        ]
+        assert outcomes[4] == ([], None)
+
+
+class TestArchive:
+    @pytest.fixture()
+    def local_api(self):
+        # native operations with the credentials of the current process
+        return FilesystemAPI(backend="fsuid")
+
+    @pytest.fixture()
+    def paths(self, tmp_path):
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "a.txt").write_bytes(b"a")
+        (tmp_path / "b.txt").write_bytes(b"b")
+        return [f"{tmp_path}/dir", f"{tmp_path}/b.txt"]
+
+    def test_tar(self, local_api, paths):
+        name, content = local_api.archive(paths, compression="gzip")
+        assert name == "archive.tar.gz"
+        with tarfile.open(
+            fileobj=io.BytesIO(gzip.decompress(b"".join(content)))
+        ) as tar:
+            assert tar.getnames() == ["dir", "dir/a.txt", "b.txt"]
+        name, content = local_api.archive(paths, compression="none")
+        assert name == "archive.tar"
+        with tarfile.open(fileobj=io.BytesIO(b"".join(content))) as tar:
+            assert tar.getnames() == ["dir", "dir/a.txt", "b.txt"]
+
+    def test_zip(self, local_api, paths):
+        name, content = local_api.archive(paths, format="zip")
+        assert name == "archive.zip"
+        with zipfile.ZipFile(io.BytesIO(b"".join(content))) as zf:
+            assert zf.namelist() == ["dir/", "dir/a.txt", "b.txt"]
+            assert zf.read("b.txt") == b"b"
+
+    def test_invalid_archives(self, local_api, paths, tmp_path):
+        invalid = [
+            ({"paths": []}, "missing paths"),
+            ({"paths": paths, "format": "rar"}, "unsupported archive format"),
+            ({"paths": paths, "compression": "xz"}, "unsupported compression"),
+            ({"paths": paths, "level": 10}, "unsupported compression level"),
+            ({"paths": [*paths, f"{tmp_path}/dir/b.txt"]}, "duplicate file names"),
+        ]
+        for kwargs, message in invalid:
+            with pytest.raises(ValueError) as ex:
+                local_api.archive(**kwargs)
+            assert str(ex.value) == message
+        with pytest.raises(FileNotFoundError):
+            local_api.archive([f"{tmp_path}/missing"])
+
+
+class TestCopyAndMove:
+    @pytest.fixture()
+    def local_api(self):
+        # native operations with the credentials of the current process
+        return FilesystemAPI(backend="fsuid")
+
+    @pytest.fixture()
+    def tree(self, tmp_path):
+        (tmp_path / "dir").mkdir()
+        (tmp_path / "dir" / "a.txt").write_bytes(b"a")
+        (tmp_path / "b.txt").write_bytes(b"b")
+        return tmp_path
+
+    def test_copy(self, local_api, tree):
+        local_api.copy(f"{tree}/b.txt", f"{tree}/dir/b.txt")
+        assert (tree / "dir" / "b.txt").read_bytes() == b"b"
+        assert (tree / "b.txt").read_bytes() == b"b"
+
+    def test_copy_to_existing_file_leaves_nothing(self, local_api, tree):
+        with pytest.raises(FileExistsError):
+            local_api.copy(f"{tree}/b.txt", f"{tree}/dir/a.txt")
+        assert os.listdir(tree / "dir") == ["a.txt"]
+        assert (tree / "dir" / "a.txt").read_bytes() == b"a"
+        with pytest.raises(ValueError) as ex:
+            local_api.copy(f"{tree}/dir", f"{tree}/copy")
+        assert str(ex.value) == "unsupported file mode"
+
+    def test_move(self, local_api, tree):
+        local_api.move(f"{tree}/b.txt", f"{tree}/dir/b.txt")
+        assert sorted(os.listdir(tree / "dir")) == ["a.txt", "b.txt"]
+        local_api.move(f"{tree}/dir", f"{tree}/moved")
+        assert os.listdir(tree) == ["moved"]
+        (tree / "b.txt").write_bytes(b"b")
+        for src, dst in (("b.txt", "moved/a.txt"), ("moved", "b.txt")):
+            with pytest.raises(FileExistsError):
+                local_api.move(f"{tree}/{src}", f"{tree}/{dst}")
+        assert (tree / "moved" / "a.txt").read_bytes() == b"a"
+
+    def test_move_across_filesystems_copies(self, local_api, tree, mocker):
+        rename = local_api.backend.rename
+
+        def cross_device(src, dst, replace=True):
+            if src.endswith("b.txt"):
+                raise CrossDeviceLinkError("invalid cross-device link")
+            rename(src, dst, replace=replace)
+
+        mocker.patch.object(local_api.backend, "rename", side_effect=cross_device)
+        local_api.move(f"{tree}/b.txt", f"{tree}/dir/b.txt")
+        assert sorted(os.listdir(tree)) == ["dir"]
+        assert (tree / "dir" / "b.txt").read_bytes() == b"b"
+
+
+class TestWriteRange:
+    @pytest.fixture()
+    def local_api(self):
+        # native operations with the credentials of the current process
+        return FilesystemAPI(backend="fsuid")
+
+    def test_write_range(self, local_api, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"0123456789")
+        local_api.write_range(str(path), io.BytesIO(b"abc"), offset=4, length=2)
+        assert path.read_bytes() == b"0123ab6789"
+        local_api.write_range(str(path), io.BytesIO(b"cd"), offset=10, length=2)
+        assert path.read_bytes() == b"0123ab6789cd"
+
+    def test_write_range_of_short_content(self, local_api, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"0123456789")
+        with pytest.raises(ValueError) as ex:
+            local_api.write_range(str(path), io.BytesIO(b"a"), offset=0, length=2)
+        assert str(ex.value) == "content shorter than its length"
+        with pytest.raises(FileNotFoundError):
+            local_api.write_range(
+                str(tmp_path / "new.txt"), io.BytesIO(b""), offset=0, length=0
+            )
+        assert os.listdir(tmp_path) == ["file.txt"]
+
+    def test_append(self, local_api, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"0123")
+        with open(path, "ab") as other:
+            # written by someone else after the file was last looked at
+            other.write(b"45")
+        local_api.append(str(path), io.BytesIO(b"abc"), length=2)
+        assert path.read_bytes() == b"012345ab"
+        with pytest.raises(FileNotFoundError):
+            local_api.append(str(tmp_path / "new.txt"), io.BytesIO(b"x"), length=1)
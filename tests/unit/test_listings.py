@@ -0,0 +1,124 @@
+import os
+import sys
+
+import pytest
+
+from src.api.listings import ListingCache
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is only on linux"
+)
+
+
+class Loader:
+    """Count the listings actually loaded."""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return sorted(os.listdir(self.path))
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    directory = tmp_path / "dir"
+    (directory / "sub").mkdir(parents=True)
+    (directory / "file.txt").write_bytes(b"content")
+    return directory
+
+
+class TestListingCache:
+    def test_listing_is_cached(self, tree):
+        cache = ListingCache()
+        load = Loader(tree)
+        assert cache.fetch("user", str(tree), load) == ["file.txt", "sub"]
+        assert cache.fetch("user", str(tree), load) == ["file.txt", "sub"]
+        assert load.calls == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert len(cache) == 1
+
+    def test_listings_are_per_user(self, tree):
+        cache = ListingCache()
+        load = Loader(tree)
+        cache.fetch("user", str(tree), load)
+        cache.fetch("other", str(tree), load)
+        assert load.calls == 2
+
+    @pytest.mark.parametrize(
+        "change",
+        [
+            lambda tree: (tree / "new.txt").write_bytes(b""),
+            lambda tree: (tree / "file.txt").unlink(),
+            lambda tree: (tree / "file.txt").rename(tree / "renamed.txt"),
+            lambda tree: os.chmod(tree, 0o700),
+            lambda tree: os.chmod(tree.parent, 0o700),
+            lambda tree: tree.rename(tree.parent / "moved"),
+        ],
+    )
+    def test_changes_invalidate_listing(self, tree, change):
+        cache = ListingCache()
+        load = Loader(tree)
+        cache.fetch("user", str(tree), load)
+        change(tree)
+        if tree.exists():
+            cache.fetch("user", str(tree), load)
+            assert load.calls == 2
+        else:
+            with pytest.raises(FileNotFoundError):
+                cache.fetch("user", str(tree), load)
+        assert len(cache) == (1 if tree.exists() else 0)
+
+    def test_kinds_are_cached_apart(self, tree):
+        cache = ListingCache()
+        load = Loader(tree)
+        cache.fetch("user", str(tree), load)
+        assert cache.fetch("user", str(tree), lambda: "other", kind="other") == "other"
+        assert load.calls == 1
+        assert len(cache) == 2
+        (tree / "new.txt").write_bytes(b"")
+        cache.fetch("user", str(tree), load)
+        assert len(cache) == 1
+
+    def test_change_while_listing_is_not_cached(self, tree):
+        cache = ListingCache()
+
+        def load():
+            names = sorted(os.listdir(tree))
+            (tree / "new.txt").write_bytes(b"")
+            return names
+
+        assert cache.fetch("user", str(tree), load) == ["file.txt", "sub"]
+        assert len(cache) == 0
+
+    def test_files_are_not_cached(self, tree):
+        cache = ListingCache()
+        path = str(tree / "file.txt")
+        cache.fetch("user", path, lambda: [path])
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self, tree):
+        cache = ListingCache(maxsize=1)
+        cache.fetch("user", str(tree), Loader(tree))
+        cache.fetch("user", str(tree / "sub"), Loader(tree / "sub"))
+        assert len(cache) == 1
+        load = Loader(tree)
+        cache.fetch("user", str(tree), load)
+        assert load.calls == 1
+
+    def test_watches_are_released(self, tree):
+        cache = ListingCache(maxsize=1)
+        cache.fetch("user", str(tree / "sub"), Loader(tree / "sub"))
+        assert str(tree / "sub") in cache._paths
+        cache.fetch("user", str(tree), Loader(tree))
+        assert str(tree / "sub") not in cache._paths
+        assert str(tree) in cache._paths
+
+    def test_disabled_cache(self, tree):
+        cache = ListingCache(maxsize=0)
+        load = Loader(tree)
+        cache.fetch("user", str(tree), load)
+        cache.fetch("user", str(tree), load)
+        assert load.calls == 2
@@ -0,0 +1,94 @@
+import io
+import json
+import os
+
+import pytest
+
+from src.utils import metrics
+from src.utils.metrics import Counter, Gauge, Histogram, Registry
+
+
+@pytest.fixture()
+def registry():
+    registry = Registry()
+    registry.register(Counter("requests_total", "Requests.", labels=("method",)))
+    registry.register(Gauge("in_flight", "In flight."))
+    registry.register(Histogram("duration_seconds", "Duration.", buckets=(0.1, 1)))
+    return registry
+
+
+class TestMetrics:
+    def test_render(self, registry):
+        counter, gauge, histogram = registry.metrics
+        counter.inc("GET")
+        counter.inc("GET", amount=2)
+        counter.inc('P"UT')
+        gauge.inc()
+        gauge.dec()
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        assert registry.render().splitlines() == [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{method="GET"} 3',
+            'requests_total{method="P\\"UT"} 1',
+            "# HELP in_flight In flight.",
+            "# TYPE in_flight gauge",
+            "in_flight 0",
+            "# HELP duration_seconds Duration.",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{le="0.1"} 1',
+            'duration_seconds_bucket{le="1"} 2',
+            'duration_seconds_bucket{le="+Inf"} 3',
+            "duration_seconds_sum 5.55",
+            "duration_seconds_count 3",
+        ]
+
+    def test_aggregation_across_processes(self, registry, tmp_path):
+        counter, gauge, histogram = registry.metrics
+        registry.configure(directory=str(tmp_path / "metrics"))
+        counter.inc("GET")
+        gauge.inc()
+        histogram.observe(0.5)
+        # a process that exited, whose gauges no longer count
+        dead = {
+            "requests_total": [[["GET"], 2], [["PUT"], 1]],
+            "in_flight": [[[], 4]],
+            "duration_seconds": [[[], [1, 0, 0, 0.05, 1]]],
+        }
+        with open(tmp_path / "metrics" / "999999999.json", "w") as f:
+            json.dump(dead, f)
+
+        lines = registry.render().splitlines()
+        assert 'requests_total{method="GET"} 3' in lines
+        assert 'requests_total{method="PUT"} 1' in lines
+        assert "in_flight 1" in lines
+        assert 'duration_seconds_bucket{le="1"} 2' in lines
+        assert "duration_seconds_count 2" in lines
+        assert f"{os.getpid()}.json" in os.listdir(tmp_path / "metrics")
+
+    def test_timed(self, registry):
+        histogram = registry.metrics[2]
+        with pytest.raises(ValueError), metrics.timed(histogram):
+            raise ValueError()
+        assert histogram.values[()][-1] == 1
+
+    def test_middleware(self):
+        def app(environ, start_response):
+            environ["wsgi.input"].read()
+            start_response("200 OK", [("Content-Length", "4")])
+            return [b"te", b"xt"]
+
+        received = metrics.received_bytes.values.get((), 0)
+        sent = metrics.sent_bytes.values.get((), 0)
+        in_flight = metrics.requests_in_flight.values.get(("PUT",), 0)
+        environ = {"REQUEST_METHOD": "PUT", "wsgi.input": io.BytesIO(b"abc")}
+        response = metrics.middleware(app)(environ, lambda *args: None)
+        assert metrics.requests_in_flight.values[("PUT",)] == in_flight + 1
+        assert b"".join(response) == b"text"
+        response.close()
+        assert metrics.requests_in_flight.values[("PUT",)] == in_flight
+        assert metrics.request_duration.values[("", "PUT", "200")][-1] >= 1
+        assert metrics.received_bytes.values[()] == received + 3
+        assert metrics.sent_bytes.values[()] == sent + 4
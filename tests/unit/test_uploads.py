@@ -0,0 +1,174 @@
+import io
+import os
+import stat
+import time
+
+import pytest
+
+from src.api.listings import ListingCache
+from src.api.uploads import UploadsAPI
+
+
+@pytest.fixture()
+def api():
+    # native operations with the credentials of the current process
+    api = UploadsAPI(backend="fsuid")
+    api.listings = ListingCache(maxsize=0)
+    return api
+
+
+def create(api, path, size, chunk_size=4, update=False):
+    session_id, _ = api.create(
+        path=str(path), size=size, chunk_size=chunk_size, update=update, secret_key="k"
+    )
+    return api.session(session_id, secret_key="k")
+
+
+class TestUploadsAPI:
+    def test_chunks_are_assembled_on_commit(self, api, tmp_path):
+        session = create(api, tmp_path / "file.txt", size=10)
+        assert session.chunks == 3
+        api.write_chunk(session, 2, io.BytesIO(b"89"))
+        api.write_chunk(session, 0, io.BytesIO(b"0123"))
+        assert api.received(session) == [[0, 4], [8, 10]]
+        assert not (tmp_path / "file.txt").exists()
+        with pytest.raises(ValueError) as ex:
+            api.commit(session)
+        assert str(ex.value) == "missing chunks"
+
+        api.write_chunk(session, 1, io.BytesIO(b"4567"))
+        assert api.received(session) == [[0, 10]]
+        api.commit(session)
+        assert (tmp_path / "file.txt").read_bytes() == b"0123456789"
+        assert os.listdir(tmp_path) == ["file.txt"]
+
+    def test_empty_file(self, api, tmp_path):
+        session = create(api, tmp_path / "file.txt", size=0)
+        api.commit(session)
+        assert (tmp_path / "file.txt").read_bytes() == b""
+
+    def test_chunk_of_wrong_size_is_not_received(self, api, tmp_path):
+        session = create(api, tmp_path / "file.txt", size=10)
+        for content in (b"012", b"01234"):
+            with pytest.raises(ValueError) as ex:
+                api.write_chunk(session, 0, io.BytesIO(content))
+            assert str(ex.value) == "chunk size does not match"
+        with pytest.raises(ValueError) as ex:
+            api.write_chunk(session, 3, io.BytesIO(b""))
+        assert str(ex.value) == "invalid chunk"
+        assert api.received(session) == []
+
+    def test_existence_rules(self, api, tmp_path):
+        (tmp_path / "file.txt").write_bytes(b"old")
+        with pytest.raises(FileExistsError):
+            create(api, tmp_path / "file.txt", size=1)
+        with pytest.raises(FileNotFoundError):
+            create(api, tmp_path / "new.txt", size=1, update=True)
+
+        # created meanwhile
+        session = create(api, tmp_path / "new.txt", size=1)
+        api.write_chunk(session, 0, io.BytesIO(b"x"))
+        (tmp_path / "new.txt").write_bytes(b"other")
+        with pytest.raises(FileExistsError):
+            api.commit(session)
+
+        session = create(api, tmp_path / "file.txt", size=3, update=True)
+        api.write_chunk(session, 0, io.BytesIO(b"new"))
+        (tmp_path / "file.txt").unlink()
+        with pytest.raises(FileNotFoundError):
+            api.commit(session)
+
+    def test_update_keeps_permissions(self, api, tmp_path):
+        (tmp_path / "file.txt").write_bytes(b"old content")
+        os.chmod(tmp_path / "file.txt", 0o640)
+        session = create(api, tmp_path / "file.txt", size=3, update=True)
+        api.write_chunk(session, 0, io.BytesIO(b"new"))
+        api.commit(session)
+        assert (tmp_path / "file.txt").read_bytes() == b"new"
+        assert stat.S_IMODE((tmp_path / "file.txt").stat().st_mode) == 0o640
+        assert os.listdir(tmp_path) == ["file.txt"]
+
+    def test_abort(self, api, tmp_path):
+        session = create(api, tmp_path / "file.txt", size=10)
+        api.write_chunk(session, 0, io.BytesIO(b"0123"))
+        api.abort(session)
+        assert os.listdir(tmp_path) == []
+        with pytest.raises(FileNotFoundError) as ex:
+            api.received(session)
+        assert str(ex.value) == "upload session does not exist"
+
+    @pytest.mark.parametrize("finish", ["commit", "abort"])
+    def test_chunk_of_finished_session_is_rejected(self, api, tmp_path, finish):
+        session = create(api, tmp_path / "file.txt", size=4)
+        api.write_chunk(session, 0, io.BytesIO(b"0123"))
+        getattr(api, finish)(session)
+        with pytest.raises(FileNotFoundError) as ex:
+            api.write_chunk(session, 0, io.BytesIO(b"0123"))
+        assert str(ex.value) == "upload session does not exist"
+        assert os.listdir(tmp_path) == (["file.txt"] if finish == "commit" else [])
+
+    def test_missing_secret_key_writes_nothing(self, api, tmp_path):
+        with pytest.raises(RuntimeError):
+            api.create(
+                path=str(tmp_path / "file.txt"), size=1, chunk_size=1, secret_key=None
+            )
+        assert os.listdir(tmp_path) == []
+
+    def test_abandoned_sessions_are_swept(self, api, tmp_path):
+        abandoned = create(api, tmp_path / "a.txt", size=1)
+        ongoing = create(api, tmp_path / "b.txt", size=1)
+        (tmp_path / ".other").write_bytes(b"")
+        past = time.time() - 120
+        for path in (abandoned.temp, abandoned.received_map, tmp_path / ".other"):
+            os.utime(path, (past, past))
+        session_id, _ = api.create(
+            path=str(tmp_path / "c.txt"), size=1, chunk_size=1, secret_key="k", ttl=60
+        )
+        assert not os.path.exists(abandoned.temp)
+        assert not os.path.exists(abandoned.received_map)
+        assert os.path.exists(ongoing.temp) and os.path.exists(ongoing.received_map)
+        assert (tmp_path / ".other").exists()
+
+    def test_expired_session_can_be_aborted(self, api, tmp_path):
+        session_id, _ = api.create(
+            path=str(tmp_path / "file.txt"), size=1, chunk_size=1, secret_key="k", ttl=0
+        )
+        with pytest.raises(FileNotFoundError):
+            api.session(session_id, secret_key="k")
+        session = api.session(session_id, secret_key="k", expired=True)
+        api.abort(session)
+        assert os.listdir(tmp_path) == []
+
+    def test_invalid_sessions(self, api, tmp_path):
+        session_id, session = api.create(
+            path=str(tmp_path / "file.txt"), size=1, chunk_size=1, secret_key="k"
+        )
+        with pytest.raises(FileNotFoundError):
+            api.session(session_id, secret_key="other")
+        with pytest.raises(FileNotFoundError):
+            api.session("invalid", secret_key="k")
+        with pytest.raises(PermissionError):
+            UploadsAPI(username="other").session(session_id, secret_key="k")
+
+        session_id, _ = api.create(
+            path=str(tmp_path / "file.txt"), size=1, chunk_size=1, secret_key="k", ttl=0
+        )
+        with pytest.raises(FileNotFoundError):
+            api.session(session_id, secret_key="k")
+
+    def test_invalid_properties(self, api, tmp_path):
+        with pytest.raises(ValueError) as ex:
+            create(api, tmp_path / "a file.txt", size=1)
+        assert str(ex.value) == "unsupported file name"
+        with pytest.raises(ValueError):
+            create(api, tmp_path / "file.txt", size=-1)
+        with pytest.raises(ValueError):
+            create(api, tmp_path / "file.txt", size=1, chunk_size=0)
+
+    def test_chunk_at(self, api, tmp_path):
+        session = create(api, tmp_path / "file.txt", size=10)
+        assert session.chunk_at(4, 8) == 1
+        assert session.chunk_at(8, 10) == 2
+        for start, stop in ((4, 6), (2, 6), (8, 12)):
+            with pytest.raises(ValueError):
+                session.chunk_at(start, stop)
@@ -1,16 +1,34 @@
+import gzip
+import io
 import stat
 import subprocess
+import tarfile
+import zipfile
 from dataclasses import asdict
+from datetime import datetime, timezone
 
 import pytest
+from werkzeug.http import parse_range_header
 
+from src.api.backends.base import Stat
 from src.utils import (
     normpath,
     shell,
-    file_mode,
+    stream,
+    feed,
+    ChunksFile,
+    multipart,
+    archives,
+    send_stream,
+    compress,
+    byte_ranges,
+    etag,
+    last_modified,
+    mimetype,
     isfile,
     isdir,
     http_response,
+    timing,
 )
 
 
@@ -38,15 +56,204 @@ def test_shell(mocker):
     assert ex.value.stderr == "error"
 
 
-def test_file_type():
-    assert file_mode(None) is None
-    assert file_mode("") is None
-    assert file_mode("-") == stat.S_IFREG
-    assert file_mode("-rwx") == stat.S_IFREG
-    assert file_mode("-rwxr--r--") == stat.S_IFREG
-    assert file_mode("drwxr--r--") == stat.S_IFDIR
-    assert file_mode("drwxr--r-- ...") == stat.S_IFDIR
-    assert file_mode("prwxr--r--") == 0
+def test_stream(mocker):
+    mock = mocker.patch("subprocess.Popen").return_value
+    mock.configure_mock(
+        **{
+            "stdout.read1.side_effect": [b"file", b".txt", b""],
+            "stderr.read.return_value": b"",
+            "wait.return_value": 0,
+            "poll.return_value": 0,
+        }
+    )
+    assert list(stream("cat file.txt")) == [b"file", b".txt"]
+
+    mock.configure_mock(
+        **{
+            "stdout.read1.side_effect": [b""],
+            "stderr.read.return_value": b"error",
+            "wait.return_value": 1,
+            "returncode": 1,
+        }
+    )
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        list(stream("cat file.txt"))
+    assert ex.value.returncode == 1
+    assert ex.value.stderr == "error"
+
+
+def test_stream_kills_abandoned_process(mocker):
+    mock = mocker.patch("subprocess.Popen").return_value
+    mock.configure_mock(
+        **{"stdout.read1.return_value": b"chunk", "poll.return_value": None}
+    )
+    chunks = stream("cat file.txt")
+    assert next(chunks) == b"chunk"
+    chunks.close()
+    mock.kill.assert_called_once()
+
+
+def test_stream_closes_pipes(mocker):
+    popen = mocker.spy(subprocess, "Popen")
+    assert list(stream("echo content")) == [b"content\n"]
+    process = popen.spy_return
+    assert process.stdout.closed and process.stderr.closed
+
+    chunks = stream("yes")
+    next(chunks)
+    chunks.close()
+    process = popen.spy_return
+    assert process.stdout.closed and process.stderr.closed
+
+
+def test_feed(tmp_path):
+    path = tmp_path / "file.txt"
+    feed(f"tee {path}", io.BytesIO(b"content" * 100000), chunk_size=1000)
+    assert path.read_bytes() == b"content" * 100000
+
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        feed(f"tee {tmp_path / 'missing' / 'file.txt'}", io.BytesIO(b"content"))
+    assert ex.value.returncode == 1
+    assert "No such file or directory" in ex.value.stderr
+
+
+def test_commands_are_timed(tmp_path):
+    timing.start()
+    shell("true")
+    list(stream("echo content"))
+    feed(f"tee {tmp_path / 'file.txt'}", io.BytesIO(b"content"))
+    phases = timing.current.get().phases
+    assert [name for name, _ in phases] == ["true", "echo", "tee"]
+    assert all(duration > 0 for _, duration in phases)
+    timing.current.set(None)
+
+
+def test_chunks_file():
+    chunks = iter([b"01", b"", b"2345", b"6"])
+    file = ChunksFile(chunks)
+    assert file.read(3) == b"012"
+    # no more chunks are taken than needed
+    assert next(chunks) == b"6"
+    assert file.read(0) == b""
+    assert file.read() == b"345"
+    assert file.read(1) == b""
+
+
+def test_multipart_parts():
+    body = (
+        b"--boundary\r\n"
+        b'Content-Disposition: form-data; name="field"\r\n\r\n'
+        b"value\r\n"
+        b"--boundary\r\n"
+        b'Content-Disposition: form-data; name="files"; filename="a.txt"\r\n'
+        b"Content-Type: text/plain\r\n\r\n" + b"a\r\n" * 10000 + b"\r\n"
+        b"--boundary\r\n"
+        b'Content-Disposition: form-data; name="files"; filename="b.txt"\r\n\r\n'
+        b"b\r\n"
+        b"--boundary--\r\n"
+    )
+    parts = multipart.parts(io.BytesIO(body), boundary="boundary", chunk_size=100)
+    part = next(parts)
+    assert (part.name, part.filename) == ("files", "a.txt")
+    assert part.headers["Content-Type"] == "text/plain"
+    assert part.read(3) == b"a\r\n"
+    # unread content is skipped
+    part = next(parts)
+    assert (part.name, part.filename) == ("files", "b.txt")
+    assert part.read() == b"b"
+    assert next(parts, None) is None
+
+    parts = multipart.parts(io.BytesIO(body[:-20]), boundary="boundary")
+    with pytest.raises(ValueError):
+        [part.read() for part in parts]
+
+
+def test_tar_to_zip():
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode="w") as tar:
+        for name, data in (("dir/a.txt", b"a" * 100000), ("b.txt", b"")):
+            info = tarfile.TarInfo(name)
+            info.size, info.mode, info.mtime = len(data), 0o640, 0
+            tar.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("link")
+        link.type, link.linkname = tarfile.SYMTYPE, "b.txt"
+        tar.addfile(link)
+
+    chunks = list(archives.tar_to_zip([content.getvalue()], level=9))
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.namelist() == ["dir/a.txt", "b.txt"]
+        assert zf.read("dir/a.txt") == b"a" * 100000
+        info = zf.getinfo("dir/a.txt")
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert info.compress_size < 1000
+        assert info.date_time == (1980, 1, 1, 0, 0, 0)
+        assert stat.S_IMODE(info.external_attr >> 16) == 0o640
+
+    chunks = list(archives.tar_to_zip([content.getvalue()], level=0))
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.getinfo("dir/a.txt").compress_type == zipfile.ZIP_STORED
+
+
+def test_send_stream():
+    response = send_stream(iter([b"content"]), filename="file.txt")
+    assert response.is_streamed
+    assert response.mimetype == "text/plain"
+    assert response.headers["Content-Disposition"] == "attachment; filename=file.txt"
+
+    response = send_stream(iter([]), filename="ficheiro-ç.bin")
+    assert response.mimetype == "application/octet-stream"
+    assert response.headers["Content-Disposition"] == (
+        "attachment; filename=ficheiro-c.bin; filename*=UTF-8''ficheiro-%C3%A7.bin"
+    )
+
+
+def test_compress():
+    chunks = [b"file", b".txt"] * 1000
+    assert gzip.decompress(b"".join(compress(iter(chunks)))) == b"".join(chunks)
+    assert gzip.decompress(b"".join(compress(iter([]), level=0))) == b""
+
+
+def test_byte_ranges():
+    assert byte_ranges(parse_range_header("bytes=0-4"), length=10) == [(0, 5)]
+    assert byte_ranges(parse_range_header("bytes=5-"), length=10) == [(5, 10)]
+    assert byte_ranges(parse_range_header("bytes=-3"), length=10) == [(7, 10)]
+    assert byte_ranges(parse_range_header("bytes=-30"), length=10) == [(0, 10)]
+    assert byte_ranges(parse_range_header("bytes=8-20"), length=10) == [(8, 10)]
+    assert byte_ranges(parse_range_header("bytes=0-1,4-5"), length=10) == [
+        (0, 2),
+        (4, 6),
+    ]
+    assert byte_ranges(parse_range_header("bytes=10-"), length=10) == []
+    assert byte_ranges(parse_range_header("bytes=0-1,20-"), length=10) == [(0, 2)]
+    assert byte_ranges(parse_range_header("bytes=-1"), length=0) == []
+    assert byte_ranges(parse_range_header("bytes=0-0,1-1,2-5,-2"), length=10) == [
+        (0, 6),
+        (8, 10),
+    ]
+    assert byte_ranges(parse_range_header("bytes=0-3,-8"), length=10) == [(0, 10)]
+
+
+def test_etag():
+    stats = Stat(mode=stat.S_IFREG, size=10, ino=255, mtime=1666000000.5)
+    assert etag(stats) == "ff-a-5eb37da39c120"
+    assert etag(Stat(mode=stat.S_IFREG, size=11, ino=255, mtime=1666000000.5)) != (
+        etag(stats)
+    )
+
+
+def test_last_modified():
+    stats = Stat(mode=stat.S_IFREG, size=10, ino=255, mtime=1666000000.5)
+    assert last_modified(stats) == datetime(
+        2022, 10, 17, 9, 46, 40, tzinfo=timezone.utc
+    )
+
+
+def test_mimetype():
+    assert mimetype("dir.tar") == "application/x-tar"
+    assert mimetype("dir.tar.gz") == "application/gzip"
+    assert mimetype("data.csv.xz") == "application/x-xz"
+    assert mimetype("file.txt") == "text/plain"
+    assert mimetype("file") == "application/octet-stream"
 
 
 def test_isfile():